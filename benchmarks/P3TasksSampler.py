@@ -1,7 +1,16 @@
+import os
 import random
 from typing import List
 
 from networkxternal.helpers import *
+from networkxternal.helpers.binary_edges import (
+    BINARY_SUFFIX,
+    write_edges_binary,
+    yield_edges_batches_from_binary,
+)
+from networkxternal.helpers.compression import strip_compression_suffix
+from networkxternal.helpers.edges_batch import unpack_edges
+from networkxternal.helpers.parsing import yield_edges_batches_from_file
 from pynum import sample_edges
 
 from P0Config import P0Config
@@ -33,13 +42,39 @@ class P3TasksSampler(object):
         return max(self.count_finds, self.count_analytics, self.count_changes)
 
     def sample_file(self, filename: str) -> int:
+        """
+        Samples are cached next to the dataset in the binary edges format,
+        so the same inputs are reused across runs without parsing the whole file.
+        """
         self.clear()
-        # C++ version is much faster.
-        # self._buffer_edges = pynum.sample_edges(
-        #     filename, self.number_of_needed_samples())
-        self._buffer_edges = sample_reservoir(
-            yield_edges_from_csv(filename), self.number_of_needed_samples()
+        count_needed = self.number_of_needed_samples()
+        cache_path = (
+            f"{strip_compression_suffix(filename)}.sample-{count_needed}{BINARY_SUFFIX}"
         )
+        samples = None
+        if os.path.exists(cache_path) and os.path.getmtime(
+            cache_path
+        ) >= os.path.getmtime(filename):
+            try:
+                samples = list(
+                    unpack_edges(yield_edges_batches_from_binary(cache_path))
+                )
+            except ValueError as e:
+                # Caches truncated or written in an older layout are sampled again.
+                print(e)
+        if samples is None:
+            # C++ version is much faster.
+            # samples = pynum.sample_edges(
+            #     filename, self.number_of_needed_samples())
+            samples = sample_reservoir(
+                unpack_edges(yield_edges_batches_from_file(filename)),
+                count_needed,
+            )
+            # Write into a temporary file, so an interrupted run is never reused.
+            partial_path = cache_path + ".partial"
+            write_edges_binary(samples, partial_path)
+            os.replace(partial_path, cache_path)
+        self._buffer_edges = samples
         self._split_samples_into_tasks()
         return len(self._buffer_edges)
 
@@ -1,10 +1,14 @@
 from abc import abstractmethod
-from typing import Sequence, Optional, Set
+from typing import Sequence, Optional, Set, Tuple
 
 from networkxternal.helpers.edge import Edge
 from networkxternal.helpers.node import Node
 from networkxternal.helpers.graph_degree import GraphDegree
-from networkxternal.helpers.algorithms import is_sequence_of, chunks
+from networkxternal.helpers.import_stats import ImportStats
+from networkxternal.helpers.algorithms import is_sequence_of
+from networkxternal.helpers.edges_batch import EdgesBatch, chunks_or_batches
+from networkxternal.helpers.pipeline import ImportPipeline
+from networkxternal.helpers.dedup import deduplicate_edges
 
 
 class BaseAPI(object):
@@ -34,12 +38,19 @@ class BaseAPI(object):
         directed=True,
         weighted=True,
         multigraph=True,
+        duplicates="keep_first",
         **kwargs,
     ):
         object.__init__(self)
         self.directed = directed
         self.weighted = weighted
         self.multigraph = multigraph
+        # How bulk imports collapse repeated edges, if it's not a `multigraph`.
+        self.duplicates = duplicates
+        # Throughput of the most recent bulk import, if the backend reports it.
+        self.last_import_stats = ImportStats()
+        # Progress of resumable imports, for backends without durable storage for it.
+        self.checkpoints = dict()
 
     # region Metadata
 
@@ -253,6 +264,13 @@ class BaseAPI(object):
         """
         return self.remove(self.edges_related(n))
 
+    def remove_nodes(self, vs) -> int:
+        """
+        Removes a group of nodes with all the edges containing them.
+        https://networkx.github.io/documentation/stable/reference/classes/generated/networkx.Graph.remove_nodes_from.html
+        """
+        return sum(map(self.remove_node, vs))
+
     def add_node(self, _id, **attrs) -> bool:
         """
         https://networkx.github.io/documentation/stable/reference/classes/generated/networkx.Graph.add_node.html
@@ -286,14 +304,65 @@ class BaseAPI(object):
         Imports data from adjacency list CSV file. Row shape: `(first, second, weight)`.
         Uses the `biggest_edge_id` to generate incremental IDs for new edges.
         Doesn't guarantee edge uniqueness (for 2 given nodes) as `upsert_bulk` does.
+        The stream may mix `Edge`s with columnar `EdgesBatch`es from vectorized parsers.
         """
         count_edges_added = 0
         chunk_len = type(self).__max_batch_size__
-        for es in chunks(stream, chunk_len):
-            count_edges_added += self.add(es, upsert=upsert)
+        for es in chunks_or_batches(self.unique_edges(stream), chunk_len):
+            if isinstance(es, EdgesBatch):
+                count_edges_added += self.add_batch(es, upsert=upsert)
+            else:
+                count_edges_added += self.add(es, upsert=upsert)
         self.add_missing_nodes()
         return count_edges_added
 
+    def add_stream_pipelined(self, stream, upsert=True, writers=4) -> int:
+        """
+        Same as `add_stream`, but overlaps parsing, batching and DB writes
+        in an `ImportPipeline`, reporting the throughput of every stage
+        in `last_import_stats`. Non-concurrent backends get a single writer.
+        """
+        if not type(self).__is_concurrent__:
+            writers = 1
+        pipeline = ImportPipeline(self, writers=writers, upsert=upsert)
+        count_edges_added = pipeline.run(self.unique_edges(stream))
+        self.add_missing_nodes()
+        self.last_import_stats = pipeline.stats
+        return count_edges_added
+
+    def add_batch(self, batch: EdgesBatch, upsert=True) -> int:
+        """
+        Imports a columnar `EdgesBatch`. Backends with a bulk interface
+        override it to skip the construction of individual `Edge` objects.
+        """
+        return self.add(batch.to_edges(type(self).__edge_type__), upsert=upsert)
+
+    def unique_edges(self, stream):
+        """
+        Unless it's a `multigraph`, collapses the edges with repeated members in
+        a bulk import stream with the `duplicates` policy: `keep_first`, `keep_last`
+        or `sum_weights`. Duplicates never reach the upsert machinery of the DB.
+        Only the stream itself is deduplicated, not against existing edges.
+        Individual `Edge`s are passed on as they are, with their payloads and types.
+        """
+        if self.multigraph:
+            return stream
+        return deduplicate_edges(stream, policy=self.duplicates)
+
+    def save_checkpoint(self, checkpoint):
+        """
+        Records the progress of one worker of `import_resumable`.
+        Persistent backends store it next to the graph, so it survives crashes.
+        """
+        self.checkpoints[(checkpoint.source, checkpoint.worker)] = checkpoint
+
+    def load_checkpoints(self, source: str) -> list:
+        return [c for (s, _), c in self.checkpoints.items() if s == source]
+
+    def clear_checkpoints(self, source: str):
+        for key in [k for k in self.checkpoints if k[0] == source]:
+            self.checkpoints.pop(key)
+
     @abstractmethod
     def clear(self):
         """
@@ -314,6 +383,29 @@ class BaseAPI(object):
 
     # region Helpers
 
+    def shape_edges_members(self, u, v) -> Tuple[str, dict]:
+        """
+        Classifies a lookup by `u` and `v` into one of the query shapes,
+        returning the shape name and the values of its parameters.
+        """
+        u = self.make_node_id(u)
+        v = self.make_node_id(v)
+        if u < 0 and v < 0:
+            return "all", {}
+        elif u < 0 or v < 0:
+            if not self.directed:
+                return "containing", {"n": max(u, v)}
+            elif u < 0:
+                return "to", {"v": v}
+            else:
+                return "from", {"u": u}
+        elif u == v:
+            return "containing", {"n": u}
+        elif self.directed:
+            return "between", {"u": u, "v": v}
+        else:
+            return "between_any", {"u": u, "v": v}
+
     def make_node_id(self, node_for_adding) -> int:
         if isinstance(node_for_adding, int):
             return node_for_adding
@@ -1,24 +1,28 @@
 from abc import abstractmethod
 from contextlib import contextmanager
-from typing import Sequence, Optional, Set
-import collections
+from typing import Iterable, List, Sequence, Optional, Set, Tuple
 import json
 
 import sqlalchemy as sa
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy import Column, Integer, BigInteger, Float, Boolean
 from sqlalchemy.sql import func
-from sqlalchemy import or_, and_
+from sqlalchemy import or_, and_, select, bindparam
 from sqlalchemy_utils import create_database, database_exists
 from sqlalchemy import text
 from sqlalchemy import Index
+from sqlalchemy.dialects import postgresql, sqlite, mysql
 
 from networkxternal.base_api import BaseAPI
 from networkxternal.helpers.node import Node
 from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, unpack_edges
 from networkxternal.helpers.graph_degree import GraphDegree
 from networkxternal.helpers.algorithms import is_sequence_of, chunks
+from networkxternal.helpers.streams import EDGE_COLUMNS, NODE_COLUMNS
+from networkxternal.helpers.replicas import ReplicaRouter
+from networkxternal.helpers.checkpoints import ImportCheckpoint
 
 DeclarativeSQL = declarative_base()
 
@@ -56,6 +60,17 @@ class EdgeSQL(DeclarativeSQL, Edge):
         Edge.__init__(self, *args, **kwargs)
 
 
+# Matches edges without known IDs in `BaseSQL.remove_edges`.
+# It's bound to a separate `MetaData`, so `create_all` doesn't persist it.
+RemovedEdgesSQL = sa.Table(
+    "removed_edges",
+    sa.MetaData(),
+    Column("first", BigInteger),
+    Column("second", BigInteger),
+    Column("is_directed", Boolean),
+    prefixes=["TEMPORARY"],
+)
+
 index_first = Index("index_first", EdgeSQL.first, unique=False)
 index_second = Index("index_second", EdgeSQL.second, unique=False)
 index_label = Index("index_label", EdgeSQL.label, unique=False)
@@ -82,6 +97,50 @@ class EdgeNewSQL(DeclarativeSQL, Edge):
         Edge.__init__(self, *args, **kwargs)
 
 
+class CheckpointSQL(DeclarativeSQL):
+    __tablename__ = "import_checkpoints"
+    source = Column(sa.String(512), primary_key=True)
+    worker = Column(Integer, primary_key=True)
+    batch = Column(BigInteger)
+    byte_offset = Column(BigInteger)
+    last_edge_id = Column(BigInteger)
+
+
+def payload_json_of(o) -> Optional[str]:
+    # Objects loaded by the ORM skip `__init__` and only have `payload_json`.
+    payload = getattr(o, "payload", None)
+    if payload:
+        return json.dumps(payload)
+    return getattr(o, "payload_json", None)
+
+
+def edge_row(e: Edge) -> tuple:
+    """Column values of an `Edge` in `main_edges` order, for DB-API `executemany`."""
+    return (
+        e._id,
+        e.first,
+        e.second,
+        bool(e.is_directed),
+        e.weight,
+        e.label,
+        payload_json_of(e),
+    )
+
+
+def node_row(n: Node) -> tuple:
+    """Column values of a `Node` in `main_nodes` order, for DB-API `executemany`."""
+    return (n._id, n.weight, n.label, payload_json_of(n))
+
+
+def unique_rows(rows: Iterable[tuple]) -> List[tuple]:
+    """
+    Keeps the last of the rows sharing the `_id` in the first column.
+    PostgreSQL refuses to affect the same row twice in one statement,
+    and MySQL doesn't define which of the duplicates wins.
+    """
+    return list({row[0]: row for row in rows}.values())
+
+
 class BaseSQL(BaseAPI):
     """
     A generic SQL-compatible wrapper for Graph-shaped data.
@@ -116,27 +175,79 @@ class BaseSQL(BaseAPI):
     in case of in-memory SQLite instance.
     Replacing it with `bulk_insert_mappings()` reduced import time by 70%!
     https://docs.sqlalchemy.org/en/13/faq/performance.html#result-fetching-slowness-core
+
+    CAUTION:
+    Building and compiling a query for every point lookup can take as long,
+    as the lookup itself. So the frequent queries are constructed once per shape
+    with bound parameters and cached in `statements`. SQLAlchemy then finds their
+    compiled form in the engine-wide cache, and repeated calls only bind values.
+    https://docs.sqlalchemy.org/en/20/core/connections.html#sql-compilation-caching
     """
 
     __is_concurrent__ = True
     __max_batch_size__ = 1000000
     __edge_type__ = EdgeSQL
     __in_memory__ = False
-
-    def __init__(self, url="sqlite:///:memory:", **kwargs):
+    # Longest list of values to pass into a single `IN (...)` filter.
+    # SQLite, for example, limits the number of bound parameters to 32'766.
+    __max_filter_size__ = 10000
+
+    def __init__(
+        self,
+        url="sqlite:///:memory:",
+        pool_size=None,
+        max_overflow=None,
+        pool_pre_ping=False,
+        pool_recycle=-1,
+        thread_local_sessions=False,
+        read_urls=(),
+        read_policy="round_robin",
+        read_your_writes_seconds=0,
+        **kwargs,
+    ):
+        """
+        The `pool_*` and `max_overflow` arguments configure the connection pool of the engine.
+        With `thread_local_sessions`, each thread reuses its own `Session` object,
+        instead of creating a new one for every call.
+        The `read_urls` point to the read replicas of the primary `url`.
+        Lookups and scans are spread across them, following the `read_policy`
+        of `ReplicaRouter`, while writes always go to the primary.
+        https://docs.sqlalchemy.org/en/20/core/pooling.html
+        https://docs.sqlalchemy.org/en/20/orm/contextual.html
+        """
         BaseAPI.__init__(self, **kwargs)
+        self.engine_options = dict(
+            pool_pre_ping=pool_pre_ping,
+            pool_recycle=pool_recycle,
+        )
+        if pool_size is not None:
+            self.engine_options["pool_size"] = pool_size
+        if max_overflow is not None:
+            self.engine_options["max_overflow"] = max_overflow
         # https://stackoverflow.com/a/51184173
         if not database_exists(url):
             create_database(url)
-        self.engine = sa.create_engine(url)
+        self.engine = self.make_engine(url)
         DeclarativeSQL.metadata.create_all(self.engine)
-        self.session_maker = sessionmaker(bind=self.engine)
+        self.session_maker = self.make_session_maker(self.engine, thread_local_sessions)
+        # Replicas are expected to already contain the schema.
+        self.read_engines = [self.make_engine(u) for u in read_urls]
+        self.read_session_makers = [
+            self.make_session_maker(e, thread_local_sessions) for e in self.read_engines
+        ]
+        self.replicas = ReplicaRouter(
+            len(self.read_engines),
+            policy=read_policy,
+            sticky_seconds=read_your_writes_seconds,
+        )
+        # Core statements with bound parameters, keyed by query shape.
+        self.statements = dict()
 
     # region Metadata
 
     def reduce_nodes(self) -> GraphDegree:
         result = (0, 0)
-        with self.get_session() as s:
+        with self.get_session(read_only=True) as s:
             result = s.query(
                 func.count(NodeSQL.weight).label("count"),
                 func.sum(NodeSQL.weight).label("sum"),
@@ -146,14 +257,9 @@ class BaseSQL(BaseAPI):
 
     def reduce_edges(self, u=None, v=None, key=None) -> GraphDegree:
         result = (0, 0)
-        with self.get_session() as s:
-            q = s.query(
-                func.count(EdgeSQL.weight).label("count"),
-                func.sum(EdgeSQL.weight).label("sum"),
-            )
-            q = self.filter_edges_members(q, u, v)
-            q = self.filter_edges_label(q, key)
-            result = q.first()
+        statement, params = self.statement_edges("reduce", u, v, key)
+        with self.get_session(read_only=True) as s:
+            result = s.execute(statement, params).first()
 
         return GraphDegree(*result)
 
@@ -173,19 +279,19 @@ class BaseSQL(BaseAPI):
 
     @property
     def nodes(self) -> Sequence[Node]:
-        with self.get_session() as s:
+        with self.get_session(read_only=True) as s:
             return s.query(NodeSQL).all()
         return []
 
     @property
     def edges(self) -> Sequence[Edge]:
-        with self.get_session() as s:
+        with self.get_session(read_only=True) as s:
             return s.query(EdgeSQL).all()
         return []
 
     @property
     def out_edges(self) -> Sequence[Edge]:
-        with self.get_session() as s:
+        with self.get_session(read_only=True) as s:
             return (
                 s.query(EdgeSQL).filter(EdgeSQL.is_directed == True).all()  # noqa: E712
             )  # noqa: E712
@@ -196,7 +302,7 @@ class BaseSQL(BaseAPI):
         with self.get_session() as s:
             all_from = s.query(EdgeSQL.first).distinct().all()
             all_to = s.query(EdgeSQL.second).distinct().all()
-            result = set(all_from).union(all_to)
+            result = {row[0] for row in all_from}.union(row[0] for row in all_to)
             return result
         return []
 
@@ -204,109 +310,151 @@ class BaseSQL(BaseAPI):
 
     def has_node(self, n) -> Optional[Node]:
         n = self.make_node_id(n)
-        with self.get_session() as s:
+        with self.get_session(read_only=True) as s:
             return s.query(NodeSQL).filter(NodeSQL._id == n).first()
         return None
 
     def has_edge(self, u, v, key=None) -> Sequence[Edge]:
-        with self.get_session() as s:
-            q = s.query(EdgeSQL)
-            q = self.filter_edges_members(q, u, v)
-            q = self.filter_edges_label(q, key)
-            return q.all()
+        statement, params = self.statement_edges("select", u, v, key)
+        with self.get_session(read_only=True) as s:
+            return s.scalars(statement, params).all()
         return []
 
+    def neighbors(self, n) -> Set[int]:
+        """
+        Only fetches the IDs of the opposite members, instead of full `EdgeSQL` rows:
+        `SELECT second WHERE first=? UNION SELECT first WHERE second=?`.
+        """
+        return self.related_ids("neighbors", n)
+
+    def successors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        return self.related_ids("successors", n)
+
+    def predecessors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        return self.related_ids("predecessors", n)
+
     def neighbors_of_group(self, vs: Sequence[int]) -> Set[int]:
+        vs = set(vs)
         result = set()
-        with self.get_session() as s:
-            edges = (
-                s.query(EdgeSQL)
-                .filter(
-                    or_(
-                        EdgeSQL.first.in_(vs),
-                        EdgeSQL.second.in_(vs),
-                    )
+        chunk_len = type(self).__max_filter_size__
+        with self.get_session(read_only=True) as s:
+            for part in chunks(list(vs), chunk_len):
+                task = sa.union(
+                    select(EdgeSQL.second).where(EdgeSQL.first.in_(part)),
+                    select(EdgeSQL.first).where(EdgeSQL.second.in_(part)),
                 )
-                .all()
-            )
-            for e in edges:
-                if e.first not in vs:
-                    result.add(e.first)
-                elif e.second not in vs:
-                    result.add(e.second)
-        return result
+                result.update(s.scalars(task))
+        return result.difference(vs)
 
     # region Random Writes
 
     def add(self, obj, upsert=True) -> int:
-        if isinstance(obj, DeclarativeSQL):
-            with self.get_session() as s:
-                s.merge(obj)
-            return 1
-
-        if not isinstance(obj, collections.Sequence):
+        """
+        Upserts are performed with a single dialect-native statement per batch:
+        `INSERT ... ON CONFLICT DO UPDATE` in PostgreSQL and SQLite, or
+        `INSERT ... ON DUPLICATE KEY UPDATE` in MySQL, sent with `executemany`.
+        Other dialects fall back to the slower ORM `merge`.
+        """
+        if isinstance(obj, (Edge, Node)):
             obj = [obj]
 
         # We are dealing with a collection of `Node`s or `Edge`s.
-        all_ids = [o._id for o in obj]
-        new_dicts = {o._id: o.__dict__ for o in obj}
-        target_class = EdgeSQL if is_sequence_of(obj, Edge) else NodeSQL
-        with self.get_session() as s:
-            # Only merge those entries which already exist in the database
-            if upsert:
-                for each in (
-                    s.query(target_class).filter(target_class._id.in_(all_ids)).all()
-                ):
-                    new_dict = new_dicts.pop(each._id)
-                    for k, v in new_dict.items():
-                        if k != "_id":
-                            setattr(each, k, v)
-                    s.merge(each)
-            # Only add those posts which did not exist in the database
-            s.bulk_insert_mappings(
-                target_class,
-                new_dicts.values(),
-                return_defaults=False,
-                render_nulls=True,
-            )
-            return len(new_dicts)
+        if is_sequence_of(obj, Edge):
+            target_class, columns, make_row = EdgeSQL, EDGE_COLUMNS, edge_row
+        elif is_sequence_of(obj, Node):
+            target_class, columns, make_row = NodeSQL, NODE_COLUMNS, node_row
+        else:
+            return super().add(obj)
 
-        return super().add(obj)
+        statement = self.statement_insert(target_class, columns, upsert)
+        if statement is None:
+            return self.merge_with_orm(target_class, obj)
+
+        count = 0
+        chunk_len = type(self).__max_batch_size__
+        with self.get_session() as s:
+            for objs in chunks(obj, chunk_len):
+                rows = unique_rows(map(make_row, objs))
+                s.execute(statement, [dict(zip(columns, row)) for row in rows])
+                count += len(rows)
+        return count
+
+    def add_batch(self, batch: EdgesBatch, upsert=True) -> int:
+        statement = self.statement_insert(EdgeSQL, EDGE_COLUMNS, upsert)
+        if statement is None:
+            return super().add_batch(batch, upsert=upsert)
+        rows = unique_rows(batch.rows())
+        with self.get_session() as s:
+            s.execute(statement, [dict(zip(EDGE_COLUMNS, row)) for row in rows])
+        return len(rows)
 
     def remove(self, obj) -> int:
+        if isinstance(obj, (Edge, Node)):
+            obj = [obj]
+        if is_sequence_of(obj, Edge):
+            return self.remove_edges(obj)
+        elif is_sequence_of(obj, Node):
+            return self.remove_nodes(obj)
+        return super().remove(obj)
+
+    def remove_edges(self, es: Sequence[Edge]) -> int:
+        """
+        Edges with known IDs are deleted with `DELETE ... WHERE _id IN (...)` chunks.
+        The rest are matched by their members, joining against a temporary table.
+        """
+        ids = [e._id for e in es if e._id >= 0]
+        members = [
+            dict(first=e.first, second=e.second, is_directed=bool(e.is_directed))
+            for e in es
+            if e._id < 0
+        ]
+        count = 0
+        chunk_len = type(self).__max_filter_size__
         with self.get_session() as s:
-            # Edge
-            if isinstance(obj, Edge):
-                if obj._id < 0:
-                    return (
-                        s.query(EdgeSQL)
-                        .filter_by(
-                            first=obj.first,
-                            second=obj.second,
-                            is_directed=obj.is_directed,
-                        )
-                        .delete()
-                    )
-                else:
-                    return s.query(EdgeSQL).filter_by(_id=obj._id).delete()
-            # Node
-            elif isinstance(obj, Node):
-                return (
-                    s.query(EdgeSQL)
-                    .filter(
-                        or_(
-                            EdgeSQL.first == obj._id,
-                            EdgeSQL.second == obj._id,
-                        )
+            for part in chunks(ids, chunk_len):
+                task = sa.delete(EdgeSQL.__table__).where(EdgeSQL._id.in_(part))
+                count += s.execute(task).rowcount
+            if len(members) == 0:
+                return count
+
+            connection = s.connection()
+            RemovedEdgesSQL.create(connection, checkfirst=True)
+            try:
+                s.execute(sa.insert(RemovedEdgesSQL), members)
+                match = and_(
+                    RemovedEdgesSQL.c.first == EdgeSQL.first,
+                    RemovedEdgesSQL.c.second == EdgeSQL.second,
+                    RemovedEdgesSQL.c.is_directed == EdgeSQL.is_directed,
+                )
+                task = sa.delete(EdgeSQL.__table__).where(sa.exists().where(match))
+                count += s.execute(task).rowcount
+            finally:
+                RemovedEdgesSQL.drop(connection, checkfirst=True)
+        return count
+
+    def remove_nodes(self, vs) -> int:
+        ids = [self.make_node_id(v) for v in vs]
+        count = 0
+        chunk_len = type(self).__max_filter_size__
+        with self.get_session() as s:
+            for part in chunks(ids, chunk_len):
+                task = sa.delete(EdgeSQL.__table__).where(
+                    or_(
+                        EdgeSQL.first.in_(part),
+                        EdgeSQL.second.in_(part),
                     )
-                    .delete()
-                    + s.query(NodeSQL).filter_by(_id=obj._id).delete()
                 )
-
-        return super().remove(obj)
+                count += s.execute(task).rowcount
+                task = sa.delete(NodeSQL.__table__).where(NodeSQL._id.in_(part))
+                count += s.execute(task).rowcount
+        return count
 
     def remove_node(self, n) -> int:
-        return self.remove(self.make_node(n))
+        return self.remove_nodes([n])
 
     # region Bulk Writes
 
@@ -332,6 +480,7 @@ class BaseSQL(BaseAPI):
         with self.get_session() as s:
             # Build the new table.
             chunk_len = type(self).__max_batch_size__
+            stream = unpack_edges(self.unique_edges(stream))
             for objs in chunks(stream, chunk_len):
                 s.bulk_insert_mappings(
                     EdgeNewSQL,
@@ -341,23 +490,49 @@ class BaseSQL(BaseAPI):
                 )
 
         # Import the new data.
-        cnt = self.number_of_edges()
+        cnt = self.number_of_primary_edges()
         self.insert_table(EdgeNewSQL.__tablename__)
         self.clear_table(EdgeNewSQL.__tablename__)
         self.add_missing_nodes()
-        result = self.number_of_edges() - cnt
+        result = self.number_of_primary_edges() - cnt
         return result
 
+    def save_checkpoint(self, checkpoint: ImportCheckpoint):
+        with self.get_session() as s:
+            s.merge(CheckpointSQL(**checkpoint.__dict__))
+
+    def load_checkpoints(self, source: str) -> Sequence[ImportCheckpoint]:
+        with self.replicas.pinned(), self.get_session(read_only=True) as s:
+            rows = s.query(CheckpointSQL).filter_by(source=source).all()
+            return [
+                ImportCheckpoint(
+                    source=r.source,
+                    worker=r.worker,
+                    batch=r.batch,
+                    byte_offset=r.byte_offset,
+                    last_edge_id=r.last_edge_id,
+                )
+                for r in rows
+            ]
+
+    def clear_checkpoints(self, source: str):
+        with self.get_session() as s:
+            s.query(CheckpointSQL).filter_by(source=source).delete()
+
     # region Helpers
 
+    def make_engine(self, url: str):
+        """
+        Creates the SQLAlchemy engine. Override to pass dialect-specific `connect_args`.
+        """
+        return sa.create_engine(url, **self.engine_options)
+
     def insert_table(self, source_name: str):
         with self.get_session() as s:
-            migration = text(
-                f"""
+            migration = text(f"""
                 INSERT INTO {EdgeSQL.__tablename__}
                 SELECT * FROM {source_name};
-            """
-            )
+            """)
             s.execute(migration)
 
     @abstractmethod
@@ -372,22 +547,51 @@ class BaseSQL(BaseAPI):
             # INTO {EdgeSQL.__tablename__} (_id, first, second, weight, payload_json)
             # ''')
             # But this syntax isn't globally supported.
-            migration = text(
-                f"""
+            migration = text(f"""
                 REPLACE INTO {EdgeSQL.__tablename__}
                 SELECT * FROM {source_name};
-            """
-            )
+            """)
             s.execute(migration)
 
     def clear_table(self, table_name: str):
         with self.get_session() as s:
             s.execute(text(f"DELETE FROM {table_name};"))
 
+    def number_of_primary_edges(self) -> int:
+        """
+        Counts edges on the primary, ignoring the replicas, which may lag behind.
+        Used by the write paths to check their own effects.
+        """
+        with self.replicas.pinned():
+            return self.number_of_edges()
+
+    def make_session_maker(self, engine, thread_local_sessions=False):
+        session_maker = sessionmaker(bind=engine, expire_on_commit=False)
+        if thread_local_sessions:
+            session_maker = scoped_session(session_maker)
+        return session_maker
+
     @contextmanager
-    def get_session(self):
-        session = self.session_maker()
-        session.expire_on_commit = False
+    def get_session(self, read_only=False):
+        """
+        Read-only sessions may be served by one of the replicas, picked by `replicas`.
+        Every other session goes to the primary and counts as a write.
+        """
+        if not read_only:
+            self.replicas.mark_write()
+            with self.open_session(self.session_maker) as session:
+                yield session
+            return
+        with self.replicas.route() as i:
+            session_maker = (
+                self.session_maker if i is None else self.read_session_makers[i]
+            )
+            with self.open_session(session_maker) as session:
+                yield session
+
+    @contextmanager
+    def open_session(self, session_maker):
+        session = session_maker()
         try:
             yield session
             session.commit()
@@ -398,53 +602,172 @@ class BaseSQL(BaseAPI):
         finally:
             session.close()
 
-    def filter_edges_containing(self, q, n):
-        return q.filter(
-            or_(
-                EdgeSQL.first == n,
-                EdgeSQL.second == n,
+    @contextmanager
+    def get_raw_connection(self):
+        """
+        Checks out a DB-API connection from the engine pool, bypassing the ORM.
+        Useful for driver-specific bulk operations, like `COPY` in PostgreSQL.
+        """
+        connection = self.engine.raw_connection()
+        try:
+            yield connection
+            connection.commit()
+        except Exception as e:
+            print(e)
+            connection.rollback()
+            raise e
+        finally:
+            connection.close()
+
+    def where_edges_members(self, shape: str, params: dict):
+        """
+        Builds the `WHERE` clause for a query shape. The `params` can contain
+        either plain values or `bindparam` placeholders.
+        """
+        if shape == "containing":
+            return or_(
+                EdgeSQL.first == params["n"],
+                EdgeSQL.second == params["n"],
             )
-        )
+        elif shape == "to":
+            return EdgeSQL.second == params["v"]
+        elif shape == "from":
+            return EdgeSQL.first == params["u"]
+        elif shape == "between":
+            return and_(
+                EdgeSQL.first == params["u"],
+                EdgeSQL.second == params["v"],
+            )
+        elif shape == "between_any":
+            return or_(
+                and_(
+                    EdgeSQL.first == params["v"],
+                    EdgeSQL.second == params["u"],
+                ),
+                and_(
+                    EdgeSQL.first == params["u"],
+                    EdgeSQL.second == params["v"],
+                ),
+            )
+        return None
+
+    def statement_edges(self, kind: str, u, v, key) -> Tuple[object, dict]:
+        """
+        Returns a cached statement of given `kind` (`"select"` or `"reduce"`)
+        matching the shape of the lookup, and the parameters to bind to it.
+        """
+        shape, params = self.shape_edges_members(u, v)
+        key = self.make_label(key)
+        if key >= 0:
+            params["label"] = key
+
+        cache_key = (kind, shape, key >= 0)
+        statement = self.statements.get(cache_key)
+        if statement is None:
+            if kind == "reduce":
+                statement = select(
+                    func.count(EdgeSQL.weight).label("count"),
+                    func.sum(EdgeSQL.weight).label("sum"),
+                )
+            else:
+                statement = select(EdgeSQL)
+            placeholders = {name: bindparam(name) for name in ("n", "u", "v")}
+            clause = self.where_edges_members(shape, placeholders)
+            if clause is not None:
+                statement = statement.where(clause)
+            if key >= 0:
+                statement = statement.where(EdgeSQL.label == bindparam("label"))
+            self.statements[cache_key] = statement
+        return statement, params
+
+    def related_ids(self, kind: str, n) -> Set[int]:
+        """
+        Runs a cached projection-only query of given `kind`:
+        `"neighbors"`, `"successors"` or `"predecessors"`.
+        """
+        statement = self.statements.get(kind)
+        if statement is None:
+            n_param = bindparam("n")
+            outgoing = select(EdgeSQL.second).where(EdgeSQL.first == n_param)
+            incoming = select(EdgeSQL.first).where(EdgeSQL.second == n_param)
+            if kind == "successors":
+                statement = outgoing.distinct()
+            elif kind == "predecessors":
+                statement = incoming.distinct()
+            else:
+                statement = sa.union(outgoing, incoming)
+            self.statements[kind] = statement
+
+        n = self.make_node_id(n)
+        with self.get_session(read_only=True) as s:
+            result = set(s.scalars(statement, {"n": n}))
+        result.discard(n)
+        return result
+
+    def statement_insert(self, target_class, columns: Sequence[str], upsert: bool):
+        """
+        Returns a cached `INSERT` statement for the table of `target_class`.
+        With `upsert`, existing rows with matching `_id` get overwritten.
+        If the dialect has no native upserts, returns `None`.
+        """
+        cache_key = ("insert", target_class.__tablename__, upsert)
+        statement = self.statements.get(cache_key)
+        if statement is not None:
+            return statement
+
+        table = target_class.__table__
+        dialect = self.engine.dialect.name
+        updated = [c for c in columns if c != "_id"]
+        if not upsert:
+            statement = sa.insert(table)
+        elif dialect in ("postgresql", "sqlite"):
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            statement = insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=["_id"],
+                set_={c: statement.excluded[c] for c in updated},
+            )
+        elif dialect in ("mysql", "mariadb"):
+            statement = mysql.insert(table)
+            statement = statement.on_duplicate_key_update(
+                {c: statement.inserted[c] for c in updated}
+            )
+        else:
+            return None
+        self.statements[cache_key] = statement
+        return statement
+
+    def merge_with_orm(self, target_class, objs) -> int:
+        all_ids = [o._id for o in objs]
+        new_dicts = {o._id: o.__dict__ for o in objs}
+        with self.get_session() as s:
+            # Only merge those entries which already exist in the database
+            for each in (
+                s.query(target_class).filter(target_class._id.in_(all_ids)).all()
+            ):
+                new_dict = new_dicts.pop(each._id)
+                for k, v in new_dict.items():
+                    if k != "_id":
+                        setattr(each, k, v)
+                s.merge(each)
+            # Only add those posts which did not exist in the database
+            s.bulk_insert_mappings(
+                target_class,
+                new_dicts.values(),
+                return_defaults=False,
+                render_nulls=True,
+            )
+        return len(objs)
+
+    def filter_edges_containing(self, q, n):
+        return q.filter(self.where_edges_members("containing", {"n": n}))
 
     def filter_edges_members(self, q, u, v):
-        u = self.make_node_id(u)
-        v = self.make_node_id(v)
-        if u < 0 and v < 0:
+        shape, params = self.shape_edges_members(u, v)
+        clause = self.where_edges_members(shape, params)
+        if clause is None:
             return q
-        elif u < 0 or v < 0:
-            if not self.directed:
-                return self.filter_edges_containing(q, max(u, v))
-            elif u < 0:
-                return q.filter(EdgeSQL.second == v)
-            elif v < 0:
-                return q.filter(EdgeSQL.first == u)
-        else:
-            if self.directed:
-                if u == v:
-                    return self.filter_edges_containing(q, u)
-                else:
-                    return q.filter(
-                        and_(
-                            EdgeSQL.first == u,
-                            EdgeSQL.second == v,
-                        )
-                    )
-            else:
-                if u == v:
-                    return self.filter_edges_containing(q, u)
-                else:
-                    return q.filter(
-                        or_(
-                            and_(
-                                EdgeSQL.first == v,
-                                EdgeSQL.second == u,
-                            ),
-                            and_(
-                                EdgeSQL.first == u,
-                                EdgeSQL.second == v,
-                            ),
-                        )
-                    )
+        return q.filter(clause)
 
     def filter_edges_label(self, q, key):
         key = self.make_label(key)
@@ -2,14 +2,14 @@ from typing import Generator, Tuple, Sequence
 from itertools import filterfalse, chain
 from urllib.parse import urlparse
 import random
-import collections
+import collections.abc
 
 
 from networkxternal.helpers.edge import Edge
 
 
 def is_sequence_of(objs, expected_class) -> bool:
-    return isinstance(objs, collections.Sequence) and all(
+    return isinstance(objs, collections.abc.Sequence) and all(
         [isinstance(obj, expected_class) for obj in objs]
     )
 
@@ -32,15 +32,24 @@ def map_compact(func, os: Sequence[object]) -> Sequence[object]:
 
 
 def remove_duplicate_edges(es: Sequence[Edge]) -> Sequence[Edge]:
-    ids = set()
-
-    def false_if_exists(e: object) -> bool:
-        if e._id < 0:
-            ids.insert(e._id)
+    """
+    Lazily skips the edges, whose members were already seen, keeping the first one.
+    Undirected edges match regardless of the order of members.
+    For streams that don't fit into RAM, use `dedup.deduplicate_edges`.
+    """
+    keys = set()
+
+    def is_duplicate(e: Edge) -> bool:
+        first, second = e.first, e.second
+        if not e.is_directed and first > second:
+            first, second = second, first
+        key = (first, second, bool(e.is_directed))
+        if key in keys:
             return True
+        keys.add(key)
         return False
 
-    return filterfalse(false_if_exists, es)
+    return filterfalse(is_duplicate, es)
 
 
 def chunks(iterable, size) -> Generator[list, None, None]:
@@ -0,0 +1,141 @@
+import struct
+from typing import Generator, Iterable, Optional, Tuple, Union
+
+import numpy as np
+
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, chunks_or_batches
+from networkxternal.helpers.import_stats import ImportStats
+
+# Little-endian fixed-width records. IDs are stored explicitly,
+# so subsets of a graph, like benchmark samples, keep their identities.
+# Weights and labels are as wide as in `EdgesBatch`, so they round-trip exactly.
+EDGE_RECORD = np.dtype(
+    [
+        ("_id", "<i8"),
+        ("first", "<i8"),
+        ("second", "<i8"),
+        ("weight", "<f8"),
+        ("label", "<i8"),
+    ]
+)
+# Magic, flags, record size, count of records and a reserved field.
+BINARY_HEADER = struct.Struct("<8sIIQQ")
+BINARY_MAGIC = b"NXEDGES1"
+BINARY_SUFFIX = ".bedges"
+FLAG_DIRECTED = 1
+
+
+def edges_to_records(es: Union[list, EdgesBatch]) -> np.ndarray:
+    records = np.empty(len(es), dtype=EDGE_RECORD)
+    if isinstance(es, EdgesBatch):
+        records["_id"] = es.ids
+        records["first"] = es.first
+        records["second"] = es.second
+        records["weight"] = es.weight
+        records["label"] = es.label
+    else:
+        records["_id"] = [e._id for e in es]
+        records["first"] = [e.first for e in es]
+        records["second"] = [e.second for e in es]
+        records["weight"] = [e.weight for e in es]
+        records["label"] = [e.label for e in es]
+    return records
+
+
+def write_edges_binary(
+    stream: Iterable[Union[Edge, EdgesBatch]],
+    filepath: str,
+    chunk_len: int = 100_000,
+) -> int:
+    """
+    Dumps a stream of edges into the fixed-width binary format:
+    a `BINARY_HEADER` followed by `EDGE_RECORD`s.
+    The direction is stored once per file, taken from the first edge,
+    so streams mixing directed and undirected edges are rejected.
+    Returns the number of written records.
+    """
+    count = 0
+    is_directed = None
+    with open(filepath, "wb") as f:
+        f.write(b"\0" * BINARY_HEADER.size)
+        for es in chunks_or_batches(stream, chunk_len):
+            if isinstance(es, EdgesBatch):
+                directions = {bool(es.is_directed)}
+            else:
+                directions = {bool(e.is_directed) for e in es}
+            if is_directed is None:
+                is_directed = directions.pop()
+            if directions - {is_directed}:
+                raise ValueError(f"Mixed edge directions can't be stored: {filepath}")
+            f.write(edges_to_records(es).tobytes())
+            count += len(es)
+
+        # Now that the count is known, fill the header.
+        f.seek(0)
+        flags = FLAG_DIRECTED if is_directed in (None, True) else 0
+        f.write(BINARY_HEADER.pack(BINARY_MAGIC, flags, EDGE_RECORD.itemsize, count, 0))
+    return count
+
+
+def is_binary_edges_file(filepath: str) -> bool:
+    """
+    Checks the header, so files of older layouts or interrupted writes aren't reused.
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(BINARY_HEADER.size)
+    if len(head) < BINARY_HEADER.size:
+        return False
+    magic, _, record_size, _, _ = BINARY_HEADER.unpack(head)
+    return magic == BINARY_MAGIC and record_size == EDGE_RECORD.itemsize
+
+
+def read_edges_binary(filepath: str) -> Tuple[np.ndarray, bool]:
+    """
+    Memory-maps the records of a binary edges file.
+    Returns the read-only structured array and the `is_directed` flag.
+    """
+    with open(filepath, "rb") as f:
+        magic, flags, record_size, count, _ = BINARY_HEADER.unpack(
+            f.read(BINARY_HEADER.size)
+        )
+    if magic != BINARY_MAGIC or record_size != EDGE_RECORD.itemsize:
+        raise ValueError(f"Not a binary edges file: {filepath}")
+    if count == 0:
+        return np.empty(0, dtype=EDGE_RECORD), bool(flags & FLAG_DIRECTED)
+    records = np.memmap(
+        filepath,
+        dtype=EDGE_RECORD,
+        mode="r",
+        offset=BINARY_HEADER.size,
+        shape=(count,),
+    )
+    return records, bool(flags & FLAG_DIRECTED)
+
+
+def yield_edges_batches_from_binary(
+    filepath: str,
+    batch_size: int = 100_000,
+    stats: Optional[ImportStats] = None,
+    start_offset: int = 0,
+) -> Generator[EdgesBatch, None, None]:
+    """
+    Slices the memory-mapped records into `EdgesBatch`es without any parsing.
+    Every batch carries the byte offset right past its last record,
+    so reading can later continue from that `start_offset`.
+    """
+    records, is_directed = read_edges_binary(filepath)
+    first_record = max(0, start_offset - BINARY_HEADER.size) // EDGE_RECORD.itemsize
+    for start in range(first_record, len(records), batch_size):
+        part = records[start : start + batch_size]
+        yield EdgesBatch(
+            ids=part["_id"].astype(np.int64),
+            first=part["first"].astype(np.int64),
+            second=part["second"].astype(np.int64),
+            weight=part["weight"].astype(np.float64),
+            label=part["label"].astype(np.int64),
+            is_directed=is_directed,
+            end_offset=BINARY_HEADER.size + (start + len(part)) * EDGE_RECORD.itemsize,
+        )
+    if stats is not None:
+        stats.count_bytes = BINARY_HEADER.size + records.nbytes
@@ -0,0 +1,262 @@
+import os
+import queue
+import threading
+from dataclasses import dataclass
+from time import perf_counter
+from typing import List, Tuple
+
+from networkxternal.helpers.import_stats import ImportStats, StageStats
+from networkxternal.helpers.binary_edges import (
+    BINARY_SUFFIX,
+    EDGE_RECORD,
+    is_binary_edges_file,
+    write_edges_binary,
+    yield_edges_batches_from_binary,
+)
+from networkxternal.helpers.compression import (
+    detect_compression,
+    strip_compression_suffix,
+)
+from networkxternal.helpers.parsing import (
+    convert_to_binary,
+    yield_edges_batches_from_csv,
+    yield_edges_batches_from_file,
+)
+
+
+def is_seekable_source(filepath: str) -> bool:
+    """
+    Checks if the batches of the file can be read starting from any byte offset.
+    """
+    if detect_compression(filepath) is not None:
+        return False
+    return filepath.endswith((".csv", BINARY_SUFFIX))
+
+
+def binary_path_for(filepath: str, tag: str) -> str:
+    return strip_compression_suffix(os.path.abspath(filepath)) + tag + BINARY_SUFFIX
+
+
+@dataclass
+class ImportCheckpoint:
+    """
+    Progress of one worker of a resumable import: the number of its last
+    committed batch, the byte offset in the `source` file right past that batch
+    and the ID of its last edge. Edges of text files are numbered by lines,
+    so it's the ID of the last line before that offset, even if it's skipped.
+    """
+
+    source: str
+    worker: int = 0
+    batch: int = -1
+    byte_offset: int = 0
+    last_edge_id: int = -1
+
+
+def resume_point(source: str, checkpoints: List[ImportCheckpoint]) -> ImportCheckpoint:
+    """
+    Batches are assigned to workers round-robin and every worker commits them in order,
+    so every batch up to the smallest of the workers' last batches is committed.
+    Later batches, that may have been committed by faster workers, are repeated,
+    which is harmless, as the edge IDs are derived from the source.
+    """
+    if len(checkpoints) == 0:
+        return ImportCheckpoint(source=source)
+    return min(checkpoints, key=lambda c: c.batch)
+
+
+class ResumableImport:
+    """
+    Imports an edge list, durably recording the progress of every writer
+    with `gdb.save_checkpoint` after each committed batch of `block_size` bytes.
+    Every block becomes a single batch, that ends at a known byte offset.
+    Batches are dealt to the `writers` round-robin, each keeping its own cursor.
+    If the previous attempt crashed, continues from the last batch committed by all
+    the writers, skipping the parsed prefix of the file entirely.
+    Batches, that the previous attempt may have written, are always upserted.
+    Once finished, the checkpoints are removed.
+
+    Only uncompressed CSV and binary files can be resumed from a byte offset.
+    Other supported formats are first converted into a binary file next to the source,
+    which is then imported instead. Simple graphs are also deduplicated
+    with `gdb.unique_edges` on the way into that file. So every attempt sees
+    the same edges and batches still map back to byte offsets.
+    """
+
+    def __init__(self, gdb, writers: int = 1, block_size: int = 1 << 24, upsert=True):
+        if not type(gdb).__is_concurrent__:
+            writers = 1
+        self.gdb = gdb
+        self.writers = writers
+        self.block_size = block_size
+        self.upsert = upsert
+        self.cursors = [queue.Queue(2) for _ in range(writers)]
+        self.stages = [StageStats(f"writer {i}") for i in range(writers)]
+        self.errors = list()
+        self.stopped = threading.Event()
+
+    def run(self, filepath: str) -> int:
+        """
+        Returns the number of edges imported by this call.
+        """
+        source = os.path.abspath(filepath)
+        intermediate_path = None
+        if not getattr(self.gdb, "multigraph", True):
+            intermediate_path = filepath = self.unique_edges_file(filepath)
+        elif not is_seekable_source(filepath):
+            intermediate_path = filepath = convert_to_binary(
+                filepath, binary_path_for(filepath, ".converted")
+            )
+        start, replay_until = self.restart(source)
+        batches = self.read(filepath, start)
+
+        started = perf_counter()
+        threads = [
+            threading.Thread(target=self.write, args=(source, i))
+            for i in range(self.writers)
+        ]
+        for t in threads:
+            t.start()
+        try:
+            batch_start = start.byte_offset
+            for number, batch in enumerate(batches, start=start.batch + 1):
+                upsert = self.upsert or batch_start < replay_until
+                if not self.put(number % self.writers, (number, batch, upsert)):
+                    break
+                batch_start = batch.end_offset
+        finally:
+            for c in self.cursors:
+                c.put(None)
+            for t in threads:
+                t.join()
+        if len(self.errors):
+            raise self.errors[0]
+
+        self.gdb.clear_checkpoints(source)
+        self.gdb.add_missing_nodes()
+        count_edges = sum(s.count_edges for s in self.stages)
+        self.gdb.last_import_stats = ImportStats(
+            count_edges=count_edges,
+            count_bytes=os.path.getsize(filepath) - start.byte_offset,
+            seconds=perf_counter() - started,
+            stages=self.stages,
+        )
+        if intermediate_path is not None:
+            os.remove(intermediate_path)
+        return count_edges
+
+    def restart(self, source: str) -> Tuple[ImportCheckpoint, int]:
+        """
+        Returns the point to resume from and the byte offset, before which
+        the batches may have already been written. Every writer of the previous
+        attempt could have written one more batch past its last checkpoint.
+        """
+        checkpoints = self.gdb.load_checkpoints(source)
+        start = resume_point(source, checkpoints)
+        replay_until = 0
+        if len(checkpoints):
+            replay_until = max(c.byte_offset for c in checkpoints)
+            replay_until += len(checkpoints) * self.block_size
+        # Batch boundaries after the resume point differ from the previous attempt,
+        # so the cursors of all workers are reset to it, before any writes happen.
+        self.gdb.clear_checkpoints(source)
+        for worker in range(self.writers):
+            self.gdb.save_checkpoint(
+                ImportCheckpoint(
+                    source=source,
+                    worker=worker,
+                    batch=start.batch,
+                    byte_offset=start.byte_offset,
+                    last_edge_id=start.last_edge_id,
+                )
+            )
+        return start, replay_until
+
+    def read(self, filepath: str, start: ImportCheckpoint):
+        if filepath.endswith(BINARY_SUFFIX):
+            return yield_edges_batches_from_binary(
+                filepath,
+                batch_size=max(1, self.block_size // EDGE_RECORD.itemsize),
+                start_offset=start.byte_offset,
+            )
+        return yield_edges_batches_from_csv(
+            filepath,
+            batch_size=self.block_size,
+            block_size=self.block_size,
+            start_offset=start.byte_offset,
+            first_id=start.last_edge_id + 1,
+        )
+
+    def unique_edges_file(self, filepath: str) -> str:
+        """
+        The deduplicated edges are reused by the following attempts, while the file
+        is newer than the source. It's written atomically, so an interrupted
+        deduplication is simply repeated.
+        """
+        path = binary_path_for(filepath, ".unique")
+        is_fresh = os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(
+            filepath
+        )
+        if is_fresh and is_binary_edges_file(path):
+            return path
+        stream = yield_edges_batches_from_file(filepath)
+        if stream is None:
+            raise ValueError(f"Unsupported edge list format: {filepath}")
+        partial_path = path + ".partial"
+        write_edges_binary(self.gdb.unique_edges(stream), partial_path)
+        os.replace(partial_path, path)
+        return path
+
+    def put(self, worker: int, item) -> bool:
+        while not self.stopped.is_set():
+            try:
+                self.cursors[worker].put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def write(self, source: str, worker: int):
+        stats = self.stages[worker]
+        while True:
+            item = self.cursors[worker].get()
+            if item is None:
+                return
+            # After a failure, keep draining the queue, so the reader never blocks.
+            if self.stopped.is_set():
+                continue
+            number, batch, upsert = item
+            t0 = perf_counter()
+            try:
+                stats.count_edges += self.gdb.add_batch(batch, upsert=upsert)
+                self.gdb.save_checkpoint(
+                    ImportCheckpoint(
+                        source=source,
+                        worker=worker,
+                        batch=number,
+                        byte_offset=batch.end_offset,
+                        last_edge_id=(
+                            batch.next_id - 1
+                            if batch.next_id >= 0
+                            else int(batch.ids[-1])
+                        ),
+                    )
+                )
+            except Exception as e:
+                print(e)
+                self.errors.append(e)
+                self.stopped.set()
+            finally:
+                stats.seconds_busy += perf_counter() - t0
+
+
+def import_resumable(
+    gdb,
+    filepath: str,
+    writers: int = 1,
+    block_size: int = 1 << 24,
+    upsert: bool = True,
+) -> int:
+    return ResumableImport(
+        gdb, writers=writers, block_size=block_size, upsert=upsert
+    ).run(filepath)
@@ -0,0 +1,117 @@
+import io
+import bz2
+import gzip
+import lzma
+import queue
+import threading
+from typing import Optional
+
+# Leading bytes of the supported container formats.
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "bz2": b"BZh",
+    "xz": b"\xfd7zXZ\x00",
+}
+COMPRESSION_SUFFIXES = (".gz", ".bz2", ".xz")
+
+
+def detect_compression(filepath: str) -> Optional[str]:
+    """
+    Guesses the compression by the magic bytes rather than the file extension.
+    """
+    with open(filepath, "rb") as f:
+        head = f.read(8)
+    for name, magic in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def strip_compression_suffix(filepath: str) -> str:
+    for suffix in COMPRESSION_SUFFIXES:
+        if filepath.endswith(suffix):
+            return filepath[: -len(suffix)]
+    return filepath
+
+
+class DecompressingStream(io.RawIOBase):
+    """
+    Exposes a compressed file as a readable binary stream, decompressed
+    by a background thread into a bounded queue of blocks.
+    `zlib`, `bz2` and `lzma` release the GIL while decompressing,
+    so it overlaps with parsing and DB writes in the consuming thread.
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        compression: str,
+        block_size: int = 1 << 20,
+        max_blocks: int = 16,
+    ):
+        io.RawIOBase.__init__(self)
+        self.file = open(filepath, "rb")
+        if compression == "gzip":
+            self.decompressed = gzip.GzipFile(fileobj=self.file)
+        elif compression == "bz2":
+            self.decompressed = bz2.BZ2File(self.file)
+        elif compression == "xz":
+            self.decompressed = lzma.LZMAFile(self.file)
+        else:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.block_size = block_size
+        self.blocks = queue.Queue(max_blocks)
+        self.buffer = memoryview(b"")
+        self.count_bytes = 0
+        self.finished = False
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.decompress, daemon=True)
+        self.thread.start()
+
+    def decompress(self):
+        try:
+            while not self.stopped.is_set():
+                block = self.decompressed.read(self.block_size)
+                self.blocks.put(block)
+                # An empty block marks the end of the stream.
+                if len(block) == 0:
+                    break
+        except Exception as e:
+            self.blocks.put(e)
+
+    @property
+    def count_compressed_bytes(self) -> int:
+        return self.file.tell()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self.buffer) == 0 and not self.finished:
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                self.finished = True
+                raise block
+            if len(block) == 0:
+                self.finished = True
+            self.buffer = memoryview(block)
+
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        self.count_bytes += n
+        return n
+
+    def close(self):
+        if self.closed:
+            return
+        # Unblock the producer, if the consumer stopped early.
+        self.stopped.set()
+        while self.thread.is_alive():
+            try:
+                self.blocks.get(timeout=0.1)
+            except queue.Empty:
+                pass
+        self.decompressed.close()
+        self.file.close()
+        io.RawIOBase.close(self)
@@ -0,0 +1,414 @@
+import os
+import math
+import pickle
+import tempfile
+from typing import Generator, Iterable, List, Optional, Union
+
+import numpy as np
+
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, chunks_or_batches
+
+DUPLICATES_POLICIES = ("keep_first", "keep_last", "sum_weights")
+
+# The leading fields form the sort order. The `position` in the input stream
+# is unique, so the following fields never take part in comparisons.
+DEDUP_RECORD = np.dtype(
+    [
+        ("low", "<i8"),
+        ("high", "<i8"),
+        ("is_directed", "?"),
+        ("position", "<i8"),
+        ("_id", "<i8"),
+        ("first", "<i8"),
+        ("second", "<i8"),
+        ("weight", "<f8"),
+        ("label", "<i8"),
+        # Offset of the original `Edge` object in the `SpilledEdges` file, if any.
+        ("ref", "<i8"),
+    ]
+)
+DEDUP_ORDER = ["low", "high", "is_directed", "position"]
+# Just the keys of the edges, that were already passed through.
+KEY_RECORD = np.dtype([("low", "<i8"), ("high", "<i8"), ("is_directed", "?")])
+KEY_ORDER = ["low", "high", "is_directed"]
+
+
+def splitmix64(x: np.ndarray) -> np.ndarray:
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+class BloomFilter:
+    """
+    Vectorized Bloom filter over the `(low, high, is_directed)` keys of `DEDUP_RECORD`s,
+    sized for `capacity` keys with the `error_rate` probability of false positives.
+    Positions are derived with double hashing from two `splitmix64` hashes.
+    """
+
+    def __init__(self, capacity: int = 10_000_000, error_rate: float = 0.01):
+        self.count_bits = max(
+            64, int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        self.count_hashes = max(1, round(self.count_bits / capacity * math.log(2)))
+        self.bits = np.zeros((self.count_bits + 7) // 8, dtype=np.uint8)
+
+    def positions(self, records: np.ndarray) -> np.ndarray:
+        low = records["low"].astype(np.uint64)
+        high = records["high"].astype(np.uint64)
+        direction = records["is_directed"].astype(np.uint64)
+        h1 = splitmix64(splitmix64(low) ^ high ^ (direction << np.uint64(63)))
+        h2 = splitmix64(h1) | np.uint64(1)
+        i = np.arange(self.count_hashes, dtype=np.uint64)
+        return (h1[:, None] + i[None, :] * h2[:, None]) % np.uint64(self.count_bits)
+
+    def add(self, records: np.ndarray):
+        positions = self.positions(records).ravel()
+        np.bitwise_or.at(
+            self.bits,
+            positions >> np.uint64(3),
+            1 << (positions & np.uint64(7)).astype(np.uint8),
+        )
+
+    def contains(self, records: np.ndarray) -> np.ndarray:
+        positions = self.positions(records)
+        found = self.bits[positions >> np.uint64(3)] >> (
+            positions & np.uint64(7)
+        ).astype(np.uint8)
+        return np.all(found & 1, axis=1)
+
+
+def edges_to_dedup_records(
+    es: Union[List[Edge], EdgesBatch], position: int
+) -> np.ndarray:
+    records = np.empty(len(es), dtype=DEDUP_RECORD)
+    if isinstance(es, EdgesBatch):
+        records["_id"] = es.ids
+        records["first"] = es.first
+        records["second"] = es.second
+        records["weight"] = es.weight
+        records["label"] = es.label
+        records["is_directed"] = es.is_directed
+    else:
+        records["_id"] = [e._id for e in es]
+        records["first"] = [e.first for e in es]
+        records["second"] = [e.second for e in es]
+        records["weight"] = [e.weight for e in es]
+        records["label"] = [e.label for e in es]
+        records["is_directed"] = [bool(e.is_directed) for e in es]
+    # Undirected edges match regardless of the order of their members.
+    swap = ~records["is_directed"] & (records["first"] > records["second"])
+    records["low"] = np.where(swap, records["second"], records["first"])
+    records["high"] = np.where(swap, records["first"], records["second"])
+    records["position"] = np.arange(position, position + len(es), dtype=np.int64)
+    records["ref"] = -1
+    return records
+
+
+def keys_of(records: np.ndarray) -> np.ndarray:
+    keys = np.empty(len(records), dtype=KEY_RECORD)
+    for field in KEY_ORDER:
+        keys[field] = records[field]
+    return keys
+
+
+def group_starts(records: np.ndarray) -> np.ndarray:
+    """
+    Indexes of the first records of every key in a sorted array.
+    """
+    changed = np.ones(len(records), dtype=bool)
+    changed[1:] = (
+        (records["low"][1:] != records["low"][:-1])
+        | (records["high"][1:] != records["high"][:-1])
+        | (records["is_directed"][1:] != records["is_directed"][:-1])
+    )
+    return np.flatnonzero(changed)
+
+
+def reduce_groups(records: np.ndarray, policy: str) -> np.ndarray:
+    """
+    Collapses the sorted records of every key into one, according to the `policy`.
+    """
+    if len(records) == 0:
+        return records
+    starts = group_starts(records)
+    if policy == "keep_last":
+        ends = np.append(starts[1:] - 1, len(records) - 1)
+        return records[ends]
+    result = records[starts]
+    if policy == "sum_weights":
+        result["weight"] = np.add.reduceat(records["weight"], starts)
+    return result
+
+
+def dedup_records_to_batches(records: np.ndarray) -> Generator[EdgesBatch, None, None]:
+    for is_directed in (True, False):
+        part = records[records["is_directed"] == is_directed]
+        if len(part) == 0:
+            continue
+        yield EdgesBatch(
+            ids=part["_id"].copy(),
+            first=part["first"].copy(),
+            second=part["second"].copy(),
+            weight=part["weight"].copy(),
+            label=part["label"].copy(),
+            is_directed=is_directed,
+        )
+
+
+class SortedRuns:
+    """
+    Buffers records and spills them into `.npy` files in the `directory`,
+    each sorted by the `order` and holding up to `run_size` records.
+    The runs are memory-mapped back for merging and lookups.
+    """
+
+    def __init__(self, directory: str, name: str, run_size: int, order: List[str]):
+        self.directory = directory
+        self.name = name
+        self.run_size = run_size
+        self.order = order
+        self.runs = list()
+        self.buffer = list()
+        self.count_buffered = 0
+
+    def add(self, records: np.ndarray):
+        if len(records) == 0:
+            return
+        self.buffer.append(records)
+        self.count_buffered += len(records)
+        if self.count_buffered >= self.run_size:
+            self.flush()
+
+    def flush(self):
+        if self.count_buffered == 0:
+            return
+        run = np.sort(np.concatenate(self.buffer), order=self.order)
+        path = os.path.join(self.directory, f"{self.name}-{len(self.runs)}.npy")
+        np.save(path, run)
+        self.runs.append(np.load(path, mmap_mode="r"))
+        self.buffer = list()
+        self.count_buffered = 0
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self.runs:
+            idx = np.minimum(np.searchsorted(run, keys), len(run) - 1)
+            found |= run[idx] == keys
+        return found
+
+
+class SpilledEdges:
+    """
+    Append-only file of pickled `Edge` objects, addressed by their byte offsets,
+    so that payloads and `Edge` subclasses survive the external sort.
+    """
+
+    def __init__(self, path: str):
+        self.file = open(path, "w+b")
+
+    def dump(self, es: List[Edge]) -> np.ndarray:
+        self.file.seek(0, os.SEEK_END)
+        offsets = np.empty(len(es), dtype=np.int64)
+        for i, e in enumerate(es):
+            offsets[i] = self.file.tell()
+            pickle.dump(e, self.file, protocol=pickle.HIGHEST_PROTOCOL)
+        return offsets
+
+    def load(self, offsets: np.ndarray) -> List[Edge]:
+        es = list()
+        for offset in offsets.tolist():
+            self.file.seek(offset)
+            es.append(pickle.load(self.file))
+        return es
+
+    def close(self):
+        self.file.close()
+
+
+class StreamingDedup:
+    """
+    Collapses the edges with matching `(first, second)` members in a stream,
+    that may not fit into RAM. Undirected edges match in either order.
+
+    Records are written into sorted runs of up to `run_size` records,
+    spilled to temporary `.npy` files, and the runs are merged in blocks at the end,
+    applying the `policy` to every group of duplicates:
+    *   `keep_first` keeps the earliest edge,
+    *   `keep_last` keeps the latest edge,
+    *   `sum_weights` keeps the earliest edge with the weights of the whole group summed.
+
+    With `keep_first`, a Bloom filter is a fast path: edges, whose keys weren't seen
+    before, are passed through immediately and only their keys are spilled.
+    Only the first occurrences of the keys, that the filter has seen, are spilled
+    as candidates. In the end, those are merged and checked against the spilled keys,
+    as some of them are false positives of the filter.
+    Rows of `EdgesBatch`es come out as batches, while individual `Edge`s
+    come out as the same objects, keeping their payloads and types.
+    Spilled ones are pickled into a `SpilledEdges` file next to the runs.
+    """
+
+    def __init__(
+        self,
+        policy: str = "keep_first",
+        run_size: int = 1_000_000,
+        capacity: int = 10_000_000,
+        error_rate: float = 0.01,
+        directory: str = None,
+    ):
+        assert policy in DUPLICATES_POLICIES, f"Unknown policy: {policy}"
+        self.policy = policy
+        self.run_size = run_size
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.directory = directory
+        self.count_input = 0
+        self.count_output = 0
+
+    def __call__(
+        self, stream: Iterable[Union[Edge, EdgesBatch]]
+    ) -> Generator[Union[Edge, EdgesBatch], None, None]:
+        with tempfile.TemporaryDirectory(dir=self.directory) as directory:
+            self.candidates = SortedRuns(
+                directory, "candidates", self.run_size, DEDUP_ORDER
+            )
+            self.emitted = SortedRuns(directory, "emitted", self.run_size, KEY_ORDER)
+            self.spilled_edges = SpilledEdges(os.path.join(directory, "edges.pickle"))
+            bloom = None
+            if self.policy == "keep_first":
+                bloom = BloomFilter(self.capacity, self.error_rate)
+            try:
+                for es in chunks_or_batches(stream, self.run_size):
+                    records = edges_to_dedup_records(es, self.count_input)
+                    objects = None if isinstance(es, EdgesBatch) else es
+                    if bloom is None:
+                        self.spill(records, objects)
+                    else:
+                        yield from self.pass_new_keys(records, objects, bloom)
+                    self.count_input += len(records)
+                self.candidates.flush()
+                self.emitted.flush()
+                yield from self.merge(self.candidates.runs)
+            finally:
+                self.spilled_edges.close()
+
+    def spill(self, records: np.ndarray, objects: Optional[List[Edge]]):
+        if objects is not None:
+            positions = records["position"] - self.count_input
+            records["ref"] = self.spilled_edges.dump([objects[i] for i in positions])
+        self.candidates.add(records)
+
+    def pass_new_keys(
+        self,
+        records: np.ndarray,
+        objects: Optional[List[Edge]],
+        bloom: BloomFilter,
+    ) -> Generator[Union[Edge, EdgesBatch], None, None]:
+        """
+        Later occurrences of a key within the same chunk are dropped right away,
+        so only the first ones are checked against the Bloom filter.
+        """
+        records = np.sort(records, order=DEDUP_ORDER)
+        firsts = records[group_starts(records)]
+        seen = bloom.contains(firsts)
+        bloom.add(firsts)
+        new = firsts[~seen]
+        self.emitted.add(keys_of(new))
+        self.spill(firsts[seen], objects)
+        if objects is None:
+            yield from self.emit(new)
+            return
+        self.count_output += len(new)
+        for i in (new["position"] - self.count_input).tolist():
+            yield objects[i]
+
+    def emit(
+        self, records: np.ndarray
+    ) -> Generator[Union[Edge, EdgesBatch], None, None]:
+        self.count_output += len(records)
+        spilled = records["ref"] >= 0
+        if spilled.any():
+            es = self.spilled_edges.load(records["ref"][spilled])
+            if self.policy == "sum_weights":
+                for e, weight in zip(es, records["weight"][spilled].tolist()):
+                    e.weight = weight
+            yield from es
+            records = records[~spilled]
+        yield from dedup_records_to_batches(records)
+
+    def merge(
+        self, runs: List[np.ndarray]
+    ) -> Generator[Union[Edge, EdgesBatch], None, None]:
+        """
+        Merges the sorted runs block by block. In every round, the smallest of the last
+        records of the loaded blocks bounds what can be emitted, as every following
+        record in every run is bigger. The group of the last key may continue
+        in the next round, so it's carried over, collapsed into a single record.
+        """
+        block_len = max(1024, self.run_size // max(1, len(runs)))
+        cursors = [0] * len(runs)
+        carry = np.empty(0, dtype=DEDUP_RECORD)
+        while True:
+            active = [i for i, run in enumerate(runs) if cursors[i] < len(run)]
+            if len(active) == 0:
+                break
+            blocks = {i: runs[i][cursors[i] : cursors[i] + block_len] for i in active}
+            unfinished = [
+                i for i in active if cursors[i] + len(blocks[i]) < len(runs[i])
+            ]
+            parts = [carry]
+            if len(unfinished):
+                bound = np.sort(
+                    np.array([blocks[i][-1] for i in unfinished]), order=DEDUP_ORDER
+                )[0]
+                for i in active:
+                    count = np.searchsorted(blocks[i], bound, side="right")
+                    parts.append(blocks[i][:count])
+                    cursors[i] += count
+            else:
+                for i in active:
+                    parts.append(blocks[i])
+                    cursors[i] += len(blocks[i])
+
+            merged = np.sort(np.concatenate(parts), order=DEDUP_ORDER)
+            last_group = group_starts(merged)[-1]
+            carry = reduce_groups(merged[last_group:], self.policy)
+            yield from self.emit_merged(merged[:last_group])
+        yield from self.emit_merged(carry)
+
+    def emit_merged(
+        self, records: np.ndarray
+    ) -> Generator[Union[Edge, EdgesBatch], None, None]:
+        if len(records) == 0:
+            return
+        records = reduce_groups(records, self.policy)
+        if self.policy == "keep_first":
+            # Keys, that were passed through, preceded all of their candidates.
+            records = records[~self.emitted.contains(keys_of(records))]
+        yield from self.emit(records)
+
+
+def deduplicate_edges(
+    stream: Iterable[Union[Edge, EdgesBatch]],
+    policy: str = "keep_first",
+    **kwargs,
+) -> Generator[Union[Edge, EdgesBatch], None, None]:
+    return StreamingDedup(policy=policy, **kwargs)(stream)
+
+
+def deduplicate_ids(
+    stream: Iterable[np.ndarray],
+    **kwargs,
+) -> Generator[np.ndarray, None, None]:
+    """
+    Yields every integer of the `stream` of arrays once, like node IDs
+    of the edges, in bounded memory, as self-loops of `StreamingDedup`.
+    """
+    batches = (
+        EdgesBatch(ids=ids, first=ids, second=ids, weight=np.zeros(len(ids)))
+        for ids in (np.asarray(x, dtype=np.int64) for x in stream)
+    )
+    for batch in StreamingDedup(policy="keep_first", **kwargs)(batches):
+        yield batch.first
@@ -0,0 +1,111 @@
+from dataclasses import dataclass
+from typing import Iterable, Iterator, List, Union
+
+import numpy as np
+
+from networkxternal.helpers.edge import Edge
+
+
+@dataclass
+class EdgesBatch:
+    """
+    A columnar batch of edges, sharing the direction.
+    The `label` is either shared as well, or given per edge as an array.
+    Produced by vectorized parsers and consumed by the bulk writers without
+    materializing an `Edge` object per row, whenever the backend allows it.
+    """
+
+    ids: np.ndarray
+    first: np.ndarray
+    second: np.ndarray
+    weight: np.ndarray
+    is_directed: bool = True
+    label: Union[int, np.ndarray] = -1
+    # Byte offset in the source file right past the last line of the batch,
+    # if the batch ends at a block boundary, or `-1`. Imports resume from it.
+    end_offset: int = -1
+    # ID, that the line right past the batch would get, if `end_offset` is set.
+    # Text formats number the edges by lines, so it's not always the last ID plus one.
+    next_id: int = -1
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def labels(self) -> list:
+        if isinstance(self.label, np.ndarray):
+            return self.label.tolist()
+        return [self.label] * len(self)
+
+    def rows(self) -> Iterator[tuple]:
+        """
+        Yields plain Python tuples in the `EDGE_COLUMNS` order,
+        as most DB drivers can't bind NumPy scalars.
+        """
+        n = len(self)
+        return zip(
+            self.ids.tolist(),
+            self.first.tolist(),
+            self.second.tolist(),
+            [self.is_directed] * n,
+            self.weight.tolist(),
+            self.labels(),
+            [None] * n,
+        )
+
+    def to_edges(self, edge_type: type = Edge) -> List[Edge]:
+        return [
+            edge_type(
+                _id=_id,
+                first=first,
+                second=second,
+                weight=weight,
+                label=label,
+                is_directed=self.is_directed,
+            )
+            for _id, first, second, weight, label in zip(
+                self.ids.tolist(),
+                self.first.tolist(),
+                self.second.tolist(),
+                self.weight.tolist(),
+                self.labels(),
+            )
+        ]
+
+
+def chunks_or_batches(
+    stream: Iterable[Union[Edge, EdgesBatch]],
+    chunk_len: int,
+) -> Iterator[Union[List[Edge], EdgesBatch]]:
+    """
+    Groups individual `Edge`s into lists of up to `chunk_len`,
+    but passes the `EdgesBatch`es through as they are.
+    """
+    buffer = list()
+    for obj in stream:
+        if isinstance(obj, EdgesBatch):
+            if len(buffer):
+                yield buffer
+                buffer = list()
+            yield obj
+        else:
+            buffer.append(obj)
+            if len(buffer) == chunk_len:
+                yield buffer
+                buffer = list()
+    if len(buffer):
+        yield buffer
+
+
+def unpack_edges(
+    stream: Iterable[Union[Edge, EdgesBatch]],
+    edge_type: type = Edge,
+) -> Iterator[Edge]:
+    """
+    Flattens a stream, that may contain `EdgesBatch`es, into individual `Edge`s.
+    Used by backends, that have no columnar fast path.
+    """
+    for obj in stream:
+        if isinstance(obj, EdgesBatch):
+            yield from obj.to_edges(edge_type)
+        else:
+            yield obj
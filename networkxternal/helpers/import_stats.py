@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+from typing import List
+
+
+@dataclass
+class StageStats:
+    """
+    Throughput of one stage of a pipelined import. The time spent blocked
+    on the neighbouring queues is reported separately from the useful work,
+    so the bottleneck is the stage with the least `seconds_waiting`.
+    """
+
+    name: str
+    count_edges: int = 0
+    seconds_busy: float = 0
+    seconds_waiting: float = 0
+
+    def edges_per_second(self) -> float:
+        return self.count_edges / self.seconds_busy if self.seconds_busy > 0 else 0
+
+    def __str__(self) -> str:
+        return (
+            f"{self.name}: {self.count_edges} edges, {self.edges_per_second():.0f} edges/s busy, "
+            f"{self.seconds_busy:.2f}s busy, {self.seconds_waiting:.2f}s waiting"
+        )
+
+
+@dataclass
+class ImportStats:
+    """
+    Throughput of a bulk import, reported by `add_stream`-like methods.
+    """
+
+    count_edges: int = 0
+    count_bytes: int = 0
+    count_compressed_bytes: int = 0
+    seconds: float = 0
+    stages: List[StageStats] = field(default_factory=list)
+
+    def edges_per_second(self) -> float:
+        return self.count_edges / self.seconds if self.seconds > 0 else 0
+
+    def bytes_per_second(self) -> float:
+        return self.count_bytes / self.seconds if self.seconds > 0 else 0
+
+    def compressed_bytes_per_second(self) -> float:
+        return self.count_compressed_bytes / self.seconds if self.seconds > 0 else 0
+
+    def __str__(self) -> str:
+        result = (
+            f"{self.count_edges} edges, {self.count_bytes} bytes in {self.seconds:.2f}s: "
+            f"{self.edges_per_second():.0f} edges/s, {self.bytes_per_second():.0f} bytes/s"
+        )
+        if self.count_compressed_bytes:
+            result += f", {self.compressed_bytes_per_second():.0f} compressed bytes/s"
+        for stage in self.stages:
+            result += f"\n- {stage}"
+        return result
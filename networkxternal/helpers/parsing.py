@@ -1,8 +1,30 @@
+import io
+import os
 import csv
 import sys
-from typing import Generator
+import mmap
+import itertools
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import BinaryIO, Generator, List, Optional, Tuple
+
+import numpy as np
 
 from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch
+from networkxternal.helpers.import_stats import ImportStats
+from networkxternal.helpers.binary_edges import (
+    BINARY_SUFFIX,
+    is_binary_edges_file,
+    write_edges_binary,
+    yield_edges_batches_from_binary,
+)
+from networkxternal.helpers.compression import (
+    DecompressingStream,
+    detect_compression,
+    strip_compression_suffix,
+)
 
 
 def allow_big_csv_fields():
@@ -49,13 +71,478 @@ def yield_edges_from_csv(
             )
 
 
-def import_graph(gdb, filepath: str) -> int:
-    if filepath.endswith(".csv"):
-        if hasattr(gdb, "add_from_csv"):
-            return gdb.add_from_csv(filepath)
-        elif hasattr(gdb, "add_stream"):
-            return gdb.add_stream(
-                yield_edges_from_csv(filepath, edge_type=type(gdb).__edge_type__)
+# Parsed rows of edge lists. Members are read as integers, rather than
+# through `float64`, which would silently round the IDs beyond 2**53.
+EDGES_COLUMNS = np.dtype([("first", "<i8"), ("second", "<i8"), ("weight", "<f8")])
+EDGES_MEMBERS = np.dtype([("first", "<i8"), ("second", "<i8")])
+# Parsed edges with the index of their line in the block, which defines their IDs,
+# as edges are numbered by lines, including the skipped ones.
+EDGES_TABLE = np.dtype(
+    [("first", "<i8"), ("second", "<i8"), ("weight", "<f8"), ("line", "<i8")]
+)
+
+
+def count_lines(block: bytes) -> int:
+    """
+    Number of lines in a block, that was cut right before a newline.
+    """
+    return block.count(b"\n") + 1
+
+
+def load_edges_columns(
+    block: bytes,
+    has_weight: bool,
+    delimiter: Optional[str],
+) -> Optional[np.ndarray]:
+    try:
+        with warnings.catch_warnings():
+            # Blocks of comments only are reported as empty input.
+            warnings.simplefilter("ignore", UserWarning)
+            return np.loadtxt(
+                io.BytesIO(block),
+                dtype=EDGES_COLUMNS if has_weight else EDGES_MEMBERS,
+                delimiter=delimiter,
+                comments="%",
+                usecols=(0, 1, 2) if has_weight else (0, 1),
+                ndmin=1,
+            )
+    except ValueError:
+        return None
+
+
+def parse_edges_block(
+    block: bytes,
+    has_weight: bool = True,
+    delimiter: Optional[str] = ",",
+) -> np.ndarray:
+    """
+    Converts a block of complete lines into an `EDGES_TABLE` array with one
+    bulk call, instead of converting every field separately in Python.
+    With `delimiter=None` fields are separated by any whitespace.
+    Weights are taken from the third column of every line, that has one,
+    unless `has_weight` is false. Extra columns are ignored.
+    Falls back to the slower line-by-line parsing, unless every line is an edge
+    with the same number of columns, like blank lines, comments or missing weights.
+    """
+    count = count_lines(block)
+    parsed = None
+    if has_weight:
+        parsed = load_edges_columns(block, True, delimiter)
+    if parsed is None:
+        # Lines without weights may only be parsed in bulk, if none of them has one.
+        if delimiter is None:
+            count_fields = len(block.split())
+        else:
+            count_fields = block.count(delimiter.encode()) + count
+        if not has_weight or count_fields == 2 * count:
+            parsed = load_edges_columns(block, False, delimiter)
+    if parsed is None or len(parsed) != count:
+        return parse_edges_lines(block, has_weight, delimiter)
+
+    table = np.empty(count, dtype=EDGES_TABLE)
+    table["first"] = parsed["first"]
+    table["second"] = parsed["second"]
+    table["weight"] = parsed["weight"] if parsed.dtype == EDGES_COLUMNS else 1.0
+    table["line"] = np.arange(count)
+    return table
+
+
+def parse_edges_lines(
+    block: bytes,
+    has_weight: bool = True,
+    delimiter: Optional[str] = ",",
+) -> np.ndarray:
+    """
+    Just like `yield_edges_from_csv`, skips the lines without both members
+    and defaults to a unit weight.
+    """
+    table = list()
+    for line, text in enumerate(block.split(b"\n")):
+        text = text.split(b"%", 1)[0]
+        fields = text.split(delimiter.encode()) if delimiter else text.split()
+        if len(fields) < 2:
+            continue
+        weight = 1.0
+        if has_weight and len(fields) > 2 and len(fields[2].strip()):
+            weight = float(fields[2])
+        table.append((int(fields[0]), int(fields[1]), weight, line))
+    return np.array(table, dtype=EDGES_TABLE)
+
+
+def open_edges_file(filepath: str) -> BinaryIO:
+    """
+    Opens a file for binary reading, transparently decompressing
+    `.gz`, `.bz2` and `.xz` inputs in a background thread.
+    """
+    compression = detect_compression(filepath)
+    if compression is None:
+        return open(filepath, "rb")
+    return io.BufferedReader(DecompressingStream(filepath, compression))
+
+
+def record_input_size(stats: Optional[ImportStats], filepath: str, f: BinaryIO):
+    """
+    Reports the size of a fully consumed input file, both before and after decompression.
+    """
+    if stats is None:
+        return
+    if isinstance(f, io.BufferedReader) and isinstance(f.raw, DecompressingStream):
+        stats.count_bytes = f.raw.count_bytes
+        stats.count_compressed_bytes = f.raw.count_compressed_bytes
+    else:
+        stats.count_bytes = os.path.getsize(filepath)
+
+
+def yield_newline_aligned_blocks(
+    f: BinaryIO,
+    block_size: int,
+) -> Generator[bytes, None, None]:
+    """
+    Reads a binary stream in blocks of roughly `block_size`, cut at the last newline,
+    carrying the incomplete line over to the next block.
+    """
+    remainder = b""
+    while True:
+        block = f.read(block_size)
+        if len(block) == 0:
+            if len(remainder):
+                yield remainder
+            return
+        block = remainder + block
+        cut = block.rfind(b"\n")
+        if cut < 0:
+            remainder = block
+            continue
+        remainder = block[cut + 1 :]
+        yield block[:cut]
+
+
+def split_byte_ranges(filepath: str, part_size: int) -> List[Tuple[int, int]]:
+    """
+    Splits the file, past its header line, into `[start, end)` byte ranges
+    of roughly `part_size` bytes, each ending right after a newline.
+    """
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        f.readline()
+        bounds = [f.tell()]
+        while bounds[-1] < size:
+            f.seek(bounds[-1] + part_size - 1)
+            f.readline()
+            bounds.append(min(f.tell(), size))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def parse_edges_range(
+    filepath: str,
+    start: int,
+    end: int,
+) -> Tuple[np.ndarray, int]:
+    """
+    Parses one newline-aligned byte range of a CSV file.
+    Runs in worker processes, so it only returns a picklable array
+    and the number of lines in the range.
+    """
+    with open(filepath, "rb") as f:
+        f.seek(start)
+        block = f.read(end - start)
+    if block.endswith(b"\n"):
+        block = block[:-1]
+    return parse_edges_block(block), count_lines(block)
+
+
+def split_table_into_batches(
+    table: np.ndarray,
+    first_id: int,
+    is_directed: bool,
+    batch_size: int,
+    end_offset: int = -1,
+    next_id: int = -1,
+) -> Generator[EdgesBatch, None, None]:
+    count_rows = len(table)
+    ids = table["line"] + first_id
+    first = np.ascontiguousarray(table["first"])
+    second = np.ascontiguousarray(table["second"])
+    weight = np.ascontiguousarray(table["weight"])
+
+    for start in range(0, count_rows, batch_size):
+        end = start + batch_size
+        yield EdgesBatch(
+            ids=ids[start:end],
+            first=first[start:end],
+            second=second[start:end],
+            weight=weight[start:end],
+            is_directed=is_directed,
+            end_offset=end_offset if end >= count_rows else -1,
+            next_id=next_id if end >= count_rows else -1,
+        )
+
+
+def yield_edges_batches_from_csv(
+    filepath: str,
+    is_directed: bool = True,
+    batch_size: int = 100_000,
+    block_size: int = 1 << 24,
+    processes: int = 1,
+    stats: Optional[ImportStats] = None,
+    start_offset: int = 0,
+    first_id: int = 0,
+) -> Generator[EdgesBatch, None, None]:
+    """
+    Vectorized counterpart of `yield_edges_from_csv`. Reads the file in big binary
+    blocks, cut at the last newline, and converts each of them into NumPy columns.
+    Edges are numbered by their line index, just like in `yield_edges_from_csv`,
+    so skipped lines still take their IDs. The weights are parsed in every line,
+    that has them, regardless of the header.
+    The last batch of every block carries its `end_offset` and the `next_id`,
+    so that parsing can later continue from `start_offset` with that `first_id`.
+
+    With `processes > 1`, the file is split into newline-aligned byte ranges
+    of `block_size`, parsed by a `ProcessPoolExecutor`. The arrays are collected
+    in the original order of ranges, so IDs match the sequential path.
+    Compressed files can't be split and are always parsed sequentially,
+    while decompression runs in a background thread.
+    """
+    is_compressed = detect_compression(filepath) is not None
+    if start_offset > 0 and is_compressed:
+        raise ValueError(f"Can't seek in a compressed file: {filepath}")
+    if processes > 1 and not is_compressed and start_offset == 0:
+        yield from yield_edges_batches_from_csv_in_parallel(
+            filepath,
+            is_directed=is_directed,
+            batch_size=batch_size,
+            block_size=block_size,
+            processes=processes,
+        )
+        record_input_size(stats, filepath, None)
+        return
+
+    with open_edges_file(filepath) as f:
+        offset = len(f.readline())
+        if start_offset > 0:
+            f.seek(start_offset)
+            offset = start_offset
+        for block in yield_newline_aligned_blocks(f, block_size):
+            # Account for the newline, that was cut off.
+            offset += len(block) + 1
+            table = parse_edges_block(block)
+            next_id = first_id + count_lines(block)
+            yield from split_table_into_batches(
+                table,
+                first_id,
+                is_directed,
+                batch_size,
+                end_offset=offset,
+                next_id=next_id,
+            )
+            first_id = next_id
+        record_input_size(stats, filepath, f)
+
+
+def yield_edges_batches_from_csv_in_parallel(
+    filepath: str,
+    is_directed: bool = True,
+    batch_size: int = 100_000,
+    block_size: int = 1 << 24,
+    processes: int = 4,
+) -> Generator[EdgesBatch, None, None]:
+    ranges = split_byte_ranges(filepath, block_size)
+
+    first_id = 0
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        # Keep a bounded window of ranges in flight and consume them in order.
+        pending = list()
+        for start, end in ranges:
+            pending.append(pool.submit(parse_edges_range, filepath, start, end))
+            if len(pending) < 2 * processes:
+                continue
+            table, count = pending.pop(0).result()
+            yield from split_table_into_batches(
+                table, first_id, is_directed, batch_size
+            )
+            first_id += count
+        for future in pending:
+            table, count = future.result()
+            yield from split_table_into_batches(
+                table, first_id, is_directed, batch_size
+            )
+            first_id += count
+
+
+def parse_mtx_header(mm, is_mtx: bool) -> Tuple[int, bool, bool]:
+    """
+    Reads the `%` comment lines at the start of a networkrepository.com `.edges`
+    or a Matrix Market `.mtx` file, given as `bytes` or `mmap`.
+    Returns the offset of the first edge and the `is_directed`, `is_weighted` flags.
+    The `.mtx` size line is skipped.
+    """
+    is_directed, is_weighted = True, True
+    pos = 0
+    while pos < len(mm):
+        end = mm.find(b"\n", pos)
+        end = len(mm) if end < 0 else end
+        line = mm[pos:end].strip()
+        if len(line) and not line.startswith(b"%"):
+            break
+        pos = end + 1
+        tokens = line.lstrip(b"%").lower().split()
+        if b"undirected" in tokens or b"symmetric" in tokens:
+            is_directed = False
+        if b"unweighted" in tokens or b"pattern" in tokens:
+            is_weighted = False
+
+    if is_mtx and pos < len(mm):
+        end = mm.find(b"\n", pos)
+        pos = len(mm) if end < 0 else end + 1
+    return pos, is_directed, is_weighted
+
+
+def yield_mmap_blocks(mm, pos: int, block_size: int) -> Generator[bytes, None, None]:
+    """
+    Cuts the memory-mapped file into newline-aligned blocks, starting from `pos`,
+    searching for newlines in place, so only the yielded lines get copied.
+    """
+    size = len(mm)
+    while pos < size:
+        cut = size
+        if pos + block_size < size:
+            cut = mm.rfind(b"\n", pos, pos + block_size)
+            if cut < 0:
+                cut = mm.find(b"\n", pos + block_size)
+                cut = size if cut < 0 else cut
+        yield mm[pos:cut]
+        pos = cut + 1
+
+
+def split_mtx_blocks_into_batches(
+    blocks,
+    is_directed: bool,
+    is_weighted: bool,
+    batch_size: int,
+) -> Generator[EdgesBatch, None, None]:
+    first_id = 0
+    for block in blocks:
+        table = parse_edges_block(block, is_weighted, delimiter=None)
+        yield from split_table_into_batches(table, first_id, is_directed, batch_size)
+        first_id += count_lines(block)
+
+
+def yield_edges_batches_from_mtx(
+    filepath: str,
+    batch_size: int = 100_000,
+    block_size: int = 1 << 24,
+    stats: Optional[ImportStats] = None,
+) -> Generator[EdgesBatch, None, None]:
+    """
+    Parses space-separated `.edges` and `.mtx` files into `EdgesBatch`es,
+    taking the direction and weights from the `%` header.
+    The file is memory-mapped and scanned for newlines in place, so only
+    the lines of the current block are copied before being parsed.
+    Compressed files are streamed through a background decompression thread instead.
+    Extra columns, like timestamps, are ignored.
+    """
+    if os.path.getsize(filepath) == 0:
+        return
+    is_mtx = strip_compression_suffix(filepath).endswith(".mtx")
+
+    if detect_compression(filepath) is not None:
+        with open_edges_file(filepath) as f:
+            blocks = yield_newline_aligned_blocks(f, block_size)
+            # The header is expected to fit into the first block.
+            head = next(blocks, b"")
+            pos, is_directed, is_weighted = parse_mtx_header(head, is_mtx)
+            if pos < len(head):
+                blocks = itertools.chain([head[pos:]], blocks)
+            yield from split_mtx_blocks_into_batches(
+                blocks, is_directed, is_weighted, batch_size
             )
+            record_input_size(stats, filepath, f)
+        return
+
+    with open(filepath, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mm:
+        pos, is_directed, is_weighted = parse_mtx_header(mm, is_mtx)
+        yield from split_mtx_blocks_into_batches(
+            yield_mmap_blocks(mm, pos, block_size),
+            is_directed,
+            is_weighted,
+            batch_size,
+        )
+        record_input_size(stats, filepath, f)
+
+
+def yield_edges_batches_from_file(
+    filepath: str,
+    processes: int = 1,
+    stats: Optional[ImportStats] = None,
+) -> Optional[Generator[EdgesBatch, None, None]]:
+    """
+    Picks the parser by the file extension, ignoring the compression suffix.
+    Returns `None` for unsupported formats.
+    """
+    name = strip_compression_suffix(filepath)
+    if name.endswith(".csv"):
+        return yield_edges_batches_from_csv(filepath, processes=processes, stats=stats)
+    elif name.endswith((".edges", ".mtx")):
+        return yield_edges_batches_from_mtx(filepath, stats=stats)
+    elif filepath.endswith(BINARY_SUFFIX):
+        return yield_edges_batches_from_binary(filepath, stats=stats)
+    return None
+
+
+def convert_to_binary(filepath: str, target_path: Optional[str] = None) -> str:
+    """
+    Converts any supported edge list into the fixed-width binary format once,
+    so that repeated imports into different backends skip the text parsing.
+    The result is reused, while it's newer than the source file.
+    """
+    if target_path is None:
+        target_path = strip_compression_suffix(filepath) + BINARY_SUFFIX
+    is_fresh = os.path.exists(target_path) and os.path.getmtime(
+        target_path
+    ) >= os.path.getmtime(filepath)
+    if is_fresh and is_binary_edges_file(target_path):
+        return target_path
+    stream = yield_edges_batches_from_file(filepath)
+    if stream is None:
+        raise ValueError(f"Unsupported edge list format: {filepath}")
+    # Write into a temporary file, so an interrupted conversion is never reused.
+    partial_path = target_path + ".partial"
+    write_edges_binary(stream, partial_path)
+    os.replace(partial_path, target_path)
+    return target_path
+
+
+def import_graph(gdb, filepath: str, processes: int = 1, writers: int = 0) -> int:
+    """
+    Imports a file into any backend. With `processes > 1`, CSV files
+    are parsed in parallel, while the backend keeps consuming the batches.
+    With `writers > 0`, the import goes through `add_stream_pipelined`,
+    so parsing and DB writes overlap, and the stats of every stage are kept.
+    Compressed files are detected by their magic bytes and decompressed on the fly.
+    Files in the binary format of `convert_to_binary` are memory-mapped.
+    The throughput in both compressed and uncompressed bytes is reported
+    in `gdb.last_import_stats`.
+    """
+    name = strip_compression_suffix(filepath)
+    is_compressed = detect_compression(filepath) is not None
+    # Server-side CSV loaders can't deduplicate the edges of simple graphs.
+    can_load_directly = not is_compressed and getattr(gdb, "multigraph", True)
+    if name.endswith(".csv") and hasattr(gdb, "add_from_csv") and can_load_directly:
+        return gdb.add_from_csv(filepath)
+
+    stats = ImportStats()
+    start = perf_counter()
+    stream = yield_edges_batches_from_file(filepath, processes=processes, stats=stats)
+    if stream is None:
+        return 0
 
-    return 0
+    if writers > 0:
+        stats.count_edges = gdb.add_stream_pipelined(stream, writers=writers)
+        stats.stages = gdb.last_import_stats.stages
+    else:
+        stats.count_edges = gdb.add_stream(stream)
+    stats.seconds = perf_counter() - start
+    gdb.last_import_stats = stats
+    return stats.count_edges
@@ -0,0 +1,157 @@
+import queue
+import threading
+from time import perf_counter
+from typing import Iterable, List, Union
+
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, chunks_or_batches
+from networkxternal.helpers.import_stats import ImportStats, StageStats
+
+# Marks the end of the data in a queue between stages.
+END = object()
+
+
+class StopPipeline(Exception):
+    pass
+
+
+class ImportPipeline:
+    """
+    Overlaps the three steps of a bulk import, that `add_stream` runs one after another:
+    1.  The reader thread pulls objects from the stream, so that is where parsing happens.
+    2.  The builder thread groups them into chunks of `__max_batch_size__`.
+    3.  The `writers` threads send the chunks to the DB through `add` or `add_batch`,
+        each with its own session or connection, as provided by the backend.
+
+    The stages are connected by bounded queues. When the DB falls behind,
+    the queues fill up and block the producers, so no more than
+    `queue_size` parsed items and `2 * writers` chunks are kept in memory.
+    The first failure in any stage stops the whole pipeline and is re-raised.
+    """
+
+    # Individual `Edge`s are passed between threads in small groups,
+    # to amortize the synchronization costs.
+    __group_size__ = 1024
+
+    def __init__(self, gdb, writers: int = 4, queue_size: int = 16, upsert=True):
+        self.gdb = gdb
+        self.writers = max(1, writers)
+        self.upsert = upsert
+        self.parsed = queue.Queue(queue_size)
+        self.chunks = queue.Queue(2 * self.writers)
+        self.stopped = threading.Event()
+        self.errors = list()
+        self.stats = ImportStats()
+
+    def run(self, stream: Iterable[Union[Edge, EdgesBatch]]) -> int:
+        start = perf_counter()
+        reader = StageStats("reader")
+        builder = StageStats("builder")
+        writers = [StageStats(f"writer {i}") for i in range(self.writers)]
+        threads = [
+            threading.Thread(target=self.guard, args=(self.read, stream, reader)),
+            threading.Thread(target=self.guard, args=(self.build, builder)),
+        ]
+        threads += [
+            threading.Thread(target=self.guard, args=(self.write, w)) for w in writers
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        if len(self.errors):
+            raise self.errors[0]
+
+        count_edges = sum(w.count_edges for w in writers)
+        self.stats = ImportStats(
+            count_edges=count_edges,
+            seconds=perf_counter() - start,
+            stages=[reader, builder, *writers],
+        )
+        return count_edges
+
+    # region Stages
+
+    def read(self, stream, stats: StageStats):
+        objs = iter(chunks_or_batches(stream, ImportPipeline.__group_size__))
+        while True:
+            t0 = perf_counter()
+            obj = next(objs, END)
+            stats.seconds_busy += perf_counter() - t0
+            if obj is END:
+                break
+            self.put(self.parsed, obj, stats)
+            stats.count_edges += len(obj)
+        self.put(self.parsed, END, stats)
+
+    def build(self, stats: StageStats):
+        def flattened():
+            while True:
+                obj = self.get(self.parsed, stats)
+                if obj is END:
+                    return
+                if isinstance(obj, EdgesBatch):
+                    yield obj
+                else:
+                    yield from obj
+
+        chunk_len = type(self.gdb).__max_batch_size__
+        t0 = perf_counter()
+        waiting = stats.seconds_waiting
+        for es in chunks_or_batches(flattened(), chunk_len):
+            self.put(self.chunks, es, stats)
+            stats.count_edges += len(es)
+        stats.seconds_busy += perf_counter() - t0 - (stats.seconds_waiting - waiting)
+        for _ in range(self.writers):
+            self.put(self.chunks, END, stats)
+
+    def write(self, stats: StageStats):
+        while True:
+            es = self.get(self.chunks, stats)
+            if es is END:
+                break
+            t0 = perf_counter()
+            if isinstance(es, EdgesBatch):
+                stats.count_edges += self.gdb.add_batch(es, upsert=self.upsert)
+            else:
+                stats.count_edges += self.gdb.add(es, upsert=self.upsert)
+            stats.seconds_busy += perf_counter() - t0
+
+    # region Helpers
+
+    def guard(self, stage, *args):
+        try:
+            stage(*args)
+        except StopPipeline:
+            pass
+        except Exception as e:
+            print(e)
+            self.errors.append(e)
+            self.stopped.set()
+
+    def put(self, q: queue.Queue, obj, stats: StageStats):
+        t0 = perf_counter()
+        try:
+            while True:
+                if self.stopped.is_set():
+                    raise StopPipeline()
+                try:
+                    q.put(obj, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+        finally:
+            stats.seconds_waiting += perf_counter() - t0
+
+    def get(self, q: queue.Queue, stats: StageStats) -> Union[List[Edge], EdgesBatch]:
+        t0 = perf_counter()
+        try:
+            while True:
+                if self.stopped.is_set():
+                    raise StopPipeline()
+                try:
+                    return q.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+        finally:
+            stats.seconds_waiting += perf_counter() - t0
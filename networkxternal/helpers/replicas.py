@@ -0,0 +1,106 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+
+class ReplicaRouter:
+    """
+    Picks one of the read replicas for every read query, while writes stay on the primary.
+    The replicas themselves are owned by the backend, the router only deals with indexes.
+
+    Policies:
+    *   `round_robin` cycles through the replicas.
+    *   `latency` picks the replica with the lowest moving average of query durations.
+        Replicas that were never measured are tried first.
+
+    With `sticky_seconds > 0`, a thread that has just written to the primary keeps
+    reading from it for that long, so it always observes its own writes,
+    regardless of the replication lag.
+    """
+
+    __policies__ = ("round_robin", "latency")
+
+    def __init__(
+        self,
+        count_replicas: int,
+        policy: str = "round_robin",
+        sticky_seconds: float = 0,
+        smoothing: float = 0.2,
+    ):
+        assert policy in ReplicaRouter.__policies__, f"Unknown policy: {policy}"
+        self.count_replicas = count_replicas
+        self.policy = policy
+        self.sticky_seconds = sticky_seconds
+        self.smoothing = smoothing
+        self.latencies = [0.0] * count_replicas
+        self.next_replica = 0
+        self.lock = threading.Lock()
+        self.thread_local = threading.local()
+
+    def __len__(self) -> int:
+        return self.count_replicas
+
+    def mark_write(self):
+        if self.sticky_seconds > 0:
+            self.thread_local.last_write = time.monotonic()
+
+    def is_sticky(self) -> bool:
+        if getattr(self.thread_local, "pinned", 0) > 0:
+            return True
+        if self.sticky_seconds <= 0:
+            return False
+        last_write = getattr(self.thread_local, "last_write", None)
+        if last_write is None:
+            return False
+        return time.monotonic() - last_write < self.sticky_seconds
+
+    def pick(self) -> Optional[int]:
+        """
+        Returns the index of the replica to read from, or `None` for the primary.
+        """
+        if self.count_replicas == 0 or self.is_sticky():
+            return None
+        with self.lock:
+            if self.policy == "latency":
+                return min(
+                    range(self.count_replicas),
+                    key=self.latencies.__getitem__,
+                )
+            i = self.next_replica
+            self.next_replica = (i + 1) % self.count_replicas
+            return i
+
+    def report(self, i: int, seconds: float):
+        with self.lock:
+            old = self.latencies[i]
+            if old == 0:
+                self.latencies[i] = seconds
+            else:
+                self.latencies[i] = old + self.smoothing * (seconds - old)
+
+    @contextmanager
+    def route(self):
+        """
+        Yields the index of the replica to read from, or `None` for the primary,
+        timing the query to feed the `latency` policy.
+        """
+        i = self.pick()
+        if i is None:
+            yield None
+            return
+        start = time.perf_counter()
+        yield i
+        self.report(i, time.perf_counter() - start)
+
+    @contextmanager
+    def pinned(self):
+        """
+        Sends all the reads of the current thread to the primary within the block.
+        Used by write paths, that read back the state they have just changed.
+        """
+        self.thread_local.pinned = getattr(self.thread_local, "pinned", 0) + 1
+        try:
+            yield
+        finally:
+            self.thread_local.pinned -= 1
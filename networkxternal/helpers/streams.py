@@ -0,0 +1,101 @@
+import io
+import csv
+import json
+from typing import Iterable
+
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, chunks_or_batches
+
+# The order of columns in `main_edges` and `new_edges` SQL tables.
+EDGE_COLUMNS = (
+    "_id",
+    "first",
+    "second",
+    "is_directed",
+    "weight",
+    "label",
+    "payload_json",
+)
+# The order of columns in the `main_nodes` SQL table.
+NODE_COLUMNS = ("_id", "weight", "label", "payload_json")
+
+
+class SerializedStream(io.RawIOBase):
+    """
+    Exposes a lazily-serialized stream of objects as a readable binary file.
+    Lets database drivers (like `psycopg2.copy_expert`) pull the data directly
+    from a generator, without materializing a temporary file on disk.
+    Subclasses define the `header`, `serialize` and `trailer` methods,
+    and may override `serialize_batch` to encode an `EdgesBatch` column-wise.
+    """
+
+    def __init__(self, objs: Iterable[object], rows_per_chunk: int = 10000):
+        io.RawIOBase.__init__(self)
+        self.parts = chunks_or_batches(objs, rows_per_chunk)
+        self.buffer = memoryview(self.header())
+        self.count_rows = 0
+        self.count_bytes = 0
+        self.finished = False
+
+    def header(self) -> bytes:
+        return b""
+
+    def serialize(self, objs: list) -> bytes:
+        raise NotImplementedError()
+
+    def serialize_batch(self, batch: EdgesBatch) -> bytes:
+        return self.serialize(batch.to_edges())
+
+    def trailer(self) -> bytes:
+        return b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        while len(self.buffer) == 0 and not self.finished:
+            objs = next(self.parts, None)
+            if objs is None:
+                self.finished = True
+                self.buffer = memoryview(self.trailer())
+            elif isinstance(objs, EdgesBatch):
+                self.count_rows += len(objs)
+                self.buffer = memoryview(self.serialize_batch(objs))
+            else:
+                self.count_rows += len(objs)
+                self.buffer = memoryview(self.serialize(objs))
+
+        n = min(len(b), len(self.buffer))
+        b[:n] = self.buffer[:n]
+        self.buffer = self.buffer[n:]
+        self.count_bytes += n
+        return n
+
+
+class EdgesCSVStream(SerializedStream):
+    """
+    Serializes `Edge`s into headerless CSV rows with `EDGE_COLUMNS` order.
+    Booleans are exported as `0`/`1`, as it's the only spelling
+    understood by both PostgreSQL and MySQL.
+    """
+
+    def __init__(self, edges: Iterable[Edge], null: str = "", **kwargs):
+        self.null = null
+        SerializedStream.__init__(self, edges, **kwargs)
+
+    def serialize(self, es: list) -> bytes:
+        f = io.StringIO()
+        writer = csv.writer(f, lineterminator="\n")
+        writer.writerows(
+            (
+                e._id,
+                e.first,
+                e.second,
+                int(e.is_directed),
+                e.weight,
+                e.label,
+                json.dumps(e.payload) if e.payload else self.null,
+            )
+            for e in es
+        )
+        return f.getvalue().encode()
@@ -1,4 +1,7 @@
-from typing import Optional, Set, Sequence
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from time import perf_counter
+from typing import Optional, Set, Sequence, Tuple
 
 # Properties of every entry are: 'from_id', 'to_id', 'weight'
 # There are indexes by find keys.
@@ -10,7 +13,14 @@ from networkxternal.base_api import BaseAPI
 from networkxternal.helpers.edge import Edge
 from networkxternal.helpers.node import Node
 from networkxternal.helpers.graph_degree import GraphDegree
-from networkxternal.helpers.algorithms import is_sequence_of, extract_database_name
+from networkxternal.helpers.import_stats import ImportStats
+from networkxternal.helpers.edges_batch import EdgesBatch, chunks_or_batches
+from networkxternal.helpers.algorithms import (
+    is_sequence_of,
+    extract_database_name,
+)
+from networkxternal.helpers.replicas import ReplicaRouter
+from networkxternal.helpers.checkpoints import ImportCheckpoint
 
 
 class MongoDB(BaseAPI):
@@ -27,37 +37,92 @@ class MongoDB(BaseAPI):
     __is_concurrent__ = True
     __edge_type__ = Edge
     __node_type__ = Node
-
-    def __init__(self, url="mongodb://localhost:27017/graph", **kwargs):
+    __edges_collection_name__ = "edges"
+    __duplicate_key_error__ = 11000
+    # Compound indexes, that cover degree computations for both edge directions.
+    __index_outgoing__ = "first_second_weight"
+    __index_incoming__ = "second_first_weight"
+
+    def __init__(
+        self,
+        url="mongodb://localhost:27017/graph",
+        max_pool_size=100,
+        min_pool_size=0,
+        read_urls=(),
+        read_policy="round_robin",
+        read_your_writes_seconds=0,
+        read_preference=None,
+        writers=4,
+        **kwargs,
+    ):
+        """
+        `MongoClient` is thread-safe and shares one connection pool between threads,
+        so concurrent readers only need a large enough `max_pool_size`.
+        https://pymongo.readthedocs.io/en/stable/faq.html#how-does-connection-pooling-work-in-pymongo
+
+        Members of a replica set are best reached through a single client,
+        with a `read_preference` like `"secondaryPreferred"` or `"nearest"`.
+        Independent replicas can be listed in `read_urls` instead, and the reads
+        are routed between them with a `ReplicaRouter`.
+        https://www.mongodb.com/docs/manual/core/read-preference/
+
+        The `writers` threads are used by `add_stream` for concurrent batches.
+        """
         BaseAPI.__init__(self, **kwargs)
+        self.writers = writers
         _, db_name = extract_database_name(url)
-        self.db = MongoClient(url)
-        self.edges_collection = self.db[db_name]["edges"]
+        client_options = dict(maxPoolSize=max_pool_size, minPoolSize=min_pool_size)
+        if read_preference is not None:
+            client_options["readPreference"] = read_preference
+        self.db = MongoClient(url, **client_options)
+        self.edges_collection = self.db[db_name][self.__edges_collection_name__]
         self.nodes_collection = self.db[db_name]["nodes"]
+        self.checkpoints_collection = self.db[db_name]["import_checkpoints"]
+        self.read_collections = list()
+        for read_url in read_urls:
+            _, read_db_name = extract_database_name(read_url)
+            read_db = MongoClient(read_url, **client_options)[read_db_name]
+            self.read_collections.append(
+                (read_db[self.__edges_collection_name__], read_db["nodes"])
+            )
+        self.replicas = ReplicaRouter(
+            len(self.read_collections),
+            policy=read_policy,
+            sticky_seconds=read_your_writes_seconds,
+        )
         self.create_index()
 
     # region Metadata
 
     def reduce_nodes(self) -> GraphDegree:
-        result = self.nodes_collection.aggregate(pipeline=[self.pipe_compute_degree()])
-        result = list(result)
+        with self.get_read_collections() as (_, nodes):
+            result = list(nodes.aggregate(pipeline=[self.pipe_compute_degree()]))
         if len(result) == 0:
             return GraphDegree(0, 0)
         return GraphDegree(result[0]["count"], result[0]["weight"])
 
     def reduce_edges(self, u=None, v=None, key=None) -> GraphDegree:
-        result = self.edges_collection.aggregate(
-            pipeline=[
-                step
-                for step in [
-                    self.pipe_match_edge_members(u, v),
-                    self.pipe_match_label(key),
-                    self.pipe_compute_degree(),
-                ]
-                if step
+        """
+        Unweighted graphs only need a `count_documents`, which the compound
+        indexes answer without touching the documents. Otherwise the weights
+        are summed in an aggregation, still covered by the same indexes.
+        """
+        match, hint = self.filter_edges(u, v, key)
+        options = dict(hint=hint) if hint else dict()
+        with self.get_read_collections() as (edges, _):
+            if not self.weighted:
+                if len(match) == 0:
+                    count = edges.estimated_document_count()
+                else:
+                    count = edges.count_documents(match, **options)
+                return GraphDegree(count, count)
+
+            pipeline = [
+                {"$match": match},
+                {"$project": {"_id": 0, "weight": 1}},
+                self.pipe_compute_degree(),
             ]
-        )
-        result = list(result)
+            result = list(edges.aggregate(pipeline=pipeline, **options))
         if len(result) == 0:
             return GraphDegree(0, 0)
         return GraphDegree(result[0]["count"], result[0]["weight"])
@@ -76,84 +141,103 @@ class MongoDB(BaseAPI):
 
     @property
     def nodes(self) -> Sequence[Node]:
-        return [Node(**as_dict) for as_dict in self.nodes_collection.find()]
+        with self.get_read_collections() as (_, nodes):
+            return [Node(**as_dict) for as_dict in nodes.find()]
 
     @property
     def edges(self) -> Sequence[Edge]:
-        return [Edge(**as_dict) for as_dict in self.edges_collection.find()]
+        with self.get_read_collections() as (edges, _):
+            return [Edge(**as_dict) for as_dict in edges.find()]
 
     @property
     def out_edges(self) -> Sequence[Edge]:
-        result = self.edges_collection.find(
-            filter={
-                "is_directed": True,
-            }
-        )
-        return [Edge(**as_dict) for as_dict in result]
+        with self.get_read_collections() as (edges, _):
+            result = edges.find(
+                filter={
+                    "is_directed": True,
+                }
+            )
+            return [Edge(**as_dict) for as_dict in result]
 
     @property
     def mentioned_nodes_ids(self) -> Sequence[int]:
-        ids = set()
-        # Calling `.distinct('first')` on the query object fails,
-        # as the result BSON will be beyond 16 MB.
-        for doc in self.edges_collection.find({}, {"_id": 0, "first": 1}):
-            ids.add(doc["first"])
-        for doc in self.edges_collection.find({}, {"_id": 0, "second": 1}):
-            ids.add(doc["second"])
-        return ids
+        """
+        Calling `.distinct('first')` on the query object fails,
+        as the result BSON will be beyond 16 MB. So the unique IDs are
+        grouped on the server, spilling to disk if needed,
+        and only those are streamed back with a cursor.
+        """
+        with self.get_read_collections() as (edges, _):
+            result = edges.aggregate(
+                pipeline=self.pipe_mentioned_nodes_ids(),
+                allowDiskUse=True,
+            )
+            return {doc["_id"] for doc in result}
 
     # region Random Reads
 
     def has_node(self, n) -> Optional[Node]:
         n = self.make_node_id(n)
-        result = self.nodes_collection.find_one(
-            filter={
-                "_id": n,
-            }
-        )
+        with self.get_read_collections() as (_, nodes):
+            result = nodes.find_one(
+                filter={
+                    "_id": n,
+                }
+            )
         if result:
             return Node(**result)
         return None
 
     def has_edge(self, u, v, key=None) -> Sequence[Edge]:
-        result = self.edges_collection.aggregate(
-            pipeline=[
-                step
-                for step in [
-                    self.pipe_match_edge_members(u, v),
-                    self.pipe_match_label(key),
-                ]
-                if step
-            ]
-        )
-        return [Edge(**as_dict) for as_dict in result]
+        match, hint = self.filter_edges(u, v, key)
+        with self.get_read_collections() as (edges, _):
+            result = edges.find(match)
+            if hint:
+                result = result.hint(hint)
+            return [Edge(**as_dict) for as_dict in result]
+
+    def neighbors(self, n) -> Set[int]:
+        """
+        Only transfers the IDs of the opposite members with `distinct`,
+        instead of the full edge documents.
+        """
+        n = self.make_node_id(n)
+        with self.get_read_collections() as (edges, _):
+            result = set(edges.distinct("second", {"first": n}))
+            result.update(edges.distinct("first", {"second": n}))
+        result.discard(n)
+        return result
+
+    def successors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        n = self.make_node_id(n)
+        with self.get_read_collections() as (edges, _):
+            result = set(edges.distinct("second", {"first": n}))
+        result.discard(n)
+        return result
+
+    def predecessors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        n = self.make_node_id(n)
+        with self.get_read_collections() as (edges, _):
+            result = set(edges.distinct("first", {"second": n}))
+        result.discard(n)
+        return result
 
     def neighbors_of_group(self, vs: Sequence[int]) -> Set[int]:
         vs_set = set(vs)
         vs = list(vs_set)
-        result = self.edges_collection.find(
-            filter={
-                "$or": [
-                    {
-                        "first": {"$in": vs},
-                    },
-                    {
-                        "second": {"$in": vs},
-                    },
-                ],
-            },
-            projection={
-                "first": 1,
-                "second": 1,
-            },
-        )
-        es = [Edge(**as_dict) for as_dict in result]
-        vs_unique = self.unique_members_of_edges(es)
-        return vs_unique.difference(vs_set)
+        with self.get_read_collections() as (edges, _):
+            result = set(edges.distinct("second", {"first": {"$in": vs}}))
+            result.update(edges.distinct("first", {"second": {"$in": vs}}))
+        return result.difference(vs_set)
 
     # region Random Writes
 
     def add(self, obj, upsert=True) -> int:
+        self.replicas.mark_write()
         is_edge = isinstance(obj, Edge)
         is_node = isinstance(obj, Node)
         is_edges = is_sequence_of(obj, Edge)
@@ -181,38 +265,29 @@ class MongoDB(BaseAPI):
                 return target.insert_one(obj.__dict__).acknowledged
 
         # Many objects.
+        # Plain inserts are much cheaper than upserts, so we try them first.
+        # With `ordered=False` the server continues past duplicate keys,
+        # and only those are retried as updates.
         elif is_edges or is_nodes:
-            if upsert:
-
-                def make_upsert(o):
-                    return UpdateOne(
-                        filter={
-                            "_id": o._id,
-                        },
-                        update={
-                            "$set": o.__dict__,
-                        },
-                        upsert=True,
-                    )
-
-                ops = list(map(make_upsert, obj))
-                try:
-                    result = target.bulk_write(requests=ops, ordered=False)
-                    cnt_old = result.bulk_api_result["nUpserted"]
-                    cnt_new = result.bulk_api_result["nInserted"]
-                    return cnt_new + cnt_old
-                except pymongo.errors.BulkWriteError as bwe:
-                    print(bwe)
-                    print(bwe.details["writeErrors"])
-                    return 0
-            else:
-                obj = [o.__dict__ for o in obj]
-                result = target.insert_many(obj, ordered=False)
-                return len(result.inserted_ids)
+            docs = [o.__dict__ for o in obj]
+            try:
+                return len(target.insert_many(docs, ordered=False).inserted_ids)
+            except pymongo.errors.BulkWriteError as bwe:
+                count = bwe.details["nInserted"]
+                duplicates = list()
+                for error in bwe.details["writeErrors"]:
+                    if error["code"] == MongoDB.__duplicate_key_error__:
+                        duplicates.append(docs[error["index"]])
+                    else:
+                        print(error)
+                if not upsert or len(duplicates) == 0:
+                    return count
+                return count + self.update_many_docs(target, duplicates)
 
         return super().add(obj, upsert=upsert)
 
     def remove(self, obj) -> int:
+        self.replicas.mark_write()
         is_edge = isinstance(obj, Edge)
         is_node = isinstance(obj, Node)
         is_edges = is_sequence_of(obj, Edge)
@@ -245,12 +320,21 @@ class MongoDB(BaseAPI):
             ).deleted_count
 
     def remove_node(self, n) -> int:
-        self.remove(self.make_node(n))
+        return self.remove_nodes([n])
+
+    def remove_nodes(self, vs) -> int:
+        ids = [self.make_node_id(v) for v in vs]
+        self.replicas.mark_write()
+        self.nodes_collection.delete_many(
+            filter={
+                "_id": {"$in": ids},
+            }
+        )
         result = self.edges_collection.delete_many(
             filter={
                 "$or": [
-                    {"first": n},
-                    {"second": n},
+                    {"first": {"$in": ids}},
+                    {"second": {"$in": ids}},
                 ]
             }
         )
@@ -258,22 +342,161 @@ class MongoDB(BaseAPI):
 
     # region Bulk Writes
 
+    def add_missing_nodes(self) -> int:
+        """
+        Unlike the default implementation, the IDs never leave the server:
+        they are grouped and `$merge`-d into the nodes collection,
+        keeping the nodes that already exist.
+        https://www.mongodb.com/docs/manual/reference/operator/aggregation/merge/
+        """
+        self.replicas.mark_write()
+        defaults = self.make_node(0).__dict__
+        cnt = self.nodes_collection.count_documents({})
+        self.edges_collection.aggregate(
+            pipeline=[
+                *self.pipe_mentioned_nodes_ids(),
+                {
+                    "$project": {
+                        k: {"$literal": v} for k, v in defaults.items() if k != "_id"
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": self.nodes_collection.name,
+                        "on": "_id",
+                        "whenMatched": "keepExisting",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ],
+            allowDiskUse=True,
+        )
+        return self.nodes_collection.count_documents({}) - cnt
+
+    def add_stream(self, stream, upsert=True) -> int:
+        """
+        Batches of `__max_batch_size__` edges are written by a pool of `writers` threads,
+        as `MongoClient` is thread-safe and the server handles concurrent batches
+        much better than a single Python thread can feed it.
+        At most `2 * writers` batches are kept in flight, to bound the memory usage.
+        """
+        start = perf_counter()
+        count_edges_added = 0
+        chunk_len = type(self).__max_batch_size__
+        with ThreadPoolExecutor(max_workers=self.writers) as pool:
+            pending = set()
+            for es in chunks_or_batches(self.unique_edges(stream), chunk_len):
+                if len(pending) >= 2 * self.writers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    count_edges_added += sum(f.result() for f in done)
+                if isinstance(es, EdgesBatch):
+                    pending.add(pool.submit(self.add_batch, es, upsert))
+                else:
+                    pending.add(pool.submit(self.add, es, upsert))
+            count_edges_added += sum(f.result() for f in pending)
+        self.add_missing_nodes()
+        self.last_import_stats = ImportStats(
+            count_edges=count_edges_added,
+            seconds=perf_counter() - start,
+        )
+        return count_edges_added
+
+    def save_checkpoint(self, checkpoint: ImportCheckpoint):
+        doc = checkpoint.__dict__.copy()
+        doc["_id"] = f"{checkpoint.source}#{checkpoint.worker}"
+        self.checkpoints_collection.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+
+    def load_checkpoints(self, source: str) -> Sequence[ImportCheckpoint]:
+        docs = self.checkpoints_collection.find({"source": source}, {"_id": 0})
+        return [ImportCheckpoint(**doc) for doc in docs]
+
+    def clear_checkpoints(self, source: str):
+        self.checkpoints_collection.delete_many({"source": source})
+
     def clear_edges(self):
+        """
+        Dropping the collection is much faster than deleting the documents,
+        but it also drops the indexes, that the queries `hint`, so they are rebuilt.
+        """
+        self.replicas.mark_write()
         self.edges_collection.drop()
+        self.create_index()
 
     def clear(self):
+        self.replicas.mark_write()
         self.edges_collection.drop()
         self.nodes_collection.drop()
+        self.create_index()
 
     # region Helpers
 
+    def update_many_docs(self, target, docs: Sequence[dict]) -> int:
+        def make_upsert(doc):
+            return UpdateOne(
+                filter={
+                    "_id": doc["_id"],
+                },
+                update={
+                    "$set": doc,
+                },
+                upsert=True,
+            )
+
+        try:
+            result = target.bulk_write(
+                requests=list(map(make_upsert, docs)), ordered=False
+            )
+            return result.matched_count + result.upserted_count
+        except pymongo.errors.BulkWriteError as bwe:
+            print(bwe)
+            print(bwe.details["writeErrors"])
+            return bwe.details["nMatched"] + bwe.details["nUpserted"]
+
+    @contextmanager
+    def get_read_collections(self):
+        """
+        Yields the `edges` and `nodes` collections to read from:
+        either the primary ones or those of one of the replicas.
+        Writes always go to `edges_collection` and `nodes_collection`.
+        """
+        with self.replicas.route() as i:
+            if i is None:
+                yield self.edges_collection, self.nodes_collection
+            else:
+                yield self.read_collections[i]
+
     def create_index(self, background=False):
-        self.edges_collection.create_index("first", background=background, sparse=True)
-        self.edges_collection.create_index("second", background=background, sparse=True)
+        # The compound indexes replace the single-field ones on `first` and `second`,
+        # as those are their prefixes.
+        self.edges_collection.create_index(
+            [
+                ("first", pymongo.ASCENDING),
+                ("second", pymongo.ASCENDING),
+                ("weight", pymongo.ASCENDING),
+            ],
+            name=MongoDB.__index_outgoing__,
+            background=background,
+        )
+        self.edges_collection.create_index(
+            [
+                ("second", pymongo.ASCENDING),
+                ("first", pymongo.ASCENDING),
+                ("weight", pymongo.ASCENDING),
+            ],
+            name=MongoDB.__index_incoming__,
+            background=background,
+        )
         self.edges_collection.create_index(
             "is_directed", background=background, sparse=True
         )
 
+    def pipe_mentioned_nodes_ids(self) -> list:
+        return [
+            {"$project": {"_id": 0, "ids": ["$first", "$second"]}},
+            {"$unwind": "$ids"},
+            {"$group": {"_id": "$ids"}},
+        ]
+
     def pipe_compute_degree(self) -> dict:
         return {
             "$group": {
@@ -283,46 +506,41 @@ class MongoDB(BaseAPI):
             }
         }
 
-    def pipe_match_edge_containing(self, n) -> dict:
-        return {
-            "$match": {
-                "$or": [{"first": n}, {"second": n}],
-            }
-        }
-
-    def pipe_match_edge_members(self, u, v) -> dict:
+    def filter_edges(self, u, v, key) -> Tuple[dict, Optional[str]]:
+        """
+        Builds the `find` filter for edges between `u` and `v` with the `key` label,
+        and the name of the compound index to `hint`, if it's obvious.
+        The `$or` filters are left to the query planner, as every branch
+        picks its own index.
+        """
         u = self.make_node_id(u)
         v = self.make_node_id(v)
+        result, hint = dict(), None
         if u < 0 and v < 0:
-            return None
+            pass
         elif u < 0 or v < 0:
             if not self.directed:
-                return self.pipe_match_edge_containing(max(u, v))
+                result = self.filter_edges_containing(max(u, v))
             elif u < 0:
-                return {"$match": {"second": v}}
+                result, hint = {"second": v}, MongoDB.__index_incoming__
             elif v < 0:
-                return {"$match": {"first": u}}
+                result, hint = {"first": u}, MongoDB.__index_outgoing__
+        elif u == v:
+            result = self.filter_edges_containing(u)
+        elif self.directed:
+            result, hint = {"first": u, "second": v}, MongoDB.__index_outgoing__
         else:
-            if self.directed:
-                if u == v:
-                    return self.pipe_match_edge_containing(u)
-                else:
-                    return {"$match": {"first": u, "second": v}}
-            else:
-                if u == v:
-                    return self.pipe_match_edge_containing(u)
-                else:
-                    return {
-                        "$match": {
-                            "$or": [
-                                {"first": u, "second": v},
-                                {"first": v, "second": u},
-                            ]
-                        }
-                    }
+            result = {
+                "$or": [
+                    {"first": u, "second": v},
+                    {"first": v, "second": u},
+                ]
+            }
 
-    def pipe_match_label(self, key):
         key = self.make_label(key)
-        if key < 0:
-            return None
-        return {"$match": {"label": key}}
+        if key >= 0:
+            result["label"] = key
+        return result, hint
+
+    def filter_edges_containing(self, n) -> dict:
+        return {"$or": [{"first": n}, {"second": n}]}
@@ -0,0 +1,491 @@
+from collections import defaultdict
+from typing import Optional, Set, Sequence, List
+
+import pymongo
+from pymongo import UpdateOne, UpdateMany
+
+from networkxternal.mongodb import MongoDB
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.graph_degree import GraphDegree
+from networkxternal.helpers.algorithms import is_sequence_of, chunks
+
+
+class MongoDBAdjacency(MongoDB):
+    """
+    Stores the graph as adjacency lists: documents are keyed by `node` and hold
+    the `out` and `in` arrays of its incident edges. Every edge is present twice:
+    in the `out` array of `first` and in the `in` array of `second`.
+    Array entries are compact: `{_id, v, w, l, d, p}`, where `v` is the opposite
+    member, `w` is the weight, `l` the label, `d` the direction flag and `p`
+    the optional payload.
+
+    A single document can't exceed 16 MB, so the arrays are split into buckets
+    of at most `__max_bucket_size__` entries. New entries are `$push`-ed
+    into any bucket of that node with free space, or into a new one (upsert).
+    Most nodes have a single bucket, so `neighbors` and degree lookups
+    are a single indexed fetch. Hubs span several buckets.
+    https://www.mongodb.com/blog/post/building-with-patterns-the-bucket-pattern
+
+    Nodes are still stored one document each, like in `MongoDB`.
+    Removals filter the arrays with pipeline updates, rather than `$pull`,
+    so that the `count` of every bucket is kept consistent in the same step.
+    https://www.mongodb.com/docs/manual/tutorial/update-with-aggregation-pipeline/
+    """
+
+    __max_bucket_size__ = 10000
+    __edges_collection_name__ = "adjacency"
+
+    # region Metadata
+
+    def reduce_edges(self, u=None, v=None, key=None) -> GraphDegree:
+        u = self.make_node_id(u)
+        v = self.make_node_id(v)
+        if u >= 0 or v >= 0:
+            es = self.has_edge(u, v, key)
+            return GraphDegree(len(es), sum(e.weight for e in es))
+
+        # Every edge is counted once, as an entry of its `out` array.
+        key = self.make_label(key)
+        entries = "$out"
+        if key >= 0:
+            entries = {
+                "$filter": {
+                    "input": "$out",
+                    "cond": {"$eq": ["$$this.l", key]},
+                }
+            }
+        pipeline = [
+            {"$project": {"entries": entries}},
+            {
+                "$group": {
+                    "_id": None,
+                    "count": {"$sum": {"$size": "$entries"}},
+                    "weight": {"$sum": {"$sum": "$entries.w"}},
+                }
+            },
+        ]
+        with self.get_read_collections() as (adjacency, _):
+            result = list(adjacency.aggregate(pipeline=pipeline, allowDiskUse=True))
+        if len(result) == 0:
+            return GraphDegree(0, 0)
+        return GraphDegree(result[0]["count"], result[0]["weight"])
+
+    def biggest_edge_id(self) -> int:
+        result = self.edges_collection.aggregate(
+            pipeline=[
+                {"$project": {"biggest": {"$max": "$out._id"}}},
+                {"$group": {"_id": None, "biggest": {"$max": "$biggest"}}},
+            ]
+        )
+        result = list(result)
+        if len(result) == 0 or result[0]["biggest"] is None:
+            return 0
+        return int(result[0]["biggest"])
+
+    # region Bulk Reads
+
+    @property
+    def edges(self) -> Sequence[Edge]:
+        with self.get_read_collections() as (adjacency, _):
+            return [
+                self.edge_from_entry(doc["node"], entry, outgoing=True)
+                for doc in adjacency.find({}, {"node": 1, "out": 1})
+                for entry in doc.get("out", [])
+            ]
+
+    @property
+    def out_edges(self) -> Sequence[Edge]:
+        return [e for e in self.edges if e.is_directed]
+
+    # region Random Reads
+
+    def has_edge(self, u, v, key=None) -> Sequence[Edge]:
+        u = self.make_node_id(u)
+        v = self.make_node_id(v)
+        key = self.make_label(key)
+        if u < 0 and v < 0:
+            es = self.edges
+        elif u < 0 or v < 0:
+            if not self.directed or u == v:
+                es = self.edges_containing(max(u, v))
+            elif u < 0:
+                es = self.edges_of_nodes([v], outgoing=False, incoming=True)
+            else:
+                es = self.edges_of_nodes([u], outgoing=True, incoming=False)
+        elif u == v:
+            es = self.edges_containing(u)
+        elif self.directed:
+            es = [
+                e
+                for e in self.edges_of_nodes([u], outgoing=True, incoming=False)
+                if e.second == v
+            ]
+        else:
+            es = [e for e in self.edges_containing(u) if e.first == v or e.second == v]
+        if key >= 0:
+            es = [e for e in es if e.label == key]
+        return es
+
+    def neighbors(self, n) -> Set[int]:
+        n = self.make_node_id(n)
+        result = self.members_of_nodes([n], outgoing=True, incoming=True)
+        result.discard(n)
+        return result
+
+    def successors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        n = self.make_node_id(n)
+        result = self.members_of_nodes([n], outgoing=True, incoming=False)
+        result.discard(n)
+        return result
+
+    def predecessors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        n = self.make_node_id(n)
+        result = self.members_of_nodes([n], outgoing=False, incoming=True)
+        result.discard(n)
+        return result
+
+    def neighbors_of_group(self, vs: Sequence[int]) -> Set[int]:
+        vs = set(vs)
+        result = self.members_of_nodes(list(vs), outgoing=True, incoming=True)
+        return result.difference(vs)
+
+    # region Random Writes
+
+    def add(self, obj, upsert=True) -> int:
+        if isinstance(obj, Edge):
+            obj = [obj]
+        if not is_sequence_of(obj, Edge):
+            return super().add(obj, upsert=upsert)
+
+        self.replicas.mark_write()
+        ids = [e._id for e in obj if e._id >= 0]
+        if upsert:
+            self.remove_entries_by_ids(ids)
+        else:
+            existing = self.existing_edges_ids(ids)
+            obj = [e for e in obj if e._id not in existing]
+        if len(obj) == 0:
+            return 0
+
+        # Group the entries by the node they will be attached to,
+        # so that every node gets a single `$push` per batch.
+        outgoing = defaultdict(list)
+        incoming = defaultdict(list)
+        for e in obj:
+            outgoing[e.first].append(self.entry_from_edge(e, e.second))
+            incoming[e.second].append(self.entry_from_edge(e, e.first))
+
+        ops = list()
+        counts_out = list()
+        cap = type(self).__max_bucket_size__
+        for n in set(outgoing.keys()).union(incoming.keys()):
+            entries = [("out", x) for x in outgoing.get(n, [])]
+            entries += [("in", x) for x in incoming.get(n, [])]
+            for part in chunks(entries, cap):
+                ops.append(self.make_push(n, part))
+                counts_out.append(sum(1 for direction, _ in part if direction == "out"))
+
+        try:
+            self.edges_collection.bulk_write(requests=ops, ordered=False)
+        except pymongo.errors.BulkWriteError as bwe:
+            print(bwe)
+            print(bwe.details["writeErrors"])
+            # Unordered writes skip only the failed operations. Every edge
+            # is counted once, as an entry of the `out` array of its `first`.
+            failed = {error["index"] for error in bwe.details["writeErrors"]}
+            return sum(c for i, c in enumerate(counts_out) if i not in failed)
+        return len(obj)
+
+    def remove(self, obj) -> int:
+        if isinstance(obj, Edge):
+            obj = [obj]
+        if not is_sequence_of(obj, Edge):
+            return super().remove(obj)
+
+        self.replicas.mark_write()
+        count = self.remove_entries_by_ids([e._id for e in obj if e._id >= 0])
+        without_ids = [e for e in obj if e._id < 0]
+        if len(without_ids) == 0:
+            return count
+
+        count += self.count_entries_matching(without_ids)
+        ops_out = list()
+        ops_in = list()
+        for e in without_ids:
+            d = bool(e.is_directed)
+            ops_out.append(
+                UpdateMany(
+                    {"node": e.first, "out.v": e.second},
+                    self.pipe_filter_entries(
+                        keep_out=self.cond_not_matching(e.second, d),
+                    ),
+                )
+            )
+            ops_in.append(
+                UpdateMany(
+                    {"node": e.second, "in.v": e.first},
+                    self.pipe_filter_entries(
+                        keep_in=self.cond_not_matching(e.first, d),
+                    ),
+                )
+            )
+        self.edges_collection.bulk_write(requests=ops_out, ordered=False)
+        self.edges_collection.bulk_write(requests=ops_in, ordered=False)
+        self.remove_empty_buckets()
+        return count
+
+    def remove_nodes(self, vs) -> int:
+        ids = [self.make_node_id(v) for v in vs]
+        self.replicas.mark_write()
+        self.nodes_collection.delete_many({"_id": {"$in": ids}})
+        # Each edge is counted once, as an entry of the `out` array of its `first`.
+        count = self.count_entries(
+            {"node": {"$in": ids}},
+            {"$size": "$out"},
+        )
+        count += self.count_entries(
+            {"out.v": {"$in": ids}, "node": {"$nin": ids}},
+            self.size_matching("$out", {"$in": ["$$this.v", ids]}),
+        )
+        self.edges_collection.delete_many({"node": {"$in": ids}})
+        self.edges_collection.update_many(
+            {"$or": [{"out.v": {"$in": ids}}, {"in.v": {"$in": ids}}]},
+            self.pipe_filter_entries(
+                keep_out={"$not": [{"$in": ["$$this.v", ids]}]},
+                keep_in={"$not": [{"$in": ["$$this.v", ids]}]},
+            ),
+        )
+        self.remove_empty_buckets()
+        return count
+
+    # region Helpers
+
+    def create_index(self, background=False):
+        self.edges_collection.create_index(
+            [("node", pymongo.ASCENDING), ("count", pymongo.ASCENDING)],
+            background=background,
+        )
+        for field in ("out._id", "in._id", "out.v", "in.v"):
+            self.edges_collection.create_index(
+                field, background=background, sparse=True
+            )
+
+    def pipe_mentioned_nodes_ids(self) -> list:
+        # Empty buckets are deleted, so every bucket has at least one edge.
+        return [{"$group": {"_id": "$node"}}]
+
+    def entry_from_edge(self, e: Edge, other: int) -> dict:
+        entry = {
+            "_id": e._id,
+            "v": other,
+            "w": e.weight,
+            "l": e.label,
+            "d": bool(e.is_directed),
+        }
+        if e.payload:
+            entry["p"] = e.payload
+        return entry
+
+    def edge_from_entry(self, n: int, entry: dict, outgoing: bool) -> Edge:
+        first, second = (n, entry["v"]) if outgoing else (entry["v"], n)
+        return Edge(
+            _id=entry["_id"],
+            first=first,
+            second=second,
+            weight=entry["w"],
+            label=entry["l"],
+            is_directed=entry["d"],
+            payload=entry.get("p", {}),
+        )
+
+    def edges_of_nodes(
+        self,
+        ns: List[int],
+        outgoing: bool,
+        incoming: bool,
+    ) -> List[Edge]:
+        projection = {"node": 1}
+        if outgoing:
+            projection["out"] = 1
+        if incoming:
+            projection["in"] = 1
+        result = list()
+        with self.get_read_collections() as (adjacency, _):
+            for doc in adjacency.find({"node": {"$in": ns}}, projection):
+                n = doc["node"]
+                for entry in doc.get("out", []):
+                    result.append(self.edge_from_entry(n, entry, outgoing=True))
+                for entry in doc.get("in", []):
+                    result.append(self.edge_from_entry(n, entry, outgoing=False))
+        return result
+
+    def edges_containing(self, n: int) -> List[Edge]:
+        """
+        Every edge of `n` in either direction: all of its `out` entries and those
+        `in` entries, that come from other nodes, as self-loops are present in both
+        arrays. Entries repeated across buckets are reported once.
+        """
+        result = list()
+        ids = set()
+
+        def append_once(e: Edge):
+            if e._id >= 0:
+                if e._id in ids:
+                    return
+                ids.add(e._id)
+            result.append(e)
+
+        with self.get_read_collections() as (adjacency, _):
+            for doc in adjacency.find({"node": {"$in": [n]}}, {"out": 1, "in": 1}):
+                for entry in doc.get("out", []):
+                    append_once(self.edge_from_entry(n, entry, outgoing=True))
+                for entry in doc.get("in", []):
+                    if entry["v"] != n:
+                        append_once(self.edge_from_entry(n, entry, outgoing=False))
+        return result
+
+    def members_of_nodes(
+        self,
+        ns: List[int],
+        outgoing: bool,
+        incoming: bool,
+    ) -> Set[int]:
+        projection = {"_id": 0}
+        if outgoing:
+            projection["out.v"] = 1
+        if incoming:
+            projection["in.v"] = 1
+        result = set()
+        with self.get_read_collections() as (adjacency, _):
+            for part in chunks(ns, type(self).__max_batch_size__):
+                for doc in adjacency.find({"node": {"$in": part}}, projection):
+                    result.update(entry["v"] for entry in doc.get("out", []))
+                    result.update(entry["v"] for entry in doc.get("in", []))
+        return result
+
+    def existing_edges_ids(self, ids: List[int]) -> Set[int]:
+        if len(ids) == 0:
+            return set()
+        result = self.edges_collection.aggregate(
+            pipeline=[
+                {"$match": {"out._id": {"$in": ids}}},
+                {"$unwind": "$out"},
+                {"$match": {"out._id": {"$in": ids}}},
+                {"$project": {"_id": "$out._id"}},
+            ]
+        )
+        return {doc["_id"] for doc in result}
+
+    def make_push(self, n: int, entries: list) -> UpdateOne:
+        out_entries = [x for direction, x in entries if direction == "out"]
+        in_entries = [x for direction, x in entries if direction == "in"]
+        cap = type(self).__max_bucket_size__
+        return UpdateOne(
+            filter={"node": n, "count": {"$lte": cap - len(entries)}},
+            update={
+                "$push": {
+                    "out": {"$each": out_entries},
+                    "in": {"$each": in_entries},
+                },
+                "$inc": {"count": len(entries)},
+            },
+            upsert=True,
+        )
+
+    def remove_entries_by_ids(self, ids: List[int]) -> int:
+        if len(ids) == 0:
+            return 0
+        count = self.count_entries(
+            {"out._id": {"$in": ids}},
+            self.size_matching("$out", {"$in": ["$$this._id", ids]}),
+        )
+        if count == 0:
+            return 0
+        keep = {"$not": [{"$in": ["$$this._id", ids]}]}
+        self.edges_collection.update_many(
+            {"$or": [{"out._id": {"$in": ids}}, {"in._id": {"$in": ids}}]},
+            self.pipe_filter_entries(keep_out=keep, keep_in=keep),
+        )
+        self.remove_empty_buckets()
+        return count
+
+    def remove_empty_buckets(self):
+        self.edges_collection.delete_many({"count": {"$lte": 0}})
+
+    def count_entries_matching(self, es: Sequence[Edge]) -> int:
+        """
+        Counts the stored edges, that match the members and direction of any of `es`,
+        as entries of the `out` arrays, grouping the conditions by `first`.
+        """
+        conds = defaultdict(list)
+        for e in es:
+            conds[e.first].append(self.cond_matching(e.second, bool(e.is_directed)))
+        return sum(
+            self.count_entries(
+                {"node": n},
+                self.size_matching("$out", {"$or": c}),
+            )
+            for n, c in conds.items()
+        )
+
+    def count_entries(self, match: dict, size: dict) -> int:
+        result = self.edges_collection.aggregate(
+            pipeline=[
+                {"$match": match},
+                {"$group": {"_id": None, "count": {"$sum": size}}},
+            ]
+        )
+        result = list(result)
+        if len(result) == 0:
+            return 0
+        return result[0]["count"]
+
+    def size_matching(self, array: str, cond: dict) -> dict:
+        return {"$size": {"$filter": {"input": array, "cond": cond}}}
+
+    def cond_matching(self, other: int, is_directed: bool) -> dict:
+        return {
+            "$and": [
+                {"$eq": ["$$this.v", other]},
+                {"$eq": ["$$this.d", is_directed]},
+            ]
+        }
+
+    def cond_not_matching(self, other: int, is_directed: bool) -> dict:
+        return {"$not": [self.cond_matching(other, is_directed)]}
+
+    def pipe_filter_entries(
+        self,
+        keep_out: Optional[dict] = None,
+        keep_in: Optional[dict] = None,
+    ) -> list:
+        """
+        Builds a pipeline update, that only keeps the array entries
+        matching the conditions, and recomputes the `count` of the bucket.
+        """
+        updates = dict()
+        if keep_out is not None:
+            updates["out"] = {
+                "$filter": {"input": {"$ifNull": ["$out", []]}, "cond": keep_out}
+            }
+        if keep_in is not None:
+            updates["in"] = {
+                "$filter": {"input": {"$ifNull": ["$in", []]}, "cond": keep_in}
+            }
+        return [
+            {"$set": updates},
+            {
+                "$set": {
+                    "count": {
+                        "$add": [
+                            {"$size": {"$ifNull": ["$out", []]}},
+                            {"$size": {"$ifNull": ["$in", []]}},
+                        ]
+                    }
+                }
+            },
+        ]
@@ -1,14 +1,34 @@
-from networkxternal.base_sql import BaseSQL
+import os
+import tempfile
+import threading
+from time import perf_counter
+from typing import Iterable
+
+import sqlalchemy as sa
+from sqlalchemy import text
+
+from networkxternal.base_sql import BaseSQL, EdgeSQL, EdgeNewSQL
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.streams import EdgesCSVStream, EDGE_COLUMNS
+from networkxternal.helpers.import_stats import ImportStats
 
 
 class MySQL(BaseSQL):
+    """
+    Extends BaseSQL functionality with bulk imports via `LOAD DATA LOCAL INFILE`.
+    The file is read by the client and streamed over the existing connection,
+    so it doesn't have to be on the same filesystem as the server.
+    Arbitrary `Edge` generators are serialized into a named pipe,
+    which the driver consumes as if it was a regular CSV file.
+    https://dev.mysql.com/doc/refman/8.0/en/load-data.html
+    """
 
     def __init__(self, url, **kwargs):
         BaseSQL.__init__(self, url, **kwargs)
         self.set_pragmas_on_first_launch()
 
     def set_pragmas_on_first_launch(self):
-        if self.number_of_edges() > 0:
+        if self.number_of_primary_edges() > 0:
             return
         # https://www.percona.com/blog/2014/01/28/10-mysql-performance-tuning-settings-after-installation/
         # https://www.monitis.com/blog/101-tips-to-mysql-tuning-and-optimization/
@@ -18,7 +38,7 @@ class MySQL(BaseSQL):
             "SET GLOBAL local_infile=1;",
             # We often flush the temporary table after bulk imports.
             # https://dev.mysql.com/doc/refman/8.0/en/innodb-parameters.html#sysvar_innodb_file_per_table
-            "SET GLOBAL innodb_file_per_table=1;"
+            "SET GLOBAL innodb_file_per_table=1;",
             # Don't use 0 as node or edge ID, unless pre-specified.
             # https://dev.mysql.com/doc/refman/8.0/en/server-system-variables.html#sysvar_insert_id
             # 'SET SESSION insert_id=1;'
@@ -39,28 +59,174 @@ class MySQL(BaseSQL):
         ]
         with self.get_session() as s:
             for p in pragmas:
-                s.execute(p)
+                s.execute(text(p))
                 s.commit()
 
-    # def add_from_csv(self, path: str) -> int:
-    #     """
-    #         This method requires the file to be mounted on the same filesystem.
-    #         Unlike Postgres the connection wrapper doesn't allow channeling data to remote DB.
-    #     """
-    #     cnt = self.number_of_edges()
-    #     pattern = '''
-    #     LOAD DATA LOCAL INFILE  '%s'
-    #     INTO TABLE %s
-    #     FIELDS TERMINATED BY ','
-    #     LINES TERMINATED BY '\n'
-    #     IGNORE 1 ROWS
-    #     (first, second, weight);
-    #     '''
-    #     task = pattern % (path, EdgeNewSQL.__tablename__)
-    #     with self.get_session() as s:
-    #         s.execute(task)
-    #         s.commit()
-    #     self.upsert_table(EdgeNewSQL.__tablename__)
-    #     self.clear_table(EdgeNewSQL.__tablename__)
-    #     self.add_missing_nodes()
-    #     return self.number_of_edges() - cnt
+    # region Bulk Writes
+
+    def add_from_csv(self, path: str, is_directed=True) -> int:
+        """
+        Imports an adjacency list CSV file with a header and `(first, second, weight)` rows.
+        New edges are numbered by their line index, just like in `yield_edges_from_csv`,
+        shifted past the `biggest_edge_id`, so they never collide with existing ones.
+        """
+        start = perf_counter()
+        pattern = """
+        LOAD DATA LOCAL INFILE '%s'
+        INTO TABLE %s
+        FIELDS TERMINATED BY ','
+        LINES TERMINATED BY '\\n'
+        IGNORE 1 ROWS
+        (first, second, @weight)
+        SET
+            _id = (@row := @row + 1),
+            weight = COALESCE(NULLIF(TRIM(@weight), ''), 1),
+            is_directed = %d,
+            label = -1;
+        """
+        task = pattern % (path, EdgeNewSQL.__tablename__, int(is_directed))
+        # Leftovers of an aborted import must not be merged with this one.
+        self.clear_table(EdgeNewSQL.__tablename__)
+        count = self.load_data(task, self.first_free_edge_id())
+        self.insert_table(EdgeNewSQL.__tablename__)
+        self.clear_table(EdgeNewSQL.__tablename__)
+        self.add_missing_nodes()
+        self.last_import_stats = ImportStats(
+            count_edges=count,
+            count_bytes=os.path.getsize(path),
+            seconds=perf_counter() - start,
+        )
+        return count
+
+    def add_stream(self, stream: Iterable[Edge], upsert=True) -> int:
+        """
+        Serializes any `Edge` iterable into CSV on the fly and pipes it into `LOAD DATA`.
+        With `upsert` the original IDs are preserved and existing rows are overwritten,
+        otherwise the IDs are shifted past the `biggest_edge_id`.
+        """
+        start = perf_counter()
+        id_offset = 0 if upsert else self.first_free_edge_id()
+        columns = ", ".join(c if c != "_id" else "@_id" for c in EDGE_COLUMNS)
+        f = EdgesCSVStream(self.unique_edges(stream), null="NULL")
+        self.clear_table(EdgeNewSQL.__tablename__)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, f"{EdgeNewSQL.__tablename__}.csv")
+            pattern = """
+            LOAD DATA LOCAL INFILE '%s'
+            INTO TABLE %s
+            FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '"' ESCAPED BY ''
+            LINES TERMINATED BY '\\n'
+            (%s)
+            SET _id = @_id + %d;
+            """
+            task = pattern % (path, EdgeNewSQL.__tablename__, columns, id_offset)
+            count = self.load_data_from_pipe(task, path, f)
+
+        if upsert:
+            self.upsert_table(EdgeNewSQL.__tablename__)
+        else:
+            self.insert_table(EdgeNewSQL.__tablename__)
+        self.clear_table(EdgeNewSQL.__tablename__)
+        self.add_missing_nodes()
+        self.last_import_stats = ImportStats(
+            count_edges=count,
+            count_bytes=f.count_bytes,
+            seconds=perf_counter() - start,
+        )
+        return count
+
+    # region Helpers
+
+    def make_engine(self, url: str):
+        # Both `mysqlclient` and `PyMySQL` refuse to send local files by default.
+        return sa.create_engine(
+            url,
+            connect_args={"local_infile": 1},
+            **self.engine_options,
+        )
+
+    def first_free_edge_id(self) -> int:
+        if self.number_of_primary_edges() == 0:
+            return 0
+        return self.biggest_edge_id() + 1
+
+    def load_data(self, task: str, first_id: int = 0) -> int:
+        # User variables are bound to the connection, so we can't use sessions here.
+        with self.get_raw_connection() as conn:
+            return self.execute_load(conn, task, first_id)
+
+    def execute_load(self, conn, task: str, first_id: int = 0) -> int:
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SET @row = %d;" % (first_id - 1))
+            cursor.execute(task)
+            return cursor.rowcount
+        finally:
+            cursor.close()
+
+    def load_data_from_pipe(self, task: str, path: str, f) -> int:
+        """
+        Writes the contents of a readable `f` into a named pipe from a background thread,
+        while the driver reads the other end and forwards it to the server.
+        Falls back to a temporary file on platforms without `mkfifo`.
+        """
+        if not hasattr(os, "mkfifo"):
+            with open(path, "wb") as pipe:
+                pipe.write(f.read())
+            return self.load_data(task)
+
+        os.mkfifo(path)
+        opened = threading.Event()
+        errors = list()
+
+        def pump():
+            try:
+                with open(path, "wb") as pipe:
+                    opened.set()
+                    while True:
+                        part = f.read(1 << 20)
+                        if not part:
+                            break
+                        pipe.write(part)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                # Never leave the cleanup below waiting, even if `open` failed.
+                opened.set()
+
+        writer = threading.Thread(target=pump, daemon=True)
+        writer.start()
+        with self.get_raw_connection() as conn:
+            try:
+                result = self.execute_load(conn, task)
+            finally:
+                # If the driver failed before draining the pipe, the writer may still be
+                # blocked in `open` or `write`. Attaching and detaching a reader on the
+                # other end makes it fail with a `BrokenPipeError` instead of hanging.
+                if writer.is_alive():
+                    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+                    opened.wait()
+                    os.close(fd)
+                writer.join()
+            # A writer, that failed midway, closes the pipe early and the server
+            # takes the truncated input as complete, so the load is rolled back.
+            if errors:
+                raise errors[0]
+        return result
+
+    def upsert_table(self, source_name: str):
+        # Unlike `REPLACE INTO`, it doesn't delete the old row and re-insert the new one,
+        # avoiding secondary index churn.
+        # https://dev.mysql.com/doc/refman/8.0/en/insert-on-duplicate.html
+        updates = ", ".join(
+            f"{EdgeSQL.__tablename__}.{c} = {source_name}.{c}"
+            for c in EDGE_COLUMNS
+            if c != "_id"
+        )
+        migration = f"""
+            INSERT INTO {EdgeSQL.__tablename__}
+            SELECT * FROM {source_name}
+            ON DUPLICATE KEY UPDATE {updates};
+        """
+        with self.get_session() as s:
+            s.execute(text(migration))
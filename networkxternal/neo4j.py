@@ -1,13 +1,27 @@
 import os
-import shutil
-from typing import List, Set, Sequence
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+from typing import List, Set, Sequence, Tuple
 from urllib.parse import urlparse
 
+import numpy as np
 from neo4j import GraphDatabase, Result as Neo4jResult
 
 from networkxternal.base_api import BaseAPI
 from networkxternal.helpers.edge import Edge
-from networkxternal.helpers.algorithms import chunks, extract_database_name
+from networkxternal.helpers.node import Node
+from networkxternal.helpers.graph_degree import GraphDegree
+from networkxternal.helpers.import_stats import ImportStats
+from networkxternal.helpers.checkpoints import ImportCheckpoint
+from networkxternal.helpers.edges_batch import unpack_edges
+from networkxternal.helpers.dedup import deduplicate_ids
+from networkxternal.helpers.parsing import yield_edges_batches_from_csv
+from networkxternal.helpers.algorithms import (
+    chunks,
+    extract_database_name,
+    is_sequence_of,
+)
 
 
 class Neo4J(BaseAPI):
@@ -48,8 +62,32 @@ class Neo4J(BaseAPI):
     # Depending on the machine this can be higher.
     # But on a laptop we would get "Java heap space" error.
     __max_batch_size__ = 1000
+    # Number of edges sent per round-trip by `add_stream`.
+    __max_import_chunk_size__ = 10000
     __is_concurrent__ = True
     __edge_type__ = Edge
+    # Substituted for `COLUMNS` in queries, that return the matched edges `e`.
+    __edge_columns__ = """
+        startNode(e)._id AS first, endNode(e)._id AS second,
+        e._id AS _id, e.weight AS weight, e.label AS label,
+        coalesce(e.is_directed, true) AS is_directed
+    """
+    # Patterns matching the edges `e` for every shape of `shape_edges_members`.
+    __match_by_shape__ = {
+        "all": "MATCH ()-[e:EDGE]->()",
+        "containing": "MATCH (:VERTEX {_id: $n})-[e:EDGE]-()",
+        "to": "MATCH ()-[e:EDGE]->(:VERTEX {_id: $v})",
+        "from": "MATCH (:VERTEX {_id: $u})-[e:EDGE]->()",
+        "between": "MATCH (:VERTEX {_id: $u})-[e:EDGE]->(:VERTEX {_id: $v})",
+        "between_any": "MATCH (:VERTEX {_id: $u})-[e:EDGE]-(:VERTEX {_id: $v})",
+    }
+    # Count-only lookups, served from the counts store and per-node degrees.
+    __count_by_shape__ = {
+        "all": "MATCH ()-[e:EDGE]->() RETURN count(e) AS c",
+        "containing": "MATCH (n:VERTEX {_id: $n}) RETURN COUNT { (n)-[:EDGE]-() } AS c",
+        "to": "MATCH (n:VERTEX {_id: $v}) RETURN COUNT { (n)<-[:EDGE]-() } AS c",
+        "from": "MATCH (n:VERTEX {_id: $u}) RETURN COUNT { (n)-[:EDGE]->() } AS c",
+    }
 
     def __init__(
         self,
@@ -58,8 +96,16 @@ class Neo4J(BaseAPI):
         import_directory="~/import",
         use_full_name_for_label=False,
         use_indexes_over_constraints=True,
+        max_connection_pool_size=100,
+        connection_acquisition_timeout=60.0,
+        max_connection_lifetime=3600,
         **kwargs,
     ):
+        """
+        Neo4J sessions are not thread-safe, but the driver and its connection pool are.
+        So every thread lazily opens its own session, all sharing one pool.
+        https://neo4j.com/docs/api/python-driver/current/api.html#driver-configuration
+        """
         BaseAPI.__init__(self, **kwargs)
         self.import_directory = import_directory
 
@@ -69,8 +115,13 @@ class Neo4J(BaseAPI):
         self.driver = GraphDatabase.driver(
             url_clean,
             auth=(url_obj.username, url_obj.password),
+            max_connection_pool_size=max_connection_pool_size,
+            connection_acquisition_timeout=connection_acquisition_timeout,
+            max_connection_lifetime=max_connection_lifetime,
         )
-        self.session = self.driver.session()
+        self.thread_local = threading.local()
+        self.sessions = list()
+        self.sessions_lock = threading.Lock()
 
         # ! Resolve the name (for WARNING 2):
         name = str()
@@ -98,239 +149,169 @@ class Neo4J(BaseAPI):
                     self.create_constraint_edges()
 
     def get_constraints(self) -> List[str]:
-        cs = list(self.session.run("CALL db.constraints"))
-        names = [c.get("name", "") for c in cs]
-        return names
+        return [r["name"] for r in self._read("SHOW CONSTRAINTS YIELD name")]
 
     def get_indexes(self) -> List[str]:
-        cs = list(self.session.run("CALL db.indexes"))
-        names = [c.get("name", "") for c in cs]
-        return names
+        return [r["name"] for r in self._read("SHOW INDEXES YIELD name")]
 
     def create_index_nodes(self):
         # Docs for CYPHER direct syntax:
         # https://neo4j.com/docs/cypher-manual/current/indexes-for-search-performance/#administration-indexes-syntax
-        task = "CREATE INDEX indexVERTEX FOR (v:VERTEX) ON (v._id)"
-        # Older version didn't have index names.
-        # Docs for `db.` operations.
-        # https://neo4j.com/docs/operations-manual/current/reference/procedures/#ref-procedure-reference-enterprise-edition
-        # task = 'CALL db.createIndex(":VERTEX(_id)", "native-btree-1.0", )'
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self.session.run(task)
+        task = "CREATE INDEX indexVERTEX IF NOT EXISTS FOR (v:VERTEX) ON (v._id)"
+        return self.session.run(self._cypher(task))
 
     def create_constraint_nodes(self):
         # Existing uniqueness constraint means,
         # that we don't have to create a separate index.
         # Docs: https://neo4j.com/docs/cypher-manual/current/administration/constraints/
         task = """
-        CREATE CONSTRAINT constraintVERTEX
-        ON (v:VERTEX)
-        ASSERT (v._id) IS UNIQUE
+        CREATE CONSTRAINT constraintVERTEX IF NOT EXISTS
+        FOR (v:VERTEX)
+        REQUIRE v._id IS UNIQUE
         """
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self.session.run(task)
+        return self.session.run(self._cypher(task))
 
     def create_constraint_edges(self):
         # Edge uniqueness constrains are only available to Enterprise Edition customers.
         # https://neo4j.com/docs/cypher-manual/current/administration/constraints/#administration-constraints-syntax
         task = """
-        CREATE CONSTRAINT uniqueEDGE
-        ON ()-[e:EDGE]-()
-        ASSERT (e._id) IS UNIQUE
-        """
-        # Indexes on relationships are not implemented yet.
-        # https://stackoverflow.com/a/22444108
-        # task = '''
-        # CREATE INDEX ids_edges
-        # FOR [e:EDGE]
-        # ON (e._id)
-        # '''
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self.session.run(task)
+        CREATE CONSTRAINT constraintEDGE IF NOT EXISTS
+        FOR ()-[e:EDGE]-()
+        REQUIRE e._id IS UNIQUE
+        """
+        return self.session.run(self._cypher(task))
 
     # Relatives
 
-    def has_edge(self, first: int, second: int, **kwargs) -> List[Edge]:
-        if self.directed:
-            pattern = """
-            MATCH (first:VERTEX {_id: %d})-[e:EDGE]->(second:VERTEX {_id: %d})
-            RETURN first._id, second._id, e.weight
-            """
-        else:
-            pattern = """
-            MATCH (first:VERTEX {_id: %d})-[e:EDGE]-(second:VERTEX {_id: %d})
-            RETURN first._id, second._id, e.weight
-            """
-        task = pattern % (first, second)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self._records_to_edges(self.session.run(task))
+    def has_edge(self, u, v, key=None) -> List[Edge]:
+        shape, params = self.shape_edges_members(u, v)
+        task, params = self._match_edges_of_shape(shape, params, self.make_label(key))
+        return self._records_to_edges(self._read(task + " RETURN COLUMNS", **params))
 
     def edges_from(self, v: int) -> List[Edge]:
-        pattern = """
-        MATCH (first:VERTEX {_id: %d})-[e:EDGE]->(second:VERTEX)
-        RETURN first._id, second._id, e.weight
+        task = """
+        MATCH (first:VERTEX {_id: $v})-[e:EDGE]->(second:VERTEX)
+        RETURN COLUMNS
         """
-        task = pattern % (v)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self._records_to_edges(self.session.run(task))
+        return self._records_to_edges(self._read(task, v=v))
 
     def edges_to(self, v: int) -> List[Edge]:
-        pattern = """
-        MATCH (first:VERTEX)-[e:EDGE]->(second:VERTEX {_id: %d})
-        RETURN first._id, second._id, e.weight
+        task = """
+        MATCH (first:VERTEX)-[e:EDGE]->(second:VERTEX {_id: $v})
+        RETURN COLUMNS
         """
-        task = pattern % (v)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self._records_to_edges(self.session.run(task))
+        return self._records_to_edges(self._read(task, v=v))
 
     def edges_related(self, v: int) -> List[Edge]:
-        pattern = """
-        MATCH (first:VERTEX {_id: %d})-[e:EDGE]-(second:VERTEX)
-        RETURN first._id, second._id, e.weight
+        task = """
+        MATCH (:VERTEX {_id: $v})-[e:EDGE]-()
+        RETURN DISTINCT COLUMNS
         """
-        task = pattern % (v)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self._records_to_edges(self.session.run(task))
+        return self._records_to_edges(self._read(task, v=v))
 
     # Wider range of neighbors
 
     def edges_related_to_group(self, vs: Sequence[int]) -> List[Edge]:
-        pattern = """
+        task = """
         MATCH (first:VERTEX)-[e:EDGE]-(second:VERTEX)
-        WHERE (first._id IN [%s]) AND NOT (second._id IN [%s])
-        RETURN first._id, second._id, e.weight
+        WHERE (first._id IN $vs) AND NOT (second._id IN $vs)
+        RETURN COLUMNS
         """
-        group_members = ",".join([str(v) for v in vs])
-        task = pattern % (group_members, group_members)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self._records_to_edges(self.session.run(task))
+        return self._records_to_edges(self._read(task, vs=list(vs)))
 
     def neighbors_of_group(self, vs: Sequence[int]) -> Set[int]:
-        pattern = """
+        task = """
         MATCH (first:VERTEX)-[:EDGE]-(second:VERTEX)
-        WHERE (first._id IN [%s]) AND NOT (second._id IN [%s])
-        RETURN second._id as _id
+        WHERE (first._id IN $vs) AND NOT (second._id IN $vs)
+        RETURN DISTINCT second._id as _id
         """
-        group_members = ",".join([str(v) for v in vs])
-        task = pattern % (group_members, group_members)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return {int(r["_id"]) for r in self.session.run(task)}
+        return {int(r["_id"]) for r in self._read(task, vs=list(vs))}
 
     def neighbors(self, v: int) -> Set[int]:
-        pattern = """
-        MATCH (:VERTEX {_id: %d})-[:EDGE]-(v_related:VERTEX)
-        RETURN v_related._id as _id
+        task = """
+        MATCH (:VERTEX {_id: $v})-[:EDGE]-(v_related:VERTEX)
+        RETURN DISTINCT v_related._id as _id
         """
-        task = pattern % (v)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return {int(r["_id"]) for r in self.session.run(task)}
+        return {int(r["_id"]) for r in self._read(task, v=v)}
+
+    def successors(self, v: int) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(v)
+        task = """
+        MATCH (:VERTEX {_id: $v})-[:EDGE]->(v_related:VERTEX)
+        RETURN DISTINCT v_related._id as _id
+        """
+        return {int(r["_id"]) for r in self._read(task, v=v)}
+
+    def predecessors(self, v: int) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(v)
+        task = """
+        MATCH (:VERTEX {_id: $v})<-[:EDGE]-(v_related:VERTEX)
+        RETURN DISTINCT v_related._id as _id
+        """
+        return {int(r["_id"]) for r in self._read(task, v=v)}
 
     def neighbors_of_neighbors(self, v: int, include_related=False) -> Set[int]:
         if include_related:
-            pattern = """
-            MATCH (v:VERTEX {_id: %d})-[:EDGE]-(:VERTEX)-[:EDGE]-(v_unrelated:VERTEX)
+            task = """
+            MATCH (v:VERTEX {_id: $v})-[:EDGE]-(:VERTEX)-[:EDGE]-(v_unrelated:VERTEX)
             WHERE NOT (v._id = v_unrelated._id)
-            RETURN v_unrelated._id as _id
+            RETURN DISTINCT v_unrelated._id as _id
             """
-            task = pattern % v
         else:
-            pattern = """
-            MATCH (v:VERTEX {_id: %d})-[:EDGE]-(:VERTEX)-[:EDGE]-(v_unrelated:VERTEX)
+            task = """
+            MATCH (v:VERTEX {_id: $v})-[:EDGE]-(:VERTEX)-[:EDGE]-(v_unrelated:VERTEX)
             WHERE NOT EXISTS {
                 MATCH (v)-[e_banned:EDGE]-(v_unrelated)
             } AND NOT (v._id = v_unrelated._id)
-            RETURN v_unrelated._id as _id
+            RETURN DISTINCT v_unrelated._id as _id
             """
-            task = pattern % v
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return {int(r["_id"]) for r in self.session.run(task)}
+        return {int(r["_id"]) for r in self._read(task, v=v)}
 
     def shortest_path(self, first, second) -> (List[int], float):
-        pattern = """
-        MATCH (first:VERTEX {_id: %d}), (second:VERTEX {_id: %d})
+        task = """
+        MATCH (first:VERTEX {_id: $first}), (second:VERTEX {_id: $second})
         CALL algo.shortestPath.stream(first, second, "weight")
         YIELD nodeId, weight
-        MATCH (v_on_path:Loc) WHERE id(v_on_path) = nodeId
+        MATCH (v_on_path:VERTEX) WHERE id(v_on_path) = nodeId
         RETURN v_on_path._id AS _id, weight
         """
-        task = pattern % (first, second)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        rs = list(self.session.run(task))
+        rs = self._read(task, first=first, second=second)
         path = [int(r["_id"]) for r in rs]
         weight = sum([float(r["weight"]) for r in rs])
         return path, weight
 
     # Metadata
 
-    def reduce_nodes(self) -> int:
-        task = f"""
-        MATCH (v:{self._v})
-        WITH count(v) as result
-        RETURN result
+    def reduce_nodes(self) -> GraphDegree:
+        task = """
+        MATCH (v:VERTEX)
+        RETURN count(v) AS c, sum(coalesce(v.weight, 1)) AS s
         """
-        return int(self._first_record(self.session.run(task), "result"))
+        rs = self._read(task)
+        return GraphDegree(
+            int(self._first_record(rs, "c") or 0),
+            float(self._first_record(rs, "s") or 0),
+        )
 
-    def reduce_edges(self, **kwargs) -> int:
-        task = f"""
-        MATCH ()-[e:{self._e}]->()
-        WITH count(e) as result
-        RETURN result
-        """
-        return int(self._first_record(self.session.run(task), "result"))
+    def reduce_edges(self, u=None, v=None, key=None) -> GraphDegree:
+        shape, params = self.shape_edges_members(u, v)
+        return self._reduce_edges_of_shape(shape, params, self.make_label(key))
 
-    def degree_neighbors(self, v: int) -> int | float:
-        pattern = """
-        MATCH (v:VERTEX {_id: %d})-[e:EDGE]-()
-        WITH count(e) as c, sum(e.weight) as s
-        RETURN c, s
-        """
-        task = pattern % v
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        rs = list(self.session.run(task))
-        c = int(self._first_record(rs, "c"))
-        s = float(self._first_record(rs, "s"))
-        return c, s
-
-    def degree_predecessors(self, v: int) -> int | float:
-        pattern = """
-        MATCH (:VERTEX)-[e:EDGE]->(v:VERTEX {_id: %d})
-        WITH count(e) as c, sum(e.weight) as s
-        RETURN c, s
-        """
-        task = pattern % v
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        rs = list(self.session.run(task))
-        c = int(self._first_record(rs, "c"))
-        s = float(self._first_record(rs, "s"))
-        return c, s
-
-    def degree_successors(self, v: int) -> int | float:
-        pattern = """
-        MATCH (v:VERTEX {_id: %d})-[e:EDGE]->(:VERTEX)
-        WITH count(e) as c, sum(e.weight) as s
-        RETURN c, s
-        """
-        task = pattern % v
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        rs = list(self.session.run(task))
-        c = int(self._first_record(rs, "c"))
-        s = float(self._first_record(rs, "s"))
-        return c, s
+    def number_of_edges(self, u=None, v=None, key=None) -> int:
+        shape, params = self.shape_edges_members(u, v)
+        key = self.make_label(key)
+        return self._reduce_edges_of_shape(shape, params, key, with_weights=False).count
+
+    def degree_neighbors(self, v: int) -> GraphDegree:
+        return self._reduce_edges_of_shape("containing", {"n": v}, -1)
+
+    def degree_predecessors(self, v: int) -> GraphDegree:
+        return self._reduce_edges_of_shape("to", {"v": v}, -1)
+
+    def degree_successors(self, v: int) -> GraphDegree:
+        return self._reduce_edges_of_shape("from", {"u": v}, -1)
 
     def biggest_edge_id(self) -> int:
         task = """
@@ -339,237 +320,434 @@ class Neo4J(BaseAPI):
         ORDER BY _id DESC
         LIMIT 1
         """
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        rs = list(self.session.run(task))
+        rs = self._read(task)
         if len(rs) == 0:
             return 0
         return int(self._first_record(rs, "_id"))
 
-    def add(self, e: Edge, **kwargs) -> bool:
+    def add(self, obj, upsert=True) -> int:
         """
         WARNING: True "upserting" is too slow, if indexing isn't enabled,
         as we need to perform full scans to match each edge ID!
         So for the non-enterprise version - we strongly recommend
-        using `insert_edge()`
+        using `insert_edges()` or `upsert=False`.
         """
-        pattern = """
-        MERGE (first:VERTEX {_id: %d})
-        MERGE (second:VERTEX {_id: %d})
-        MERGE (first)-[:EDGE {_id: %d, weight: %d}]%s(second)
+        if isinstance(obj, (Edge, Node)):
+            obj = [obj]
+        if is_sequence_of(obj, Node):
+            task = """
+            UNWIND $rows AS r
+            MERGE (v:VERTEX {_id: r._id})
+            SET v.weight = r.weight, v.label = r.label
+            RETURN count(v) AS c
+            """
+            rows = [{"_id": n._id, "weight": n.weight, "label": n.label} for n in obj]
+            return self._write_in_batches(task, rows)
+        if not is_sequence_of(obj, Edge):
+            return 0
+        if not upsert:
+            return self.insert_edges(obj)
+
+        task = """
+        UNWIND $rows AS r
+        MERGE (first:VERTEX {_id: r.first})
+        MERGE (second:VERTEX {_id: r.second})
+        MERGE (first)-[e:EDGE {_id: r._id}]->(second)
+        SET e.weight = r.weight, e.label = r.label, e.is_directed = r.is_directed
+        RETURN count(e) AS c
         """
-        d = "->" if e.is_directed else "-"
-        task = pattern % (e.first, e.second, e._id, e.weight, d)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        self.session.run(task)
-        return True
+        return self._write_in_batches(task, list(map(self._edge_to_row, obj)))
 
     def insert_edge(self, e: Edge) -> bool:
-        pattern = """
-        MERGE (first:VERTEX {_id: %d})
-        MERGE (second:VERTEX {_id: %d})
-        CREATE (first)-[:EDGE {_id: %d, weight: %d}]%s(second)
-        """
-        d = "->" if e.is_directed else "-"
-        task = pattern % (e.first, e.second, e._id, e.weight, d)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        self.session.run(task)
-        return True
+        return self.insert_edges([e]) == 1
 
     def insert_edges(self, es: List[Edge]) -> int:
-        vs = set()
-        for e in es:
-            vs.add(e.first)
-            vs.add(e.second)
-        task = str()
-        # First upsert all the nodes.
-        for v in vs:
-            pattern = "MERGE (v%d:VERTEX {_id: %d})"
-            part = pattern % (v, v)
-            task += part
-            task += "\n"
-        # Then add the edges connecting matched nodes.
-        for e in es:
-            pattern = "CREATE (v%d)-[:EDGE {_id: %d, weight: %d}]%s(v%d)"
-            d = "->" if e.is_directed else "-"
-            part = pattern % (e.first, e._id, e.weight, d, e.second)
-            task += part
-            task += "\n"
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        self.session.run(task)
-        return len(es)
+        """
+        Nodes are merged and edges are created with a single parameterized statement,
+        unwinding a bounded batch of rows, so that its plan is compiled once.
+        """
+        task = """
+        UNWIND $rows AS r
+        MERGE (first:VERTEX {_id: r.first})
+        MERGE (second:VERTEX {_id: r.second})
+        CREATE (first)-[e:EDGE]->(second)
+        SET e._id = r._id, e.weight = r.weight,
+            e.label = r.label, e.is_directed = r.is_directed
+        RETURN count(e) AS c
+        """
+        return self._write_in_batches(task, list(map(self._edge_to_row, es)))
 
-    def remove_node(self, v: int):
-        pattern = """
-        MATCH (v:VERTEX {_id: %d})
+    def remove_node(self, v: int) -> int:
+        return self.remove_nodes([v])
+
+    def remove_nodes(self, vs: Sequence[int]) -> int:
+        task = """
+        UNWIND $rows AS i
+        MATCH (v:VERTEX {_id: i})
         DETACH DELETE v
+        RETURN count(v) AS c
         """
-        task = pattern % v
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        return self.session.run(task)
-
-    def remove(self, e: Edge) -> bool:
-        task = str()
-        if e._id < 0:
-            pattern = """
-            MATCH (first:VERTEX {_id: %d})
-            MATCH (second:VERTEX {_id: %d})
-            MATCH (first)-[e:EDGE]%s(second)
-            DELETE e
-            """
-            d = "->" if e.is_directed else "-"
-            task = pattern % (e.first, e.second, d)
-        else:
-            # We provide excessive information on node IDs
-            # to use property indexes.
-            pattern = """
-            MATCH (first:VERTEX {_id: %d})
-            MATCH (second:VERTEX {_id: %d})
-            MATCH (first)-[e:EDGE {_id: %d}]%s(second)
-            DELETE e
-            """
-            d = "->" if e.is_directed else "-"
-            task = pattern % (e.first, e.second, e._id, d)
-        task = task.replace("VERTEX", self._v)
-        task = task.replace("EDGE", self._e)
-        self.session.run(task)
-        return True
+        return self._write_in_batches(task, [self.make_node_id(v) for v in vs])
+
+    def remove(self, obj) -> int:
+        """
+        Deletes edges in batches with `UNWIND $rows ... DELETE`.
+        We provide excessive information on node IDs to use property indexes.
+        """
+        if isinstance(obj, (Edge, Node)):
+            obj = [obj]
+        if is_sequence_of(obj, Node):
+            return self.remove_nodes([n._id for n in obj])
+        if not is_sequence_of(obj, Edge):
+            return 0
+
+        task_with_ids = """
+        UNWIND $rows AS r
+        MATCH (first:VERTEX {_id: r.first})
+        MATCH (second:VERTEX {_id: r.second})
+        MATCH (first)-[e:EDGE {_id: r._id}]-(second)
+        DELETE e
+        RETURN count(e) AS c
+        """
+        task_without_ids = """
+        UNWIND $rows AS r
+        MATCH (first:VERTEX {_id: r.first})
+        MATCH (second:VERTEX {_id: r.second})
+        MATCH (first)-[e:EDGE]->(second)
+        WHERE coalesce(e.is_directed, true) = r.is_directed
+        DELETE e
+        RETURN count(e) AS c
+        """
+        return self._write_in_batches(
+            task_with_ids,
+            [self._edge_to_row(e) for e in obj if e._id >= 0],
+        ) + self._write_in_batches(
+            task_without_ids,
+            [self._edge_to_row(e) for e in obj if e._id < 0],
+        )
 
     def clear(self):
-        self.session.run(f"MATCH (v:{self._v}) DETACH DELETE v")
-        idxs = self.get_indexes()
-        if f"index{self._v}" in idxs:
-            self.session.run(f"DROP INDEX index{self._v}")
-        cs = self.get_constraints()
-        if f"constraint{self._v}" in cs:
-            self.session.run(f"DROP CONSTRAINT constraint{self._v}")
-        if f"constraint{self._e}" in cs:
-            self.session.run(f"DROP CONSTRAINT constraint{self._e}")
+        # A single transaction deleting everything would run out of heap,
+        # so the deletion is split into batches.
+        # https://neo4j.com/docs/cypher-manual/current/subqueries/subqueries-in-transactions/
+        task = f"""
+        MATCH (v:VERTEX)
+        CALL {{ WITH v DETACH DELETE v }} IN TRANSACTIONS OF {Neo4J.__max_batch_size__} ROWS
+        """
+        tasks = [
+            task,
+            "DROP INDEX indexVERTEX IF EXISTS",
+            "DROP CONSTRAINT constraintVERTEX IF EXISTS",
+            "DROP CONSTRAINT constraintEDGE IF EXISTS",
+        ]
+        for task in tasks:
+            self.session.run(self._cypher(task)).consume()
+
+    @property
+    def session(self):
+        session = getattr(self.thread_local, "session", None)
+        if session is None:
+            session = self.driver.session()
+            self.thread_local.session = session
+            with self.sessions_lock:
+                self.sessions.append(session)
+        return session
+
+    def close(self):
+        with self.sessions_lock:
+            for session in self.sessions:
+                session.close()
+            self.sessions.clear()
+        self.thread_local = threading.local()
+        self.driver.close()
 
     def add_stream(self, stream, **kwargs) -> int:
-        chunk_len = Neo4J.__max_batch_size__
+        """
+        Streams edges from the client in chunks of `__max_import_chunk_size__`.
+        For every chunk, its distinct nodes are `MERGE`-d first, which is idempotent,
+        so no IDs are remembered between chunks and the client memory stays bounded.
+        Then the relationships are created with `CALL { ... } IN TRANSACTIONS`,
+        so the server commits every `__max_batch_size__` rows and its heap usage
+        stays bounded as well, unlike with one giant `LOAD CSV` transaction.
+        https://neo4j.com/docs/cypher-manual/current/subqueries/subqueries-in-transactions/
+        """
+        task_nodes = """
+        UNWIND $rows AS i
+        MERGE (v:VERTEX {_id: i})
+        RETURN count(v) AS c
+        """
+        task_edges = f"""
+        UNWIND $rows AS r
+        CALL {{
+            WITH r
+            MATCH (first:VERTEX {{_id: r.first}})
+            MATCH (second:VERTEX {{_id: r.second}})
+            CREATE (first)-[e:EDGE]->(second)
+            SET e._id = r._id, e.weight = r.weight,
+                e.label = r.label, e.is_directed = r.is_directed
+        }} IN TRANSACTIONS OF {Neo4J.__max_batch_size__} ROWS
+        """
+        start = perf_counter()
         count_edges_added = 0
-        for es in chunks(stream, chunk_len):
-            count_edges_added += self.insert_edges(es)
+        stream = unpack_edges(self.unique_edges(stream))
+        for es in chunks(stream, Neo4J.__max_import_chunk_size__):
+            ids = set()
+            for e in es:
+                ids.add(e.first)
+                ids.add(e.second)
+            self._write_in_batches(task_nodes, list(ids))
+
+            # `CALL { ... } IN TRANSACTIONS` is only allowed in auto-commit transactions.
+            rows = list(map(self._edge_to_row, es))
+            summary = self.session.run(self._cypher(task_edges), rows=rows).consume()
+            count_edges_added += summary.counters.relationships_created
+
+        self.last_import_stats = ImportStats(
+            count_edges=count_edges_added,
+            seconds=perf_counter() - start,
+        )
         return count_edges_added
 
-    def add_from_csv(self, filepath: str, is_directed=True) -> int:
+    def save_checkpoint(self, checkpoint: ImportCheckpoint):
+        task = """
+        MERGE (c:ImportCheckpoint {source: $source, worker: $worker})
+        SET c.batch = $batch, c.byte_offset = $byte_offset, c.last_edge_id = $last_edge_id
         """
-        This function may be tricky to use!
+        self._write(task, **checkpoint.__dict__)
 
-        ! WARNING 1: This operation makes a temporary copy of the entire dump
-        ! and places it into pre-specified `import_directory`:
-        ! https://neo4j.com/docs/operations-manual/4.0/configuration/file-locations/
+    def load_checkpoints(self, source: str) -> List[ImportCheckpoint]:
+        task = """
+        MATCH (c:ImportCheckpoint {source: $source})
+        RETURN c.worker AS worker, c.batch AS batch,
+            c.byte_offset AS byte_offset, c.last_edge_id AS last_edge_id
+        """
+        return [
+            ImportCheckpoint(source=source, **r.data())
+            for r in self._read(task, source=source)
+        ]
+
+    def clear_checkpoints(self, source: str):
+        self._write(
+            "MATCH (c:ImportCheckpoint {source: $source}) DELETE c", source=source
+        )
 
-        ! WARNING 2: This frequently fails with following error:
-        ! `neobolt.exceptions.DatabaseError`: "Java heap space".
+    def add_from_csv(self, filepath: str, is_directed=True) -> int:
         """
-        cnt = self.number_of_edges()
-        current_id = self.biggest_edge_id() + 1
-        _, filename = os.path.split(filepath)
+        Imports an adjacency list CSV file with a header and `(first, second, weight)` rows.
+        The file is parsed and streamed by the client, so it doesn't have to be copied
+        into the `import_directory` of the server, like with `LOAD CSV`.
+        New edges are numbered by their line index, just like in `yield_edges_from_csv`,
+        shifted past the `biggest_edge_id`, so they never collide with existing ones.
+        """
+        first_id = 0 if self.number_of_edges() == 0 else self.biggest_edge_id() + 1
 
-        # We will need to link the file to import folder.
-        file_link = os.path.expanduser(self.import_directory)
-        file_link = os.path.join(file_link, filename)
-        file_link = os.path.abspath(file_link)
+        def shifted_edges():
+            for batch in yield_edges_batches_from_csv(
+                filepath, is_directed=is_directed
+            ):
+                batch.ids += first_id
+                yield batch
 
-        try:
-            shutil.copy(filepath, file_link)
-            # https://neo4j.com/docs/cypher-manual/current/clauses/load-csv/#load-csv-importing-large-amounts-of-data
-            pattern_full = """
-            LOAD CSV WITH HEADERS FROM '%s' AS row
-            WITH
-                toInteger(row.first) AS id_from,
-                toInteger(row.second) AS id_to,
-                toFloat(row.weight) AS w,
-                toInteger(linenumber()) AS idx
-            MERGE (first:VERTEX {_id: id_from})
-            MERGE (second:VERTEX {_id: id_to})
-            CREATE (first)-[:EDGE {_id: idx + %d, weight: w}]%s(second)
-            """
-            d = "->" if is_directed else "-"
-            task = pattern_full % ("file:///" + filename, current_id, d)
-            task = task.replace("VERTEX", self._v)
-            task = task.replace("EDGE", self._e)
-            print("task is:", task)
-            self.session.run(task)
-        finally:
-            # Don't forget to copy temporary file!
-            os.unlink(file_link)
-        return self.number_of_edges() - cnt
+        count = self.add_stream(shifted_edges())
+        self.last_import_stats.count_bytes = os.path.getsize(filepath)
+        return count
 
-    def insert_adjacency_list_in_parts(self, filepath: str, is_directed=True) -> int:
+    def export_admin_import(
+        self,
+        stream,
+        directory: str,
+        shards: int = 4,
+        database: str = "neo4j",
+    ) -> List[str]:
         """
-        This function may be tricky to use!
-
-        ! WARNING 1: This operation makes a temporary copy of the entire dump
-        ! and places it into pre-specified `import_directory`:
-        ! https://neo4j.com/docs/operations-manual/4.0/configuration/file-locations/
-
-        ! WARNING 2: This frequently fails with following error:
-        ! `neobolt.exceptions.DatabaseError`: "Java heap space".
+        Converts a stream of edges (for example, the `edges` of another backend)
+        into CSV files for the offline `neo4j-admin database import` tool,
+        which is much faster for the first load of a fresh database.
+        Node IDs are deduplicated on disk and written once. Both nodes and relationships
+        are split into `shards` files, written concurrently, each with its own lock.
+        Labels and relationship types follow the `_v` and `_e` names of this instance.
+        Returns the command line to run on the DB host with the server stopped.
+        https://neo4j.com/docs/operations-manual/current/tools/neo4j-admin/neo4j-admin-import/
         """
-        cnt = self.number_of_edges()
-        current_id = self.biggest_edge_id() + 1
-        _, filename = os.path.split(filepath)
-
-        # We will need to link the file to import folder.
-        file_link = os.path.expanduser(self.import_directory)
-        file_link = os.path.join(file_link, filename)
-        file_link = os.path.abspath(file_link)
+        directory = os.path.abspath(os.path.expanduser(directory))
+        os.makedirs(directory, exist_ok=True)
+        nodes_header = os.path.join(directory, "nodes_header.csv")
+        edges_header = os.path.join(directory, "edges_header.csv")
+        with open(nodes_header, "w") as f:
+            f.write(f"_id:ID({self._v}),:LABEL\n")
+        with open(edges_header, "w") as f:
+            f.write(
+                f":START_ID({self._v}),:END_ID({self._v}),"
+                "_id:long,weight:double,label:int,is_directed:boolean,:TYPE\n"
+            )
+
+        nodes_paths = [os.path.join(directory, f"nodes-{i}.csv") for i in range(shards)]
+        edges_paths = [os.path.join(directory, f"edges-{i}.csv") for i in range(shards)]
+        nodes_files = [open(p, "w") for p in nodes_paths]
+        edges_files = [open(p, "w") for p in edges_paths]
+        locks = [threading.Lock() for _ in range(shards)]
+
+        def write_nodes(i: int, ids: np.ndarray):
+            nodes = "".join(f"{n},{self._v}\n" for n in ids.tolist())
+            with locks[i]:
+                nodes_files[i].write(nodes)
+
+        def write_edges(i: int, es: List[Edge]):
+            edges = "".join(
+                f"{e.first},{e.second},{e._id},{e.weight},{e.label},"
+                f"{'true' if e.is_directed else 'false'},{self._e}\n"
+                for e in es
+            )
+            with locks[i]:
+                edges_files[i].write(edges)
+
+        futures = list()
+
+        def submit(pool, *args):
+            futures.append(pool.submit(*args))
+            # Bound the number of chunks kept in memory.
+            if len(futures) >= 2 * shards:
+                futures.pop(0).result()
+
+        def write_edges_and_yield_members(pool):
+            parts = chunks(unpack_edges(stream), Neo4J.__max_import_chunk_size__)
+            for i, es in enumerate(parts):
+                submit(pool, write_edges, i % shards, es)
+                yield np.unique([[e.first, e.second] for e in es])
 
         try:
-            shutil.copy(filepath, file_link)
-            # https://neo4j.com/docs/cypher-manual/current/clauses/load-csv/#load-csv-importing-large-amounts-of-data
-            pattern_nodes = """
-            USING PERIODIC COMMIT %d
-            LOAD CSV WITH HEADERS FROM '%s' AS row
-            WITH
-                toInteger(row.first) AS id_from,
-                toInteger(row.second) AS id_to
-            MERGE (first:VERTEX {_id: id_from})
-            MERGE (second:VERTEX {_id: id_to});
-            """
-            pattern_edges = """
-            USING PERIODIC COMMIT %d
-            LOAD CSV WITH HEADERS FROM '%s' AS row
-            WITH
-                toInteger(row.first) AS id_from,
-                toInteger(row.second) AS id_to,
-                toFloat(row.weight) AS w,
-                toInteger(linenumber()) AS idx
-            MATCH (first:VERTEX {_id: id_from})
-            MATCH (second:VERTEX {_id: id_to})
-            CREATE (first)-[e:EDGE {_id: idx + %d, weight: w}]%s(second)
-            RETURN count(e)
-            """
-            d = "->" if is_directed else "-"
-            tasks = [
-                pattern_nodes % (Neo4J.__max_batch_size__, "file:///" + filename),
-                pattern_edges
-                % (Neo4J.__max_batch_size__, "file:///" + filename, current_id, d),
-            ]
-            for task in tasks:
-                task = task.replace("VERTEX", self._v)
-                task = task.replace("EDGE", self._e)
-                self.session.run(task)
+            with ThreadPoolExecutor(max_workers=shards) as pool:
+                # Node IDs are deduplicated with an external sort, spilling to disk,
+                # rather than kept in memory for the whole graph.
+                members = write_edges_and_yield_members(pool)
+                for i, ids in enumerate(deduplicate_ids(members)):
+                    submit(pool, write_nodes, i % shards, ids)
+                for future in futures:
+                    future.result()
         finally:
-            # Don't forget to copy temporary file!
-            os.unlink(file_link)
-        return self.number_of_edges() - cnt
+            for f in nodes_files + edges_files:
+                f.close()
+
+        return [
+            "neo4j-admin",
+            "database",
+            "import",
+            "full",
+            "--id-type=INTEGER",
+            "--nodes=" + ",".join([nodes_header, *nodes_paths]),
+            "--relationships=" + ",".join([edges_header, *edges_paths]),
+            database,
+        ]
 
     # ---
     # Helper methods.
     # ---
 
+    def _reduce_edges_of_shape(
+        self, shape: str, params: dict, key: int, with_weights: bool = True
+    ) -> GraphDegree:
+        """
+        When only the number of edges is needed, the `COUNT { }` subqueries are
+        answered from the degree stored with every node, without expanding
+        its relationships. That replaced the `size((v)-->())` syntax of Neo4j 4.
+        Weights and labels live on the relationships, so those have to be visited,
+        unless `with_weights` is false, or the graph is unweighted.
+        https://neo4j.com/docs/cypher-manual/current/planning-and-tuning/operators/operators-detail/#query-plan-get-degree
+        """
+        count_only = not with_weights or not self.weighted
+        if count_only and key < 0 and shape in Neo4J.__count_by_shape__:
+            c = self._first_record(
+                self._read(Neo4J.__count_by_shape__[shape], **params), "c"
+            )
+            return GraphDegree(int(c or 0), int(c or 0))
+
+        task, params = self._match_edges_of_shape(shape, params, key)
+        task += " RETURN count(e) AS c, sum(e.weight) AS s"
+        rs = self._read(task, **params)
+        return GraphDegree(
+            int(self._first_record(rs, "c") or 0),
+            float(self._first_record(rs, "s") or 0),
+        )
+
+    def _match_edges_of_shape(
+        self, shape: str, params: dict, key: int
+    ) -> Tuple[str, dict]:
+        """
+        Builds the beginning of a query, that binds every matching edge to `e` once.
+        """
+        task = Neo4J.__match_by_shape__[shape]
+        if shape == "containing":
+            # Self-loops would otherwise be matched in both directions.
+            task += " WITH DISTINCT e"
+        if key >= 0:
+            task += " WHERE e.label = $key"
+            params = dict(params, key=key)
+        return task, params
+
+    def _cypher(self, task: str) -> str:
+        """
+        Labels can't be passed as parameters, but they are constant for
+        every instance. So the query text doesn't change between calls,
+        and the server reuses the cached execution plan.
+        All the values must be passed as parameters.
+        """
+        task = task.replace("COLUMNS", Neo4J.__edge_columns__)
+        task = task.replace("VERTEX", self._v)
+        task = task.replace("EDGE", self._e)
+        return task
+
+    def _read(self, task: str, **params) -> list:
+        def work(tx):
+            return list(tx.run(self._cypher(task), **params))
+
+        return self.session.execute_read(work)
+
+    def _write(self, task: str, **params) -> list:
+        """
+        Runs in a managed transaction, that the driver retries on transient
+        failures, like deadlocks between concurrent `MERGE`s.
+        https://neo4j.com/docs/python-manual/current/transactions/
+        """
+
+        def work(tx):
+            return list(tx.run(self._cypher(task), **params))
+
+        return self.session.execute_write(work)
+
+    def _write_in_batches(self, task: str, rows: list) -> int:
+        """
+        Passes `rows` to the `UNWIND $rows` of `task` in bounded batches,
+        expecting the query to return the number of affected entries as `c`.
+        """
+        count = 0
+        for part in chunks(rows, Neo4J.__max_batch_size__):
+            count += int(self._first_record(self._write(task, rows=part), "c"))
+        return count
+
+    def _edge_to_row(self, e: Edge) -> dict:
+        return {
+            "_id": e._id,
+            "first": e.first,
+            "second": e.second,
+            "weight": e.weight,
+            "label": e.label,
+            "is_directed": bool(e.is_directed),
+        }
+
     def _records_to_edges(self, records) -> List[Edge]:
         if isinstance(records, Neo4jResult):
             records = list(records)
-        return [Edge(r["first._id"], r["second._id"], r["e.weight"]) for r in records]
+        return [
+            Edge(
+                _id=r["_id"] if r["_id"] is not None else -1,
+                first=r["first"],
+                second=r["second"],
+                weight=r["weight"] if r["weight"] is not None else 1,
+                label=r["label"] if r["label"] is not None else -1,
+                is_directed=r["is_directed"],
+            )
+            for r in records
+        ]
 
     def _first_record(self, records, key):
         if isinstance(records, Neo4jResult):
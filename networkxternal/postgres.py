@@ -1,11 +1,111 @@
-from networkxternal.base_sql import BaseSQL, EdgeSQL
+import struct
+import json
+from typing import Iterable
+
+import numpy as np
+from sqlalchemy import text
+
+from networkxternal.base_sql import BaseSQL, EdgeSQL, EdgeNewSQL
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch
+from networkxternal.helpers.streams import (
+    SerializedStream,
+    EdgesCSVStream,
+    EDGE_COLUMNS,
+)
+
+
+class EdgesBinaryStream(SerializedStream):
+    """
+    Serializes `Edge`s into the native binary `COPY` format of PostgreSQL.
+    It avoids text parsing on the server side, but is strictly typed,
+    so the layout must match the `EdgeSQL` column types exactly.
+    https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+    """
+
+    # Field count, then `(length, value)` pairs for `BIGINT`, `BIGINT`, `BIGINT`,
+    # `BOOLEAN`, `DOUBLE PRECISION` and `INTEGER` columns.
+    row_fixed = struct.Struct(">hiqiqiqi?idii")
+    field_length = struct.Struct(">i")
+    # The same layout with a trailing NULL payload, for column-wise encoding.
+    row_dtype = np.dtype(
+        [
+            ("count_fields", ">i2"),
+            ("len_id", ">i4"),
+            ("_id", ">i8"),
+            ("len_first", ">i4"),
+            ("first", ">i8"),
+            ("len_second", ">i4"),
+            ("second", ">i8"),
+            ("len_is_directed", ">i4"),
+            ("is_directed", "?"),
+            ("len_weight", ">i4"),
+            ("weight", ">f8"),
+            ("len_label", ">i4"),
+            ("label", ">i4"),
+            ("len_payload", ">i4"),
+        ]
+    )
+
+    def header(self) -> bytes:
+        return b"PGCOPY\n\xff\r\n\x00" + struct.pack(">ii", 0, 0)
+
+    def serialize(self, es: list) -> bytes:
+        parts = list()
+        for e in es:
+            parts.append(
+                self.row_fixed.pack(
+                    len(EDGE_COLUMNS),
+                    8,
+                    e._id,
+                    8,
+                    e.first,
+                    8,
+                    e.second,
+                    1,
+                    bool(e.is_directed),
+                    8,
+                    float(e.weight),
+                    4,
+                    e.label,
+                )
+            )
+            if e.payload:
+                payload = json.dumps(e.payload).encode()
+                parts.append(self.field_length.pack(len(payload)))
+                parts.append(payload)
+            else:
+                # NULL values are marked with a negative length.
+                parts.append(self.field_length.pack(-1))
+        return b"".join(parts)
+
+    def serialize_batch(self, batch: EdgesBatch) -> bytes:
+        rows = np.empty(len(batch), dtype=self.row_dtype)
+        rows["count_fields"] = len(EDGE_COLUMNS)
+        rows["len_id"] = 8
+        rows["_id"] = batch.ids
+        rows["len_first"] = 8
+        rows["first"] = batch.first
+        rows["len_second"] = 8
+        rows["second"] = batch.second
+        rows["len_is_directed"] = 1
+        rows["is_directed"] = batch.is_directed
+        rows["len_weight"] = 8
+        rows["weight"] = batch.weight
+        rows["len_label"] = 4
+        rows["label"] = batch.label
+        rows["len_payload"] = -1
+        return rows.tobytes()
+
+    def trailer(self) -> bytes:
+        return struct.pack(">h", -1)
 
 
 class PostgreSQL(BaseSQL):
     """
     Extends BaseSQL functionality with optimized operations:
-    *   Bulk imports and exports via:
-        https://github.com/jmcarp/sqlalchemy-postgres-copy
+    *   Bulk imports and exports via `COPY ... FROM STDIN` and `COPY ... TO STDOUT`,
+        streaming straight from Python generators into an `UNLOGGED` staging table.
     *   Async operations through less mature ORM: Gino (only PostgreSQL).
         https://github.com/python-gino/gino
     *   Allows natively querying JSON sub-properties via:
@@ -17,7 +117,7 @@ class PostgreSQL(BaseSQL):
         self.set_pragmas_on_first_launch()
 
     def set_pragmas_on_first_launch(self):
-        if self.number_of_edges() > 0:
+        if self.number_of_primary_edges() > 0:
             return
         # https://www.percona.com/blog/2018/08/31/tuning-postgresql-database-parameters-to-optimize-performance/
         # https://www.revsys.com/writings/postgresql-performance.html
@@ -29,23 +129,65 @@ class PostgreSQL(BaseSQL):
             # But this can't be changed without restarting the DB.
             # "SET shared_buffers='512MB';",
             # "SET wal_buffers='32MB';",
+            # The staging table is truncated after every import,
+            # so there is no reason to write its contents to WAL.
+            # https://www.postgresql.org/docs/current/sql-createtable.html#SQL-CREATETABLE-UNLOGGED
+            f"ALTER TABLE {EdgeNewSQL.__tablename__} SET UNLOGGED;",
         ]
         with self.get_session() as s:
             for p in pragmas:
-                s.execute(p)
+                s.execute(text(p))
                 s.commit()
 
-    # TODO: Change the IDs of imported entries.
-    # def upsert_bulk_from_path(self, path: str) -> int:
-    #     cnt = self.number_of_edges()
-    #     with open(path, 'r') as f:
-    #         conn = self.engine.raw_connection()
-    #         cursor = conn.cursor()
-    #         cmd = f'COPY {EdgeNewSQL.__tablename__} (first, second, weight) FROM STDIN WITH (FORMAT CSV, HEADER TRUE)'
-    #         cursor.copy_expert(cmd, f)
-    #         conn.commit()
-    #     self.upsert_table(EdgeNewSQL.__tablename__)
-    #     return self.number_of_edges() - cnt
+    # region Bulk Writes
+
+    def add_stream(
+        self, stream: Iterable[Edge], upsert=True, copy_format="binary"
+    ) -> int:
+        """
+        Pipes the `Edge`s from any iterable into the staging table with `COPY`,
+        and then merges it into the main table, keeping the original IDs.
+        The `copy_format` can be either `"binary"` or `"csv"`.
+        """
+        stream = self.unique_edges(stream)
+        if copy_format == "binary":
+            f = EdgesBinaryStream(stream)
+        else:
+            f = EdgesCSVStream(stream)
+        columns = ", ".join(EDGE_COLUMNS)
+        task = f"COPY {EdgeNewSQL.__tablename__} ({columns}) FROM STDIN WITH (FORMAT {copy_format})"
+
+        self.clear_table(EdgeNewSQL.__tablename__)
+        with self.get_raw_connection() as conn:
+            cursor = conn.cursor()
+            cursor.copy_expert(task, f)
+            cursor.close()
+
+        if upsert:
+            self.upsert_table(EdgeNewSQL.__tablename__)
+        else:
+            self.insert_table(EdgeNewSQL.__tablename__)
+        self.clear_table(EdgeNewSQL.__tablename__)
+        self.add_missing_nodes()
+        return f.count_rows
+
+    def export_stream(
+        self, f, copy_format="csv", table_name=EdgeSQL.__tablename__
+    ) -> int:
+        """
+        Streams the contents of the edges table into a writable file-like object,
+        without materializing ORM objects. Columns follow the `EDGE_COLUMNS` order.
+        """
+        columns = ", ".join(EDGE_COLUMNS)
+        task = f"COPY {table_name} ({columns}) TO STDOUT WITH (FORMAT {copy_format})"
+        with self.get_raw_connection() as conn:
+            cursor = conn.cursor()
+            cursor.copy_expert(task, f)
+            result = cursor.rowcount
+            cursor.close()
+        return result
+
+    # region Helpers
 
     def upsert_table(self, source_name: str):
         # https://stackoverflow.com/a/17267423/2766161
@@ -53,9 +195,15 @@ class PostgreSQL(BaseSQL):
             INSERT INTO {EdgeSQL.__tablename__}
             SELECT * FROM {source_name}
             ON CONFLICT (_id) DO UPDATE SET
-            (first, second, weight, attributes_json) =
-            (EXCLUDED.first, EXCLUDED.second, EXCLUDED.weight, EXCLUDED.attributes_json);
+            (first, second, is_directed, weight, label, payload_json) =
+            (EXCLUDED.first, EXCLUDED.second, EXCLUDED.is_directed,
+            EXCLUDED.weight, EXCLUDED.label, EXCLUDED.payload_json);
         """
         with self.get_session() as s:
-            s.execute(migration)
+            s.execute(text(migration))
             s.commit()
+
+    def clear_table(self, table_name: str):
+        # Unlike `DELETE`, doesn't scan the table and immediately reclaims disk space.
+        with self.get_session() as s:
+            s.execute(text(f"TRUNCATE {table_name};"))
@@ -1,15 +1,27 @@
-from networkxternal.base_sql import BaseSQL, EdgeSQL
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Sequence, Set, Tuple
 
+import sqlalchemy as sa
+from sqlalchemy.pool import StaticPool
 
-class SQLiteMem(BaseSQL):
-    """
-    In-memory version of SQLite database.
-    """
-
-    __is_concurrent__ = False
-    __max_batch_size__ = 5000000
-    __edge_type__ = EdgeSQL
-    __in_memory__ = True
+from networkxternal.base_sql import (
+    BaseSQL,
+    EdgeSQL,
+    NodeSQL,
+    edge_row,
+    node_row,
+    unique_rows,
+)
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch
+from networkxternal.helpers.node import Node
+from networkxternal.helpers.graph_degree import GraphDegree
+from networkxternal.helpers.algorithms import is_sequence_of, chunks
+from networkxternal.helpers.streams import EDGE_COLUMNS, NODE_COLUMNS
 
 
 class SQLite(BaseSQL):
@@ -20,21 +32,279 @@ class SQLite(BaseSQL):
     will write ~200 GB of data to disk.
     The resulting file size will be ~1 GB.
 
+    For embedded databases the Python overhead dominates the cost of each query,
+    so the hot paths (`has_edge`, `neighbors`, `reduce_edges`, `add`, `remove`)
+    bypass SQLAlchemy and go straight to the `sqlite3` connection.
+    The SQL text of every query only depends on its shape, so the prepared
+    statements get reused from the `sqlite3` statement cache and only
+    the parameters are bound. SQLAlchemy is only used for schema management
+    and less frequent operations.
+
+    Read replicas can be emulated with copies of the database file passed as `read_urls`.
+    With `readers > 0`, a file-backed database also keeps a pool of read-only
+    connections. In WAL mode readers never block the writer or each other,
+    so lookups from different threads can proceed in parallel.
+    Writes are still serialized through the single shared connection,
+    and so are the reads, that fall back to it, and all the ORM sessions.
+
     https://www.sqlite.org/faq.html#q19
+    https://www.sqlite.org/wal.html#concurrency
     https://stackoverflow.com/a/6533930/2766161
+    https://docs.python.org/3/library/sqlite3.html#sqlite3.connect
     """
 
     __is_concurrent__ = False
     __max_batch_size__ = 1000000
     __edge_type__ = EdgeSQL
     __in_memory__ = False
+    __where_by_shape__ = {
+        "containing": "(first=:n OR second=:n)",
+        "to": "second=:v",
+        "from": "first=:u",
+        "between": "first=:u AND second=:v",
+        "between_any": "((first=:u AND second=:v) OR (first=:v AND second=:u))",
+    }
 
-    def __init__(self, url, **kwargs):
+    def __init__(self, url, readers=0, **kwargs):
         BaseSQL.__init__(self, url, **kwargs)
+        # The `StaticPool` guarantees that SQLAlchemy sessions and our raw
+        # statements share the same connection, so they never lock each other.
+        self.connection = self.engine.raw_connection().driver_connection
+        self.read_connections = [
+            e.raw_connection().driver_connection for e in self.read_engines
+        ]
+        self.write_lock = threading.RLock()
+        self.replica_locks = [threading.RLock() for _ in self.read_connections]
+        self.readers = queue.Queue()
+        if self.__in_memory__ or self.engine.url.database in (None, "", ":memory:"):
+            readers = 0
+        self.count_readers = readers
+        for _ in range(readers):
+            self.readers.put(self.make_reader())
         self.set_pragmas_on_first_launch()
 
+    # region Metadata
+
+    def reduce_edges(self, u=None, v=None, key=None) -> GraphDegree:
+        where, args = self.where_edges(u, v, key)
+        task = f"SELECT COUNT(weight), SUM(weight) FROM {EdgeSQL.__tablename__}{where}"
+        with self.get_reader() as r:
+            count, weight = r.execute(task, args).fetchone()
+        return GraphDegree(count, weight or 0)
+
+    # region Random Reads
+
+    def has_edge(self, u, v, key=None) -> Sequence[Edge]:
+        where, args = self.where_edges(u, v, key)
+        columns = "_id, first, second, weight, label, is_directed, payload_json"
+        task = f"SELECT {columns} FROM {EdgeSQL.__tablename__}{where}"
+        with self.get_reader() as r:
+            return [
+                Edge(
+                    _id=row[0],
+                    first=row[1],
+                    second=row[2],
+                    weight=row[3],
+                    label=row[4],
+                    is_directed=bool(row[5]),
+                    payload=json.loads(row[6]) if row[6] else {},
+                )
+                for row in r.execute(task, args)
+            ]
+
+    def neighbors(self, n) -> Set[int]:
+        n = self.make_node_id(n)
+        task = f"""
+            SELECT second FROM {EdgeSQL.__tablename__} WHERE first=?
+            UNION
+            SELECT first FROM {EdgeSQL.__tablename__} WHERE second=?"""
+        with self.get_reader() as r:
+            result = {row[0] for row in r.execute(task, (n, n))}
+        result.discard(n)
+        return result
+
+    def successors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        n = self.make_node_id(n)
+        task = f"SELECT DISTINCT second FROM {EdgeSQL.__tablename__} WHERE first=?"
+        with self.get_reader() as r:
+            result = {row[0] for row in r.execute(task, (n,))}
+        result.discard(n)
+        return result
+
+    def predecessors(self, n) -> Set[int]:
+        if not self.directed:
+            return self.neighbors(n)
+        n = self.make_node_id(n)
+        task = f"SELECT DISTINCT first FROM {EdgeSQL.__tablename__} WHERE second=?"
+        with self.get_reader() as r:
+            result = {row[0] for row in r.execute(task, (n,))}
+        result.discard(n)
+        return result
+
+    # region Random Writes
+
+    def add(self, obj, upsert=True) -> int:
+        if isinstance(obj, (Edge, Node)):
+            obj = [obj]
+        if is_sequence_of(obj, Edge):
+            table, columns, rows = (
+                EdgeSQL.__tablename__,
+                EDGE_COLUMNS,
+                unique_rows(map(edge_row, obj)),
+            )
+        elif is_sequence_of(obj, Node):
+            table, columns, rows = (
+                NodeSQL.__tablename__,
+                NODE_COLUMNS,
+                unique_rows(map(node_row, obj)),
+            )
+        else:
+            return super().add(obj, upsert=upsert)
+        return self.execute_many(self.task_insert(table, columns, upsert), rows)
+
+    def add_batch(self, batch: EdgesBatch, upsert=True) -> int:
+        task = self.task_insert(EdgeSQL.__tablename__, EDGE_COLUMNS, upsert)
+        return self.execute_many(task, unique_rows(batch.rows()))
+
+    def remove(self, obj) -> int:
+        if isinstance(obj, (Edge, Node)):
+            obj = [obj]
+        if is_sequence_of(obj, Edge):
+            with_ids = [(e._id,) for e in obj if e._id >= 0]
+            without_ids = [
+                (e.first, e.second, bool(e.is_directed)) for e in obj if e._id < 0
+            ]
+            return self.execute_many(
+                f"DELETE FROM {EdgeSQL.__tablename__} WHERE _id=?",
+                with_ids,
+            ) + self.execute_many(
+                f"DELETE FROM {EdgeSQL.__tablename__} WHERE first=? AND second=? AND is_directed=?",
+                without_ids,
+            )
+        elif is_sequence_of(obj, Node):
+            ids = [n._id for n in obj]
+            return self.execute_many(
+                f"DELETE FROM {EdgeSQL.__tablename__} WHERE first=? OR second=?",
+                [(n, n) for n in ids],
+            ) + self.execute_many(
+                f"DELETE FROM {NodeSQL.__tablename__} WHERE _id=?",
+                [(n,) for n in ids],
+            )
+        return super().remove(obj)
+
+    # region Helpers
+
+    def make_engine(self, url: str):
+        """
+        Every engine holds a single connection in a `StaticPool`, so it can't
+        be sized. Concurrent lookups are served by the `readers` pool instead.
+        """
+        sized = {"pool_size", "max_overflow"}.intersection(self.engine_options)
+        if len(sized):
+            raise ValueError(
+                f"SQLite shares a single connection, use `readers` instead of: {sorted(sized)}"
+            )
+        return sa.create_engine(
+            url,
+            poolclass=StaticPool,
+            connect_args={
+                "check_same_thread": False,
+                # Every distinct query shape gets a slot in the prepared statements LRU.
+                "cached_statements": 256,
+            },
+            **self.engine_options,
+        )
+
+    def make_reader(self) -> sqlite3.Connection:
+        path = self.engine.url.database
+        return sqlite3.connect(
+            f"file:{path}?mode=ro",
+            uri=True,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+
+    @contextmanager
+    def get_reader(self):
+        """
+        Borrows a connection to one of the `read_urls` replicas, or a read-only
+        connection from the pool, blocking until it's available.
+        Falls back to the shared connection, locked against concurrent writes.
+        """
+        if len(self.replicas):
+            with self.replicas.route() as i:
+                if i is not None:
+                    with self.replica_locks[i]:
+                        yield self.read_connections[i]
+                    return
+        if self.count_readers == 0:
+            with self.write_lock:
+                yield self.connection
+            return
+        r = self.readers.get()
+        try:
+            yield r
+        finally:
+            self.readers.put(r)
+
+    @contextmanager
+    def open_session(self, session_maker):
+        """
+        Every engine has a single connection, shared by the ORM sessions
+        and the raw statements, so the sessions hold the same locks.
+        """
+        lock = self.write_lock
+        if session_maker in self.read_session_makers:
+            lock = self.replica_locks[self.read_session_makers.index(session_maker)]
+        with lock, BaseSQL.open_session(self, session_maker) as session:
+            yield session
+
+    def execute_many(self, task: str, rows) -> int:
+        count = 0
+        chunk_len = type(self).__max_batch_size__
+        self.replicas.mark_write()
+        with self.write_lock:
+            try:
+                for part in chunks(rows, chunk_len):
+                    count += self.connection.executemany(task, part).rowcount
+                self.connection.commit()
+            except Exception as e:
+                print(e)
+                self.connection.rollback()
+                raise e
+        return count
+
+    def task_insert(self, table: str, columns: Sequence[str], upsert: bool) -> str:
+        placeholders = ", ".join("?" * len(columns))
+        if upsert:
+            updates = ", ".join(f"{c}=excluded.{c}" for c in columns if c != "_id")
+            task = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+            task += f" ON CONFLICT(_id) DO UPDATE SET {updates}"
+        else:
+            # Just like in `BaseSQL`, conflicting rows fail the whole batch.
+            task = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({placeholders})"
+        return task
+
+    def where_edges(self, u, v, key) -> Tuple[str, dict]:
+        """
+        Raw SQL counterpart of `statement_edges`, with the same shapes and parameter names.
+        """
+        shape, params = self.shape_edges_members(u, v)
+        conditions = list()
+        if shape in SQLite.__where_by_shape__:
+            conditions.append(SQLite.__where_by_shape__[shape])
+        key = self.make_label(key)
+        if key >= 0:
+            params["label"] = key
+            conditions.append("label=:label")
+        if len(conditions) == 0:
+            return "", params
+        return " WHERE " + " AND ".join(conditions), params
+
     def set_pragmas_on_first_launch(self):
-        if self.number_of_edges() > 0:
+        if self.number_of_primary_edges() > 0:
             return
         # https://sqlite.org/pragma.html#modify
         # https://stackoverflow.com/a/58547438/2766161
@@ -43,9 +313,6 @@ class SQLite(BaseSQL):
             "PRAGMA page_size=4096;",
             "PRAGMA cache_size=10000;",
             "PRAGMA journal_mode=WAL;",
-            # The number of system calls for filesystem operations
-            # is reduced, possibly resulting in a small performance increase.
-            "PRAGMA locking_mode=EXCLUSIVE;",
             # With synchronous `OFF`, SQLite continues without syncing
             # as soon as it has handed data off to the operating system.
             # If the application running SQLite crashes, the data will be safe,
@@ -77,7 +344,25 @@ class SQLite(BaseSQL):
             # When the limit is zero, that means no auxiliary threads will be launched.
             "PRAGMA threads=8;",
         ]
-        with self.get_session() as s:
-            for p in pragmas:
-                s.execute(p)
-                s.commit()
+        # The number of system calls for filesystem operations
+        # is reduced, possibly resulting in a small performance increase.
+        # But the exclusive lock would shut out all the read-only connections.
+        if self.count_readers == 0:
+            pragmas.append("PRAGMA locking_mode=EXCLUSIVE;")
+        for p in pragmas:
+            self.connection.execute(p)
+        self.connection.commit()
+
+
+class SQLiteMem(SQLite):
+    """
+    In-memory version of SQLite database.
+    """
+
+    __is_concurrent__ = False
+    __max_batch_size__ = 5000000
+    __edge_type__ = EdgeSQL
+    __in_memory__ = True
+
+    def __init__(self, url="sqlite:///:memory:", **kwargs):
+        SQLite.__init__(self, url, **kwargs)
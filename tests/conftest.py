@@ -0,0 +1,14 @@
+import pytest
+
+from networkxternal.sqlite import SQLite
+
+
+@pytest.fixture
+def sqlite_graph(tmp_path):
+    gdb = SQLite(url=f"sqlite:///{tmp_path / 'graph.db'}")
+    yield gdb
+    gdb.engine.dispose()
+
+
+def edges_of(gdb) -> list:
+    return sorted((e._id, e.first, e.second, e.weight) for e in gdb.edges)
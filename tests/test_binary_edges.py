@@ -0,0 +1,103 @@
+import os
+
+import numpy as np
+import pytest
+
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, unpack_edges
+from networkxternal.helpers.binary_edges import (
+    BINARY_HEADER,
+    read_edges_binary,
+    write_edges_binary,
+    yield_edges_batches_from_binary,
+)
+from networkxternal.helpers.parsing import convert_to_binary, import_graph
+
+from conftest import edges_of
+
+
+def test_round_trip_keeps_ids(tmp_path):
+    path = str(tmp_path / "sample.bedges")
+    es = [
+        Edge(_id=10 + i, first=i, second=2**40 + i, weight=i / 4, label=i % 3)
+        for i in range(1000)
+    ]
+    assert write_edges_binary(iter(es), path, chunk_len=64) == len(es)
+    read = list(unpack_edges(yield_edges_batches_from_binary(path, batch_size=100)))
+    assert [(e._id, e.first, e.second, e.weight, e.label) for e in read] == [
+        (e._id, e.first, e.second, e.weight, e.label) for e in es
+    ]
+
+
+def test_weights_and_labels_are_exact(tmp_path):
+    path = str(tmp_path / "sample.bedges")
+    weights = [0.1, 1 / 3, 1e300, 2**60 + 0.5]
+    es = [
+        Edge(_id=i, first=i, second=i + 1, weight=w, label=2**40 + i)
+        for i, w in enumerate(weights)
+    ]
+    write_edges_binary(es, path)
+    read = list(unpack_edges(yield_edges_batches_from_binary(path)))
+    assert [e.weight for e in read] == weights
+    assert [e.label for e in read] == [2**40 + i for i in range(len(weights))]
+
+
+def test_mixed_directions_are_rejected(tmp_path):
+    path = str(tmp_path / "mixed.bedges")
+    es = [
+        Edge(_id=0, first=1, second=2),
+        Edge(_id=1, first=2, second=3, is_directed=False),
+    ]
+    with pytest.raises(ValueError):
+        write_edges_binary(es, path)
+    ids = np.arange(3)
+    batches = [
+        EdgesBatch(ids=ids, first=ids, second=ids, weight=np.ones(3)),
+        EdgesBatch(
+            ids=ids + 3, first=ids, second=ids, weight=np.ones(3), is_directed=False
+        ),
+    ]
+    with pytest.raises(ValueError):
+        write_edges_binary(batches, path)
+
+
+def test_undirected_and_empty(tmp_path):
+    path = str(tmp_path / "undirected.bedges")
+    write_edges_binary([Edge(_id=0, first=1, second=2, is_directed=False)], path)
+    _, is_directed = read_edges_binary(path)
+    assert not is_directed
+
+    path = str(tmp_path / "empty.bedges")
+    assert write_edges_binary([], path) == 0
+    records, _ = read_edges_binary(path)
+    assert len(records) == 0
+
+
+def test_zero_header_is_rejected(tmp_path):
+    path = tmp_path / "partial.bedges"
+    path.write_bytes(b"\0" * BINARY_HEADER.size)
+    with pytest.raises(ValueError):
+        read_edges_binary(str(path))
+
+
+def test_converted_csv_imports_into_sqlite(tmp_path, sqlite_graph):
+    csv_path = tmp_path / "edges.csv"
+    csv_path.write_text("first,second,weight\n1,2,0.5\n2,3,\n3,1,2\n")
+    binary_path = convert_to_binary(str(csv_path))
+    assert binary_path.endswith(".bedges")
+    # Fresh conversions are reused.
+    assert convert_to_binary(str(csv_path)) == binary_path
+
+    import_graph(sqlite_graph, binary_path)
+    assert edges_of(sqlite_graph) == [(0, 1, 2, 0.5), (1, 2, 3, 1.0), (2, 3, 1, 2.0)]
+
+
+def test_stale_layout_is_converted_again(tmp_path):
+    csv_path = tmp_path / "edges.csv"
+    csv_path.write_text("first,second,weight\n1,2,0.1\n")
+    binary_path = tmp_path / "edges.csv.bedges"
+    binary_path.write_bytes(BINARY_HEADER.pack(b"NXEDGES1", 1, 32, 0, 0))
+    os.utime(binary_path, (os.path.getmtime(csv_path) + 10,) * 2)
+    assert convert_to_binary(str(csv_path)) == str(binary_path)
+    read = list(unpack_edges(yield_edges_batches_from_binary(str(binary_path))))
+    assert [(e.first, e.second, e.weight) for e in read] == [(1, 2, 0.1)]
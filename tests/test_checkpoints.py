@@ -0,0 +1,144 @@
+import gzip
+import os
+
+import pytest
+
+from networkxternal.sqlite import SQLite
+from networkxternal.helpers.checkpoints import import_resumable
+from networkxternal.helpers.parsing import import_graph
+
+from conftest import edges_of
+
+
+class Crash(Exception):
+    pass
+
+
+def write_csv(path, rows) -> str:
+    path.write_text("\n".join(["first,second,weight", *rows]) + "\n")
+    return str(path)
+
+
+def crash_after(monkeypatch, gdb, method: str, count_calls: int):
+    """
+    Makes the `method` of `gdb` raise on the call after `count_calls` successful ones.
+    """
+    original = getattr(gdb, method)
+    calls = [0]
+
+    def crashing(*args, **kwargs):
+        calls[0] += 1
+        if calls[0] > count_calls:
+            raise Crash()
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(gdb, method, crashing)
+
+
+def test_resume_after_failed_batch(tmp_path, sqlite_graph, monkeypatch):
+    rows = [f"{i},{i + 1},{i % 4 + 1}" for i in range(2000)]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    crash_after(monkeypatch, sqlite_graph, "add_batch", 5)
+    with pytest.raises(Crash):
+        import_resumable(sqlite_graph, path, block_size=512, upsert=False)
+    count_before = sqlite_graph.number_of_edges()
+    assert 0 < count_before < len(rows)
+
+    monkeypatch.undo()
+    count = import_resumable(sqlite_graph, path, block_size=512, upsert=False)
+    assert count == len(rows) - count_before
+    assert edges_of(sqlite_graph) == [
+        (i, i, i + 1, float(i % 4 + 1)) for i in range(len(rows))
+    ]
+    assert sqlite_graph.load_checkpoints(os.path.abspath(path)) == []
+
+
+def test_resume_replays_unrecorded_batch(tmp_path, sqlite_graph, monkeypatch):
+    rows = [f"{i},{i + 1},1" for i in range(2000)]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    # The initial checkpoint and three batches are recorded, while
+    # the fourth batch is written, but its checkpoint is lost.
+    crash_after(monkeypatch, sqlite_graph, "save_checkpoint", 4)
+    with pytest.raises(Crash):
+        import_resumable(sqlite_graph, path, block_size=512, upsert=False)
+
+    monkeypatch.undo()
+    import_resumable(sqlite_graph, path, block_size=512, upsert=False)
+    assert edges_of(sqlite_graph) == [(i, i, i + 1, 1.0) for i in range(len(rows))]
+
+
+def test_resume_into_simple_graph(tmp_path, monkeypatch):
+    gdb = SQLite(
+        url=f"sqlite:///{tmp_path / 'graph.db'}",
+        multigraph=False,
+        duplicates="sum_weights",
+    )
+    rows = [f"{i % 40},{(i * 7) % 30},1" for i in range(3000)]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    crash_after(monkeypatch, gdb, "add_batch", 1)
+    with pytest.raises(Crash):
+        import_resumable(gdb, path, block_size=256, upsert=False)
+
+    monkeypatch.undo()
+    import_resumable(gdb, path, block_size=256, upsert=False)
+    pairs = {(i % 40, (i * 7) % 30) for i in range(3000)}
+    assert gdb.number_of_edges() == len(pairs)
+    assert gdb.reduce_edges().weight == len(rows)
+    assert list(tmp_path.glob("*.bedges")) == []
+
+
+@pytest.mark.parametrize("name", ["graph.edges", "graph.mtx", "edges.csv.gz"])
+def test_resume_converted_formats(tmp_path, sqlite_graph, monkeypatch, name):
+    if name.endswith(".mtx"):
+        lines = ["%%MatrixMarket matrix coordinate real general", "100 100 3000"]
+    else:
+        lines = ["first,second,weight" if ".csv" in name else "% directed weighted"]
+    separator = "," if ".csv" in name else " "
+    lines += [
+        separator.join(map(str, (i % 97 + 1, i % 89 + 1, i))) for i in range(3000)
+    ]
+    text = "\n".join(lines) + "\n"
+    path = tmp_path / name
+    if name.endswith(".gz"):
+        path.write_bytes(gzip.compress(text.encode()))
+    else:
+        path.write_text(text)
+
+    reference = SQLite(url=f"sqlite:///{tmp_path / 'reference.db'}")
+    import_graph(reference, str(path))
+    assert reference.number_of_edges() == 3000
+
+    crash_after(monkeypatch, sqlite_graph, "add_batch", 3)
+    with pytest.raises(Crash):
+        import_resumable(sqlite_graph, str(path), block_size=1024, upsert=False)
+    monkeypatch.undo()
+    import_resumable(sqlite_graph, str(path), block_size=1024, upsert=False)
+    assert edges_of(sqlite_graph) == edges_of(reference)
+    assert list(tmp_path.glob("*.bedges")) == []
+    reference.engine.dispose()
+
+
+def test_unsupported_format_is_rejected(tmp_path, sqlite_graph):
+    path = tmp_path / "edges.txt"
+    path.write_text("1,2,3\n")
+    with pytest.raises(ValueError):
+        import_resumable(sqlite_graph, str(path))
+    assert sqlite_graph.load_checkpoints(str(path)) == []
+
+
+def test_resume_after_skipped_lines(tmp_path, sqlite_graph, monkeypatch):
+    # Every block ends with lines, that aren't edges, but still take their IDs.
+    group = ["1,2,1", "2,3,1", "", "% comment"]
+    path = write_csv(tmp_path / "edges.csv", group * 300)
+    block_size = 2 * len("\n".join(group) + "\n")
+    crash_after(monkeypatch, sqlite_graph, "add_batch", 4)
+    with pytest.raises(Crash):
+        import_resumable(sqlite_graph, path, block_size=block_size, upsert=False)
+    monkeypatch.undo()
+    import_resumable(sqlite_graph, path, block_size=block_size, upsert=False)
+
+    reference = SQLite(url=f"sqlite:///{tmp_path / 'reference.db'}")
+    import_graph(reference, path)
+    assert edges_of(sqlite_graph) == edges_of(reference)
+    assert sqlite_graph.number_of_edges() == 600
+    reference.engine.dispose()
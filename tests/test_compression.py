@@ -0,0 +1,73 @@
+import bz2
+import gzip
+import lzma
+import threading
+
+import pytest
+
+from networkxternal.helpers.compression import DecompressingStream, detect_compression
+from networkxternal.helpers.edges_batch import unpack_edges
+from networkxternal.helpers.import_stats import ImportStats
+from networkxternal.helpers.parsing import yield_edges_batches_from_file
+
+COMPRESSORS = {"gz": gzip.compress, "bz2": bz2.compress, "xz": lzma.compress}
+
+
+def as_tuples(batches) -> list:
+    return [(e._id, e.first, e.second, e.weight) for e in unpack_edges(batches)]
+
+
+def write_edges(tmp_path, name: str, count: int = 20_000):
+    if name.startswith("edges.csv"):
+        lines = ["first,second,weight"]
+        lines += [f"{i},{i * 3 % 1000},{i % 7}" for i in range(count)]
+    else:
+        lines = ["% directed weighted"]
+        lines += [f"{i} {i * 3 % 1000} {i % 7}" for i in range(count)]
+    text = ("\n".join(lines) + "\n").encode()
+    plain = tmp_path / name.rsplit(".", 1)[0]
+    plain.write_bytes(text)
+    path = tmp_path / name
+    path.write_bytes(COMPRESSORS[name.rsplit(".", 1)[1]](text))
+    return str(plain), str(path)
+
+
+@pytest.mark.parametrize("suffix", ["gz", "bz2", "xz"])
+@pytest.mark.parametrize("name", ["edges.csv", "graph.edges"])
+def test_round_trip(tmp_path, name, suffix):
+    plain, path = write_edges(tmp_path, f"{name}.{suffix}")
+    assert detect_compression(plain) is None
+    assert detect_compression(path) is not None
+    stats = ImportStats()
+    result = as_tuples(yield_edges_batches_from_file(path, stats=stats))
+    assert result == as_tuples(yield_edges_batches_from_file(plain))
+    assert len(result) == 20_000
+    if name.endswith(".csv"):
+        assert stats.count_bytes == len(open(plain, "rb").read())
+        assert 0 < stats.count_compressed_bytes < stats.count_bytes
+
+
+@pytest.mark.parametrize("suffix", ["gz", "bz2", "xz"])
+def test_early_close(tmp_path, suffix):
+    _, path = write_edges(tmp_path, f"edges.csv.{suffix}", count=200_000)
+    threads_before = threading.active_count()
+    stream = DecompressingStream(path, detect_compression(path), 1024, 2)
+    assert len(stream.read(100)) == 100
+    stream.close()
+    assert not stream.thread.is_alive()
+
+    batches = yield_edges_batches_from_file(path)
+    next(batches)
+    batches.close()
+    assert threading.active_count() == threads_before
+
+
+@pytest.mark.parametrize("suffix", ["gz", "bz2", "xz"])
+def test_errors_reach_the_reader(tmp_path, suffix):
+    _, path = write_edges(tmp_path, f"edges.csv.{suffix}")
+    with open(path, "rb") as f:
+        truncated = f.read()[:-100]
+    with open(path, "wb") as f:
+        f.write(truncated)
+    with pytest.raises((EOFError, OSError, lzma.LZMAError)):
+        as_tuples(yield_edges_batches_from_file(path))
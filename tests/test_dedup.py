@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+
+from networkxternal.helpers.dedup import StreamingDedup, deduplicate_ids
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch, unpack_edges
+from networkxternal.helpers.parsing import import_graph
+from networkxternal.sqlite import SQLite
+
+from conftest import edges_of
+
+
+def random_batches(count_batches=20, batch_size=500, seed=42) -> list:
+    rng = np.random.default_rng(seed)
+    batches = list()
+    for i in range(count_batches):
+        batches.append(
+            EdgesBatch(
+                ids=np.arange(i * batch_size, (i + 1) * batch_size, dtype=np.int64),
+                first=rng.integers(0, 60, batch_size),
+                second=rng.integers(0, 60, batch_size),
+                weight=rng.integers(1, 5, batch_size).astype(np.float64),
+                is_directed=bool(i % 3),
+            )
+        )
+    return batches
+
+
+def reference(batches, policy) -> list:
+    groups = dict()
+    for e in unpack_edges(batches):
+        members = (e.first, e.second)
+        key = (members if e.is_directed else tuple(sorted(members)), e.is_directed)
+        groups.setdefault(key, []).append(e)
+    result = list()
+    for es in groups.values():
+        kept = es[-1] if policy == "keep_last" else es[0]
+        weight = sum(e.weight for e in es) if policy == "sum_weights" else kept.weight
+        result.append((kept._id, kept.first, kept.second, weight, kept.is_directed))
+    return sorted(result)
+
+
+def deduplicated(batches, **kwargs) -> list:
+    es = unpack_edges(StreamingDedup(**kwargs)(batches))
+    return sorted((e._id, e.first, e.second, e.weight, e.is_directed) for e in es)
+
+
+@pytest.mark.parametrize("policy", ["keep_first", "keep_last", "sum_weights"])
+@pytest.mark.parametrize("capacity", [16, 1_000_000])
+def test_matches_reference(tmp_path, policy, capacity):
+    # Small runs force merging, a tiny Bloom filter reports mostly false positives.
+    batches = random_batches()
+    kwargs = dict(run_size=700, capacity=capacity, directory=str(tmp_path))
+    assert deduplicated(batches, policy=policy, **kwargs) == reference(batches, policy)
+
+
+class TaggedEdge(Edge):
+    pass
+
+
+@pytest.mark.parametrize("policy", ["keep_first", "keep_last", "sum_weights"])
+@pytest.mark.parametrize("capacity", [16, 1_000_000])
+def test_edges_keep_payloads(tmp_path, policy, capacity):
+    batches = random_batches(count_batches=6)
+    es = [
+        TaggedEdge(**{**e.__dict__, "payload": {"n": e._id}})
+        for e in unpack_edges(batches)
+    ]
+    dedup = StreamingDedup(
+        policy=policy, run_size=700, capacity=capacity, directory=str(tmp_path)
+    )
+    result = list(dedup(es))
+    assert all(type(e) is TaggedEdge and e.payload == {"n": e._id} for e in result)
+    assert sorted(
+        (e._id, e.first, e.second, e.weight, e.is_directed) for e in result
+    ) == reference(batches, policy)
+
+
+def test_unique_edges_are_not_spilled(tmp_path):
+    count = 5000
+    batch = EdgesBatch(
+        ids=np.arange(count),
+        first=np.arange(count),
+        second=np.arange(count) + 1,
+        weight=np.ones(count),
+        label=np.full(count, 2**40),
+    )
+    dedup = StreamingDedup(run_size=1000, directory=str(tmp_path))
+    result = list(dedup([batch]))
+    assert sum(len(b) for b in result) == dedup.count_output == count
+    assert all((b.label == 2**40).all() for b in result)
+    assert sum(len(run) for run in dedup.candidates.runs) < count // 100
+
+
+def test_deduplicate_ids(tmp_path):
+    rng = np.random.default_rng(7)
+    arrays = [rng.integers(-(2**62), 2**62, 100) for _ in range(5)]
+    arrays += [rng.integers(0, 300, 1000) for _ in range(10)]
+    ids = np.concatenate(list(deduplicate_ids(arrays, run_size=512, capacity=64)))
+    assert sorted(ids.tolist()) == sorted(set(np.concatenate(arrays).tolist()))
+
+
+def test_import_into_simple_graph(tmp_path):
+    gdb = SQLite(url=f"sqlite:///{tmp_path / 'graph.db'}", multigraph=False)
+    rows = [f"{i % 50},{(i * 3) % 20},{i}" for i in range(2000)]
+    path = tmp_path / "edges.csv"
+    path.write_text("\n".join(["first,second,weight", *rows]) + "\n")
+    import_graph(gdb, str(path))
+    firsts = dict()
+    for i in range(2000):
+        firsts.setdefault((i % 50, (i * 3) % 20), i)
+    assert edges_of(gdb) == sorted((i, u, v, float(i)) for (u, v), i in firsts.items())
+    gdb.engine.dispose()
+
+
+def test_add_stream_keeps_payloads(tmp_path):
+    gdb = SQLite(url=f"sqlite:///{tmp_path / 'graph.db'}", multigraph=False)
+    es = [
+        Edge(_id=i, first=i % 7, second=10 + i % 5, payload={"n": i})
+        for i in range(100)
+    ]
+    gdb.add_stream(es)
+    assert gdb.number_of_edges() == 35
+    for i in range(35):
+        assert [e.payload for e in gdb.has_edge(i % 7, 10 + i % 5)] == [{"n": i}]
+    gdb.engine.dispose()
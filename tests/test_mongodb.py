@@ -0,0 +1,70 @@
+import pymongo
+import pytest
+
+from networkxternal.base_api import BaseAPI
+from networkxternal.mongodb import MongoDB
+from networkxternal.helpers.replicas import ReplicaRouter
+
+
+class IndexedCollection:
+    """
+    Keeps track of the indexes of a collection and rejects the `hint`s
+    of missing ones, just like MongoDB, so it can be checked without a server.
+    """
+
+    def __init__(self):
+        self.indexes = {"_id_"}
+
+    def check_hint(self, hint):
+        if hint is not None and hint not in self.indexes:
+            raise pymongo.errors.OperationFailure(
+                "hint provided does not correspond to an existing index"
+            )
+
+    def create_index(self, keys, name=None, **kwargs):
+        if name is None:
+            name = keys if isinstance(keys, str) else "_".join(k for k, _ in keys)
+            name += "_1"
+        self.indexes.add(name)
+        return name
+
+    def drop(self):
+        self.indexes = {"_id_"}
+
+    def find(self, match=None, *args, **kwargs):
+        return self
+
+    def hint(self, hint):
+        self.check_hint(hint)
+        return []
+
+    def count_documents(self, match, hint=None, **kwargs):
+        self.check_hint(hint)
+        return 0
+
+    def aggregate(self, pipeline, hint=None, **kwargs):
+        self.check_hint(hint)
+        return []
+
+
+def make_graph(**kwargs) -> MongoDB:
+    gdb = MongoDB.__new__(MongoDB)
+    BaseAPI.__init__(gdb, **kwargs)
+    gdb.edges_collection = IndexedCollection()
+    gdb.nodes_collection = IndexedCollection()
+    gdb.read_collections = list()
+    gdb.replicas = ReplicaRouter(0)
+    gdb.create_index()
+    return gdb
+
+
+@pytest.mark.parametrize("method", ["clear", "clear_edges"])
+@pytest.mark.parametrize("weighted", [True, False])
+def test_hinted_queries_after_clear(method, weighted):
+    gdb = make_graph(directed=True, weighted=weighted)
+    getattr(gdb, method)()
+    assert gdb.has_edge(1, None) == []
+    assert gdb.has_edge(None, 2) == []
+    assert gdb.has_edge(1, 2) == []
+    assert gdb.reduce_edges(1, None).count == 0
+    assert gdb.number_of_edges(1, 2) == 0
@@ -0,0 +1,119 @@
+from collections import defaultdict
+
+import pymongo
+import pytest
+
+from networkxternal.base_api import BaseAPI
+from networkxternal.mongodb_adjacency import MongoDBAdjacency
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.replicas import ReplicaRouter
+
+
+class BucketsCollection:
+    """
+    Serves the `find` queries of `MongoDBAdjacency` from in-memory buckets,
+    so the read paths can be checked without a running MongoDB.
+    Writes are recorded and optionally fail for the buckets of `failing_nodes`.
+    """
+
+    def __init__(self, buckets=(), failing_nodes=()):
+        self.buckets = list(buckets)
+        self.failing_nodes = set(failing_nodes)
+
+    def find(self, query, projection=None):
+        ns = query["node"]["$in"]
+        # Nested fields, like `out.v`, are served as the whole arrays.
+        fields = {"node", *(k.split(".")[0] for k in projection or ())}
+        return [
+            {k: v for k, v in b.items() if k in fields}
+            for b in self.buckets
+            if b["node"] in ns
+        ]
+
+    def aggregate(self, pipeline, **kwargs):
+        return []
+
+    def bulk_write(self, requests, ordered=True):
+        errors = [
+            {"index": i, "code": 121, "errmsg": "Document failed validation"}
+            for i, op in enumerate(requests)
+            if op._filter["node"] in self.failing_nodes
+        ]
+        if len(errors):
+            raise pymongo.errors.BulkWriteError({"writeErrors": errors})
+
+
+def make_graph(es, directed=True, failing_nodes=()) -> MongoDBAdjacency:
+    gdb = MongoDBAdjacency.__new__(MongoDBAdjacency)
+    BaseAPI.__init__(gdb, directed=directed)
+    buckets = defaultdict(lambda: {"out": [], "in": []})
+    for e in es:
+        buckets[e.first]["out"].append(gdb.entry_from_edge(e, e.second))
+        buckets[e.second]["in"].append(gdb.entry_from_edge(e, e.first))
+    gdb.edges_collection = BucketsCollection(
+        [dict(node=n, **b) for n, b in buckets.items()],
+        failing_nodes=failing_nodes,
+    )
+    gdb.nodes_collection = BucketsCollection()
+    gdb.read_collections = list()
+    gdb.replicas = ReplicaRouter(0)
+    return gdb
+
+
+def ids_of(es) -> list:
+    return sorted(e._id for e in es)
+
+
+def test_undirected():
+    gdb = make_graph(
+        [
+            Edge(_id=1, first=1, second=2, is_directed=False),
+            Edge(_id=2, first=2, second=3, is_directed=False),
+            Edge(_id=3, first=3, second=3, is_directed=False),
+        ],
+        directed=False,
+    )
+    assert ids_of(gdb.has_edge(1, 2)) == [1]
+    assert ids_of(gdb.has_edge(2, 1)) == [1]
+    assert ids_of(gdb.has_edge(3, 3)) == [2, 3]
+    assert ids_of(gdb.has_edge(None, 2)) == [1, 2]
+    assert gdb.reduce_edges(u=2).count == 2
+    assert gdb.reduce_edges(u=3).count == 2
+    assert gdb.reduce_edges(v=1).count == 1
+
+
+def test_directed():
+    gdb = make_graph(
+        [
+            Edge(_id=1, first=1, second=2),
+            Edge(_id=2, first=2, second=1),
+            Edge(_id=3, first=2, second=3),
+        ]
+    )
+    assert ids_of(gdb.has_edge(1, 2)) == [1]
+    assert ids_of(gdb.has_edge(2, 1)) == [2]
+    assert ids_of(gdb.has_edge(3, 2)) == []
+    assert gdb.reduce_edges(u=2).count == 2
+    assert gdb.reduce_edges(v=2).count == 1
+    assert gdb.reduce_edges(2, 2).count == 3
+
+
+def test_self_loops():
+    gdb = make_graph(
+        [
+            Edge(_id=1, first=5, second=5),
+            Edge(_id=2, first=5, second=6),
+        ]
+    )
+    assert ids_of(gdb.has_edge(5, 5)) == [1, 2]
+    assert ids_of(gdb.has_edge(5, None)) == [1, 2]
+    assert ids_of(gdb.has_edge(None, 5)) == [1]
+    assert gdb.reduce_edges(5, 5).count == 2
+    assert gdb.neighbors(5) == {6}
+
+
+@pytest.mark.parametrize("failing_nodes, expected", [((), 2), ((1,), 1), ((3, 4), 1)])
+def test_partial_writes(failing_nodes, expected):
+    gdb = make_graph([], failing_nodes=failing_nodes)
+    es = [Edge(_id=1, first=1, second=2), Edge(_id=2, first=3, second=4)]
+    assert gdb.add(es, upsert=False) == expected
@@ -0,0 +1,37 @@
+import pytest
+
+from networkxternal.base_api import BaseAPI
+from networkxternal.neo4j import Neo4J
+
+
+def make_graph(**kwargs):
+    """
+    Records the Cypher queries instead of sending them to a server.
+    """
+    gdb = Neo4J.__new__(Neo4J)
+    BaseAPI.__init__(gdb, **kwargs)
+    gdb._v, gdb._e = "vgraph", "egraph"
+    queries = list()
+
+    def read(task, **params):
+        queries.append(gdb._cypher(task))
+        return [{"c": 3, "s": 4.5}]
+
+    gdb._read = read
+    return gdb, queries
+
+
+@pytest.mark.parametrize("u, v", [(1, None), (None, 1), (1, 1), (None, None)])
+def test_counts_skip_relationships(u, v):
+    gdb, queries = make_graph(weighted=True)
+    assert gdb.number_of_edges(u, v) == 3
+    assert "COUNT {" in queries[-1] or "count(e) AS c" in queries[-1]
+    assert "sum(e.weight)" not in queries[-1]
+
+
+def test_weights_and_labels_visit_relationships():
+    gdb, queries = make_graph(weighted=True)
+    assert gdb.reduce_edges(1, None).weight == 4.5
+    assert "sum(e.weight)" in queries[-1]
+    assert gdb.number_of_edges(1, None, key=2) == 3
+    assert "e.label = $key" in queries[-1]
@@ -0,0 +1,123 @@
+import numpy as np
+
+from networkxternal.helpers.edges_batch import unpack_edges
+from networkxternal.helpers.parsing import (
+    import_graph,
+    parse_edges_block,
+    yield_edges_from_csv,
+    yield_edges_batches_from_csv,
+    yield_edges_batches_from_mtx,
+)
+
+from conftest import edges_of
+
+
+def write_csv(path, rows, header="first,second,weight") -> str:
+    path.write_text("\n".join([header, *rows]) + "\n")
+    return str(path)
+
+
+def as_tuples(es) -> list:
+    return [(e._id, e.first, e.second, e.weight, e.is_directed) for e in es]
+
+
+def test_csv_batches_match_rows(tmp_path):
+    rows = [f"{i % 17},{(i * 7) % 23},{i / 8}" for i in range(1000)]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    expected = as_tuples(yield_edges_from_csv(path))
+    # Small blocks make sure, that IDs continue across them.
+    batches = yield_edges_batches_from_csv(path, batch_size=64, block_size=512)
+    assert as_tuples(unpack_edges(batches)) == expected
+
+
+def test_csv_batches_with_missing_weights(tmp_path):
+    path = write_csv(tmp_path / "edges.csv", ["1,2,0.5", "3,4,", "5,6", "7"])
+    batches = list(yield_edges_batches_from_csv(path))
+    assert as_tuples(unpack_edges(batches)) == [
+        (0, 1, 2, 0.5, True),
+        (1, 3, 4, 1.0, True),
+        (2, 5, 6, 1.0, True),
+    ]
+
+
+def test_big_ids_are_exact():
+    big = 2**53 + 1
+    table = parse_edges_block(f"{big},{big + 2},0.25\n1,{2**62},1".encode())
+    assert table["first"].tolist() == [big, 1]
+    assert table["second"].tolist() == [big + 2, 2**62]
+    assert table["weight"].tolist() == [0.25, 1.0]
+    assert table["first"].dtype == np.int64
+
+
+def test_whitespace_separated_block():
+    table = parse_edges_block(b"1 2 3 99\n% comment\n4\t5 6 1", delimiter=None)
+    assert table.tolist() == [(1, 2, 3.0, 0), (4, 5, 6.0, 2)]
+
+
+def test_skipped_lines_keep_their_ids(tmp_path):
+    rows = ["1,2,1", "", "3,4,2", "5", "6,7,3"] * 300 + ["8,9,4", ""]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    expected = as_tuples(yield_edges_from_csv(path))
+    assert [e[0] for e in expected[:4]] == [0, 2, 4, 5]
+    for processes in (1, 2):
+        batches = yield_edges_batches_from_csv(
+            path, batch_size=64, block_size=256, processes=processes
+        )
+        assert as_tuples(unpack_edges(batches)) == expected
+
+
+def test_weights_without_header_column(tmp_path):
+    path = write_csv(tmp_path / "edges.csv", ["1,2,0.5", "3,4,1.5"], header="a,b")
+    batches = yield_edges_batches_from_csv(path)
+    assert [e.weight for e in unpack_edges(batches)] == [0.5, 1.5]
+    table = parse_edges_block(b"1,2\n3,4,0.5\n5,6")
+    assert table["weight"].tolist() == [1.0, 0.5, 1.0]
+
+
+def test_parallel_csv_matches_sequential(tmp_path):
+    rows = [f"{i % 101},{(i * 13) % 97},{i % 5}" for i in range(20_000)]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    expected = as_tuples(unpack_edges(yield_edges_batches_from_csv(path)))
+    batches = yield_edges_batches_from_csv(path, block_size=4096, processes=3)
+    assert as_tuples(unpack_edges(batches)) == expected
+
+
+def test_parallel_import_into_sqlite(tmp_path, sqlite_graph):
+    rows = [f"{i},{i + 1},{i % 3 + 1}" for i in range(5000)]
+    path = write_csv(tmp_path / "edges.csv", rows)
+    import_graph(sqlite_graph, path, processes=2)
+    assert edges_of(sqlite_graph) == [
+        (i, i, i + 1, float(i % 3 + 1)) for i in range(5000)
+    ]
+
+
+def test_mtx_header_and_size_line(tmp_path):
+    path = tmp_path / "graph.mtx"
+    path.write_text(
+        "%%MatrixMarket matrix coordinate real symmetric\n"
+        "% comment\n"
+        "3 3 3\n"
+        "1 2 0.5\n"
+        "2 3 1.5\n"
+        "3 3 2\n"
+    )
+    batches = list(yield_edges_batches_from_mtx(str(path), block_size=8))
+    assert all(not b.is_directed for b in batches)
+    assert as_tuples(unpack_edges(batches)) == [
+        (0, 1, 2, 0.5, False),
+        (1, 2, 3, 1.5, False),
+        (2, 3, 3, 2.0, False),
+    ]
+
+
+def test_unweighted_edges_with_timestamps(tmp_path, sqlite_graph):
+    path = tmp_path / "graph.edges"
+    path.write_text(
+        "% directed unweighted\n"
+        "% 4 4\n"
+        "1 2 7 1600000000\n"
+        "2 3 7 1600000001\n"
+        "3 1 7 1600000002\n"
+    )
+    import_graph(sqlite_graph, str(path))
+    assert edges_of(sqlite_graph) == [(0, 1, 2, 1.0), (1, 2, 3, 1.0), (2, 3, 1, 1.0)]
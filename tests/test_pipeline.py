@@ -0,0 +1,105 @@
+import threading
+
+import numpy as np
+import pytest
+
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.edges_batch import EdgesBatch
+from networkxternal.helpers.pipeline import ImportPipeline
+
+from conftest import edges_of
+
+
+class RecordingGraph:
+    """
+    Collects the written chunks in memory, optionally failing on the `fail_on` call.
+    """
+
+    __max_batch_size__ = 100
+
+    def __init__(self, fail_on=-1):
+        self.chunks = list()
+        self.lock = threading.Lock()
+        self.fail_on = fail_on
+
+    def record(self, ids: list) -> int:
+        with self.lock:
+            if len(self.chunks) == self.fail_on:
+                raise RuntimeError("write failed")
+            self.chunks.append(ids)
+        return len(ids)
+
+    def add(self, es, upsert=True) -> int:
+        return self.record([e._id for e in es])
+
+    def add_batch(self, batch, upsert=True) -> int:
+        return self.record(batch.ids.tolist())
+
+
+def mixed_stream(count_parts=20, consumed=None):
+    """
+    Alternates groups of individual `Edge`s with `EdgesBatch`es of consecutive IDs.
+    """
+    next_id = 0
+    for part in range(count_parts):
+        if consumed is not None:
+            consumed.append(part)
+        if part % 2:
+            ids = np.arange(next_id, next_id + 250)
+            yield EdgesBatch(ids=ids, first=ids, second=ids + 1, weight=np.ones(250))
+            next_id += 250
+        else:
+            for i in range(next_id, next_id + 150):
+                yield Edge(_id=i, first=i, second=i + 1)
+            next_id += 150
+
+
+def test_order_and_counts():
+    gdb = RecordingGraph()
+    pipeline = ImportPipeline(gdb, writers=1)
+    assert pipeline.run(mixed_stream()) == 4000
+    # A single writer receives the chunks in the order of the stream.
+    ids = [i for chunk in gdb.chunks for i in chunk]
+    assert ids == list(range(4000))
+    assert all(len(c) <= 250 for c in gdb.chunks)
+    reader, builder, writer = pipeline.stats.stages
+    assert reader.count_edges == builder.count_edges == writer.count_edges == 4000
+
+
+def test_concurrent_writers():
+    gdb = RecordingGraph()
+    pipeline = ImportPipeline(gdb, writers=4, queue_size=2)
+    assert pipeline.run(mixed_stream()) == 4000
+    assert sorted(i for chunk in gdb.chunks for i in chunk) == list(range(4000))
+    assert sum(s.count_edges for s in pipeline.stats.stages[2:]) == 4000
+
+
+@pytest.mark.parametrize("writers", [1, 3])
+def test_writer_failure_stops_the_pipeline(writers):
+    threads_before = threading.active_count()
+    consumed = list()
+    gdb = RecordingGraph(fail_on=3)
+    with pytest.raises(RuntimeError, match="write failed"):
+        ImportPipeline(gdb, writers=writers, queue_size=2).run(
+            mixed_stream(count_parts=1000, consumed=consumed)
+        )
+    assert threading.active_count() == threads_before
+    # The reader stops pulling from the stream soon after the failure.
+    assert len(consumed) < 1000
+
+
+def test_reader_failure_is_raised():
+    def broken_stream():
+        yield from mixed_stream(count_parts=3)
+        raise ValueError("corrupt input")
+
+    gdb = RecordingGraph()
+    with pytest.raises(ValueError, match="corrupt input"):
+        ImportPipeline(gdb, writers=2).run(broken_stream())
+
+
+def test_pipelined_import_into_sqlite(sqlite_graph):
+    count = sqlite_graph.add_stream_pipelined(mixed_stream(), writers=4)
+    assert count == 4000
+    assert edges_of(sqlite_graph) == [(i, i, i + 1, 1.0) for i in range(4000)]
+    assert sqlite_graph.last_import_stats.count_edges == 4000
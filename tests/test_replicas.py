@@ -0,0 +1,91 @@
+import shutil
+import sqlite3
+import threading
+
+from networkxternal.sqlite import SQLite
+from networkxternal.helpers.edge import Edge
+from networkxternal.helpers.replicas import ReplicaRouter
+
+
+def test_round_robin():
+    router = ReplicaRouter(3)
+    assert [router.pick() for _ in range(4)] == [0, 1, 2, 0]
+    assert ReplicaRouter(0).pick() is None
+
+
+def test_latency():
+    router = ReplicaRouter(3, policy="latency")
+    router.report(0, 0.5)
+    router.report(2, 0.1)
+    # The replica, that was never measured, goes first.
+    assert router.pick() == 1
+    router.report(1, 0.3)
+    assert router.pick() == 2
+    for _ in range(20):
+        router.report(2, 1.0)
+    assert router.pick() == 1
+
+
+def test_sticky_and_pinned_reads():
+    router = ReplicaRouter(2, sticky_seconds=60)
+    assert router.pick() is not None
+    with router.pinned():
+        with router.pinned():
+            assert router.pick() is None
+        assert router.pick() is None
+    assert router.pick() is not None
+
+    router.mark_write()
+    assert router.pick() is None
+    # Other threads haven't written, so they keep reading from the replicas.
+    picked = list()
+    thread = threading.Thread(target=lambda: picked.append(router.pick()))
+    thread.start()
+    thread.join()
+    assert picked[0] is not None
+
+
+def count_rows(path) -> int:
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM main_edges").fetchone()[0]
+
+
+def add_rows(path, count: int):
+    with sqlite3.connect(path) as connection:
+        connection.executemany(
+            "INSERT INTO main_edges (_id, first, second, is_directed, weight, label) "
+            "VALUES (?, ?, ?, 1, 1, -1)",
+            [(1000 + i, 1000 + i, 2000 + i) for i in range(count)],
+        )
+
+
+def test_sqlite_file_replicas(tmp_path):
+    primary = tmp_path / "primary.db"
+    gdb = SQLite(url=f"sqlite:///{primary}")
+    gdb.add([Edge(_id=i, first=i, second=i + 1) for i in range(10)])
+    gdb.engine.dispose()
+    gdb.connection.close()
+
+    # Every replica has a different number of edges, so it's clear which one is read.
+    paths = [tmp_path / "replica0.db", tmp_path / "replica1.db"]
+    for extra, path in enumerate(paths, start=1):
+        shutil.copy(primary, path)
+        add_rows(path, extra)
+    gdb = SQLite(
+        url=f"sqlite:///{primary}",
+        read_urls=[f"sqlite:///{p}" for p in paths],
+    )
+    assert [gdb.number_of_edges() for _ in range(4)] == [11, 12, 11, 12]
+    assert {len(gdb.edges) for _ in range(2)} == {11, 12}
+    with gdb.replicas.pinned():
+        assert gdb.number_of_edges() == 10
+        assert len(gdb.edges) == 10
+
+    gdb.add(Edge(_id=100, first=100, second=101))
+    gdb.remove(Edge(_id=0, first=0, second=1))
+    assert [count_rows(p) for p in paths] == [11, 12]
+    with gdb.replicas.pinned():
+        assert gdb.number_of_edges() == 10
+        assert gdb.has_edge(100, 101)[0]._id == 100
+    for engine in [gdb.engine, *gdb.read_engines]:
+        engine.dispose()
@@ -0,0 +1,90 @@
+import sqlite3
+import threading
+
+import pytest
+
+from networkxternal.sqlite import SQLite
+from networkxternal.helpers.edge import Edge
+
+from conftest import edges_of
+
+
+def test_conflicting_inserts_fail_the_batch(sqlite_graph):
+    sqlite_graph.add(Edge(_id=1, first=1, second=2, weight=1))
+    with pytest.raises(sqlite3.IntegrityError):
+        sqlite_graph.add(
+            [
+                Edge(_id=2, first=2, second=3, weight=1),
+                Edge(_id=1, first=5, second=6, weight=1),
+            ],
+            upsert=False,
+        )
+    assert edges_of(sqlite_graph) == [(1, 1, 2, 1.0)]
+
+
+def test_repeated_ids_in_a_batch(sqlite_graph):
+    es = [Edge(_id=1, first=1, second=2, weight=w) for w in (1, 2, 3)]
+    assert sqlite_graph.add(es, upsert=False) == 1
+    assert sqlite_graph.add(es[:2]) == 1
+    assert edges_of(sqlite_graph) == [(1, 1, 2, 2.0)]
+
+
+def test_pool_sizes_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        SQLite(url=f"sqlite:///{tmp_path / 'graph.db'}", pool_size=4)
+    gdb = SQLite(url=f"sqlite:///{tmp_path / 'graph.db'}", pool_recycle=60)
+    assert gdb.engine.pool._recycle == 60
+
+
+def test_reads_during_writes(sqlite_graph):
+    errors = list()
+
+    def read():
+        try:
+            for _ in range(200):
+                sqlite_graph.reduce_edges(1, None)
+                sqlite_graph.neighbors(1)
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(4)]
+    for t in readers:
+        t.start()
+    for i in range(200):
+        sqlite_graph.add(Edge(_id=i, first=1, second=i + 2))
+    for t in readers:
+        t.join()
+    assert errors == []
+    assert sqlite_graph.reduce_edges(1, None).count == 200
+
+
+def test_sessions_during_writes(tmp_path):
+    gdb = SQLite(url=f"sqlite:///{tmp_path / 'graph.db'}", readers=2)
+    errors = list()
+    done = threading.Event()
+
+    def read():
+        try:
+            while not done.is_set():
+                gdb.has_node(1)
+                gdb.number_of_nodes()
+                gdb.reduce_nodes()
+                gdb.remove_node(-5)
+                gdb.nodes
+        except Exception as e:
+            errors.append(e)
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for t in readers:
+        t.start()
+    count = 0
+    for i in range(0, 20_000, 500):
+        count += gdb.add(
+            [Edge(_id=j, first=j, second=j + 1) for j in range(i, i + 500)]
+        )
+    done.set()
+    for t in readers:
+        t.join()
+    assert errors == []
+    assert count == gdb.number_of_edges() == 20_000
+    gdb.engine.dispose()